@@ -5,6 +5,14 @@ resource "aws_s3_bucket" "bucket" {
   # conflicts.
   bucket = "${var.bucket_name}"
   acl    = "private"
+
+  # Clean up multipart uploads abandoned by harvesters streaming tweet files to S3.
+  lifecycle_rule {
+    id      = "abort-incomplete-multipart-uploads"
+    enabled = true
+
+    abort_incomplete_multipart_upload_days = 1
+  }
 }
 
 resource "aws_s3_bucket_public_access_block" "bucket" {
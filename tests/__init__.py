@@ -1,6 +1,12 @@
 import unittest
 import logging
+import gzip
+import json
+import os
+import boto3
 from twarccloud.collection_config import CollectionConfig
+from twarccloud.filepaths_helper import get_harvest_path
+from twarccloud.tweet_stats import TweetStats, get_stats_filepath
 
 
 class TestCase(unittest.TestCase):
@@ -73,3 +79,38 @@ def search_config():
             }
         })
     return config
+
+
+# Creates the test bucket in an S3 mocked by moto. Returns an S3 client.
+def create_test_bucket():
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+    client = boto3.client('s3')
+    client.create_bucket(Bucket='test-bucket')
+    return client
+
+
+# Uploads the files of a local collections path to the test bucket.
+def upload_collections(client, collections_path):
+    for path, _, filenames in os.walk(collections_path):
+        for filename in filenames:
+            filepath = os.path.join(path, filename)
+            client.upload_file(filepath, 'test-bucket',
+                               'collections/{}'.format(os.path.relpath(filepath, collections_path)))
+
+
+# Writes a harvest's tweet file and, if stats, its stats sidecar. Returns the filepath.
+def write_tweet_file(collection_id, harvest_timestamp, tweets, collections_path, stats=True):
+    harvest_path = get_harvest_path(collection_id, harvest_timestamp, collections_path=collections_path)
+    os.makedirs(harvest_path)
+    filepath = '{}/tweets-{}.jsonl.gz'.format(harvest_path, harvest_timestamp.strftime('%Y%m%d%H%M%S'))
+    tweet_stats = TweetStats()
+    with gzip.open(filepath, 'wb') as file:
+        for tweet in tweets:
+            file.write('{}\n'.format(json.dumps(tweet)).encode('utf-8'))
+            tweet_stats.add(tweet)
+    if stats:
+        with open(get_stats_filepath(filepath), 'w') as file:
+            json.dump(tweet_stats.to_dict(), file)
+    return filepath
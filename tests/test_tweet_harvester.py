@@ -1,4 +1,5 @@
 from tempfile import mkdtemp
+from datetime import datetime, timedelta
 import shutil
 import json
 import os
@@ -9,7 +10,9 @@ from threading import Timer
 import requests
 from tweet_harvester import TweetHarvester
 from twarccloud.harvester.twarc_thread import TwarcThread
-from twarccloud.filepaths_helper import get_collection_config_filepath, get_harvest_file, get_changesets_path
+from twarccloud.harvester.collection_lock import LockedException
+from twarccloud.filepaths_helper import get_collection_config_filepath, get_harvest_file, get_changesets_path, \
+    get_lock_file, get_harvest_checkpoint_filepath, get_last_harvest_file
 from tests import TestCase, timeline_config
 
 
@@ -31,7 +34,7 @@ class TestTweetHarvester(TestCase):
 
         harvester = TweetHarvester(self.collection_id, self.collections_path, shutdown=True, port=self.find_free_port())
         # Make a change to changeset
-        harvester.changeset.update_user('screen_name', 'real_justin_littman', '481186914')
+        harvester.collection_harvests[0].changeset.update_user('screen_name', 'real_justin_littman', '481186914')
         harvester.harvest()
 
         # Test collection config written to harvest
@@ -52,6 +55,24 @@ class TestTweetHarvester(TestCase):
         self.assertTrue(harvester.stopped_event.is_set())
         self.assertTrue(harvester.shutdown_event.is_set())
 
+    @patch('tweet_harvester.compact_harvest')
+    @patch('tweet_harvester.TwarcThread')
+    def test_harvest_compact(self, mock_twarc_thread_class, mock_compact_harvest):
+        mock_twarc_thread_class.return_value = MagicMock(TwarcThread, exception=None)
+        lock_filepath = get_lock_file(self.collection_id, collections_path=self.collections_path)
+        last_harvest_filepath = get_last_harvest_file(self.collection_id, collections_path=self.collections_path)
+        locked = []
+        mock_compact_harvest.side_effect = lambda *_, **__: locked.append(
+            os.path.exists(lock_filepath) and not os.path.exists(last_harvest_filepath)) or 0
+
+        harvester = TweetHarvester(self.collection_id, self.collections_path, shutdown=True, port=self.find_free_port(),
+                                   compact_bytes=1024)
+        harvester.harvest()
+
+        # Compacted while still locked.
+        self.assertEqual([True], locked)
+        self.assertTrue(os.path.exists(last_harvest_filepath))
+
     @patch('tweet_harvester.TwarcThread')
     def test_harvest_exception(self, mock_twarc_thread_class):
         mock_twarc_thread = MagicMock(TwarcThread, exception=Exception('Darn'))
@@ -84,9 +105,79 @@ class TestTweetHarvester(TestCase):
         self.assertTrue(harvester.stopped_event.is_set())
         self.assertTrue(harvester.shutdown_event.is_set())
 
-    def write_collection_config(self):
-        os.makedirs(os.path.dirname(self.collection_config_filepath))
-        with open(self.collection_config_filepath, 'w') as file:
+    @patch('tweet_harvester.TwarcThread')
+    def test_resume_stale_lock(self, mock_twarc_thread_class):
+        mock_twarc_thread = MagicMock(TwarcThread, exception=None)
+        mock_twarc_thread_class.return_value = mock_twarc_thread
+        stale_harvest_timestamp = datetime.utcnow() - timedelta(hours=1)
+        self.write_lock(stale_harvest_timestamp, datetime.utcnow() - timedelta(minutes=30))
+        checkpoint = {
+            'checkpoint_timestamp': (datetime.utcnow() - timedelta(minutes=30)).isoformat(),
+            'changeset': {
+                'update': {'users': {'12': {'since_id': '23456'}}},
+                'delete': [],
+                'change_timestamp': (datetime.utcnow() - timedelta(minutes=30)).isoformat()
+            },
+            'done_user_ids': ['12']
+        }
+        checkpoint_filepath = get_harvest_checkpoint_filepath(self.collection_id, stale_harvest_timestamp,
+                                                              collections_path=self.collections_path)
+        os.makedirs(os.path.dirname(checkpoint_filepath))
+        with open(checkpoint_filepath, 'w') as file:
+            json.dump(checkpoint, file)
+
+        harvester = TweetHarvester(self.collection_id, self.collections_path, shutdown=True, port=self.find_free_port())
+        harvester.harvest()
+
+        # Harvests with the checkpoint's changes and resumes from it.
+        harvest_config, *_ = mock_twarc_thread_class.call_args[0]
+        self.assertEqual('23456', harvest_config['users']['12']['since_id'])
+        self.assertEqual(['12'], mock_twarc_thread_class.call_args[1]['resume']['done_user_ids'])
+        # The checkpoint's changes are kept.
+        collection_config = self.load_collection_config(self.collection_config_filepath)
+        self.assertEqual('23456', collection_config['users']['12']['since_id'])
+
+    @patch('tweet_harvester.TwarcThread')
+    def test_harvest_several(self, mock_twarc_thread_class):
+        mock_twarc_thread_class.return_value = MagicMock(TwarcThread, exception=None)
+        other_collection_id = 'other_test_id'
+        self.write_collection_config(other_collection_id)
+        locked_collection_id = 'locked_test_id'
+        self.write_collection_config(locked_collection_id)
+        self.write_lock(datetime.utcnow(), datetime.utcnow(), collection_id=locked_collection_id)
+
+        harvester = TweetHarvester([self.collection_id, other_collection_id, locked_collection_id],
+                                   self.collections_path, shutdown=True, port=self.find_free_port())
+        harvester.harvest()
+
+        # Each collection that is not locked is harvested with its own changeset.
+        self.assertEqual(2, mock_twarc_thread_class.call_count)
+        changesets = [call[0][4] for call in mock_twarc_thread_class.call_args_list]
+        self.assertIsNot(changesets[0], changesets[1])
+        for collection_id in (self.collection_id, other_collection_id):
+            self.assertTrue(os.path.exists(get_harvest_file(collection_id, harvester.harvest_timestamp,
+                                                            'collection.json', collections_path=self.collections_path)))
+            self.assertFalse(os.path.exists(get_lock_file(collection_id, collections_path=self.collections_path)))
+        self.assertFalse(os.path.exists(get_harvest_file(locked_collection_id, harvester.harvest_timestamp,
+                                                         'collection.json', collections_path=self.collections_path)))
+        self.assertTrue(os.path.exists(get_lock_file(locked_collection_id, collections_path=self.collections_path)))
+
+    def test_locked(self):
+        self.write_lock(datetime.utcnow(), datetime.utcnow())
+        harvester = TweetHarvester(self.collection_id, self.collections_path, shutdown=True, port=self.find_free_port())
+        with self.assertRaises(LockedException):
+            harvester.harvest()
+
+    def write_lock(self, harvest_timestamp, heartbeat, collection_id=None):
+        with open(get_lock_file(collection_id or self.collection_id, collections_path=self.collections_path),
+                  'w') as file:
+            json.dump({'harvest_id': harvest_timestamp.isoformat(), 'heartbeat': heartbeat.isoformat()}, file)
+
+    def write_collection_config(self, collection_id=None):
+        collection_config_filepath = get_collection_config_filepath(collection_id or self.collection_id,
+                                                                    collections_path=self.collections_path)
+        os.makedirs(os.path.dirname(collection_config_filepath))
+        with open(collection_config_filepath, 'w') as file:
             json.dump(timeline_config(), file)
 
     @staticmethod
@@ -0,0 +1,35 @@
+import os
+import boto3
+try:
+    from moto import mock_aws
+except ImportError:
+    from moto import mock_ecs as mock_aws
+from twarccloud.aws.ecs import register_task_definition
+from twarccloud.config_helpers import AwsConfiguration
+from tests import TestCase
+
+
+@mock_aws
+class TestRegisterTaskDefinition(TestCase):
+    def setUp(self):
+        os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+        os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+        os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+        boto3.client('ecs').create_cluster(clusterName='test-cluster')
+        self.aws_config = AwsConfiguration('test-cluster', 'arn:aws:iam::123456789012:role/task',
+                                           'arn:aws:iam::123456789012:role/execution', None, None, None,
+                                           'test-log-group', None, 'latest')
+
+    def test_skip_if_exists(self):
+        command = ['aws', 'harvester', 'test-bucket', 'foo', 'bar']
+        arn = register_task_definition('test-family', [], command, self.aws_config)
+        self.assertEqual(arn, register_task_definition('test-family', [], command, self.aws_config))
+
+    def test_new_revision_for_new_command(self):
+        arn = register_task_definition('test-family', [], ['aws', 'harvester', 'test-bucket', 'foo'],
+                                       self.aws_config)
+        # E.g., a collection added to a group.
+        new_arn = register_task_definition('test-family', [], ['aws', 'harvester', 'test-bucket', 'foo', 'bar'],
+                                           self.aws_config)
+        self.assertNotEqual(arn, new_arn)
+        self.assertTrue(new_arn.endswith(':2'))
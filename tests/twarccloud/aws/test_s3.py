@@ -0,0 +1,82 @@
+from tempfile import mkdtemp
+from datetime import datetime
+import json
+import os
+import shutil
+import boto3
+try:
+    from moto import mock_aws
+except ImportError:
+    from moto import mock_s3 as mock_aws
+from twarccloud.aws.s3 import download_all, SYNC_STATE_FILENAME
+from twarccloud.filepaths_helper import get_harvest_prefixes
+from tests import TestCase
+
+
+@mock_aws
+class TestDownloadAll(TestCase):
+    def setUp(self):
+        os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+        os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+        os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+        self.bucket = 'test-bucket'
+        self.client = boto3.client('s3')
+        self.client.create_bucket(Bucket=self.bucket)
+        self.local_path = mkdtemp()
+        self.put('collections/test_id/collection.json', b'{}')
+        self.put('collections/test_id/harvests/2019/03/09/15/35/07/tweets-20190309153508.jsonl.gz', b'tweets1')
+        self.put('collections/test_id/harvests/2019/04/01/10/00/00/tweets-20190401100001.jsonl.gz', b'tweets2')
+        self.put('collections/other_id/collection.json', b'{}')
+
+    def tearDown(self):
+        shutil.rmtree(self.local_path, ignore_errors=True)
+
+    def put(self, key, body):
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=body)
+
+    def test_download_all(self):
+        stats = download_all(self.bucket, 'collections/test_id', self.local_path, workers=2)
+        self.assertEqual(3, stats.files)
+        self.assertEqual(0, stats.skipped)
+        self.assertEqual(16, stats.bytes)
+        with open(os.path.join(self.local_path, 'harvests/2019/03/09/15/35/07/tweets-20190309153508.jsonl.gz'),
+                  'rb') as file:
+            self.assertEqual(b'tweets1', file.read())
+        with open(os.path.join(self.local_path, SYNC_STATE_FILENAME)) as file:
+            sync_state = json.load(file)
+        self.assertEqual({'collection.json', 'harvests/2019/03/09/15/35/07/tweets-20190309153508.jsonl.gz',
+                          'harvests/2019/04/01/10/00/00/tweets-20190401100001.jsonl.gz'}, set(sync_state.keys()))
+
+    def test_download_changed(self):
+        download_all(self.bucket, 'collections/test_id', self.local_path)
+        # Same size, different content.
+        self.put('collections/test_id/collection.json', b'[]')
+        stats = download_all(self.bucket, 'collections/test_id', self.local_path)
+        self.assertEqual(1, stats.files)
+        self.assertEqual(2, stats.skipped)
+        with open(os.path.join(self.local_path, 'collection.json'), 'rb') as file:
+            self.assertEqual(b'[]', file.read())
+
+    def test_download_missing(self):
+        download_all(self.bucket, 'collections/test_id', self.local_path)
+        os.remove(os.path.join(self.local_path, 'collection.json'))
+        stats = download_all(self.bucket, 'collections/test_id', self.local_path)
+        self.assertEqual(1, stats.files)
+
+    def test_include_exclude(self):
+        stats = download_all(self.bucket, 'collections/test_id', self.local_path, include=['harvests/2019/*'],
+                             exclude=['harvests/2019/04/*'])
+        self.assertEqual(1, stats.files)
+        self.assertTrue(os.path.exists(os.path.join(
+            self.local_path, 'harvests/2019/03/09/15/35/07/tweets-20190309153508.jsonl.gz')))
+        self.assertFalse(os.path.exists(os.path.join(self.local_path, 'collection.json')))
+
+    def test_download_prefixes(self):
+        stats = download_all(self.bucket, 'collections/test_id', self.local_path,
+                             prefixes=get_harvest_prefixes('test_id', datetime(2019, 3, 9, 15, 35, 7),
+                                                           datetime(2019, 4, 1)))
+        # Top-level files and harvest in range.
+        self.assertEqual(2, stats.files)
+        self.assertTrue(os.path.exists(os.path.join(self.local_path, 'collection.json')))
+        self.assertTrue(os.path.exists(os.path.join(
+            self.local_path, 'harvests/2019/03/09/15/35/07/tweets-20190309153508.jsonl.gz')))
@@ -1,10 +1,12 @@
 from tempfile import mkdtemp
 import shutil
-from datetime import datetime
+from datetime import datetime, timedelta
 from queue import Queue
+from time import sleep
+import json
 import os
 from twarccloud.harvester.collection_lock import CollectionLock, AddFile, DeleteFile, is_locked, assert_locked, \
-    LockedException
+    LockedException, is_stale, read_lock
 from twarccloud.filepaths_helper import get_lock_file, get_last_harvest_file
 from tests import TestCase
 
@@ -42,6 +44,36 @@ class TestCollectionLock(TestCase):
         self.assertFalse(is_locked(self.lock_file))
         assert_locked(self.lock_file)
 
+    def test_heartbeat(self):
+        with CollectionLock(self.collections_path, self.collection_id, self.file_queue,
+                            harvest_timestamp=self.timestamp, heartbeat_secs=.2):
+            heartbeat = read_lock(self.lock_file)['heartbeat']
+            sleep(.5)
+            self.assertLess(heartbeat, read_lock(self.lock_file)['heartbeat'])
+            self.assertQueuedFile(self.lock_file)
+            self.assertQueuedFile(self.lock_file)
+        self.assertEqual(self.timestamp.isoformat(), read_lock(self.last_harvest_file)['harvest_id'])
+
+    def test_no_heartbeat(self):
+        # Without heartbeats, the lock is never refreshed, so it must never look stale.
+        with CollectionLock(self.collections_path, self.collection_id, self.file_queue,
+                            harvest_timestamp=self.timestamp):
+            self.assertNotIn('heartbeat', read_lock(self.lock_file))
+            self.assertFalse(is_stale(self.lock_file, 0))
+
+    def test_is_stale(self):
+        with CollectionLock(self.collections_path, self.collection_id, self.file_queue,
+                            harvest_timestamp=self.timestamp):
+            self.assertFalse(is_stale(self.lock_file, 60))
+            with open(self.lock_file, 'w') as file:
+                json.dump({'harvest_id': self.timestamp.isoformat(),
+                           'heartbeat': (datetime.utcnow() - timedelta(seconds=120)).isoformat()}, file)
+            self.assertTrue(is_stale(self.lock_file, 60))
+            # A lock without a heartbeat is never stale.
+            with open(self.lock_file, 'w') as file:
+                json.dump({'harvest_id': self.timestamp.isoformat()}, file)
+            self.assertFalse(is_stale(self.lock_file, 60))
+
     # pylint: disable=invalid-name
     def assertQueuedFile(self, filepath, is_add=True):
         queued_file = self.file_queue.get()
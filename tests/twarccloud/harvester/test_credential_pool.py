@@ -0,0 +1,70 @@
+from unittest.mock import patch, MagicMock
+from time import time
+import requests
+from twarccloud.harvester.credential_pool import CredentialPoolClient, create_credentials
+from twarccloud.harvester.twarc_client import TwarcClient
+from tests import TestCase
+
+URL = 'https://api.twitter.com/1.1/statuses/user_timeline.json'
+
+
+class TestCredentialPoolClient(TestCase):
+    def setUp(self):
+        self.credentials = create_credentials([self.keys(1), self.keys(2)])
+        self.twarc = CredentialPoolClient(self.credentials, validate_keys=False)
+
+    @patch.object(TwarcClient, 'get', autospec=True)
+    def test_spread(self, mock_get):
+        # The first credential has fewer requests remaining.
+        self.credentials[0].rate_limiter.update(URL, self.headers(10))
+        self.credentials[1].rate_limiter.update(URL, self.headers(100))
+        self.twarc.get(URL, params={})
+        self.assertEqual('access_token2', mock_get.call_args[0][0].access_token)
+        # The second credential is used up.
+        self.credentials[1].rate_limiter.update(URL, self.headers(0))
+        self.twarc.get(URL, params={})
+        self.assertEqual('access_token1', mock_get.call_args[0][0].access_token)
+        # Clients are reused.
+        self.assertEqual(2, len(self.twarc.clients))
+
+    @patch.object(TwarcClient, 'get', autospec=True)
+    def test_revoked(self, mock_get):
+        self.credentials[0].rate_limiter.update(URL, self.headers(10))
+        self.credentials[1].rate_limiter.update(URL, self.headers(100))
+        mock_get.side_effect = [self.http_error(401, 89), MagicMock()]
+        self.twarc.get(URL, params={})
+        self.assertTrue(self.credentials[1].revoked)
+        self.assertEqual('access_token1', mock_get.call_args[0][0].access_token)
+        # No more credentials.
+        mock_get.side_effect = [self.http_error(401, 32)]
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self.twarc.get(URL, params={})
+        self.assertTrue(self.credentials[0].revoked)
+
+    @patch.object(TwarcClient, 'get', autospec=True)
+    def test_not_revoked(self, mock_get):
+        # E.g., a protected timeline.
+        mock_get.side_effect = [self.http_error(401, None)]
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self.twarc.get(URL, params={})
+        self.assertFalse(self.credentials[0].revoked)
+        self.assertFalse(self.credentials[1].revoked)
+
+    @staticmethod
+    def keys(count):
+        return {
+            'consumer_key': 'consumer_key',
+            'consumer_secret': 'consumer_secret',
+            'access_token': 'access_token{}'.format(count),
+            'access_token_secret': 'access_token_secret'
+        }
+
+    @staticmethod
+    def headers(remaining):
+        return {'x-rate-limit-remaining': str(remaining), 'x-rate-limit-reset': str(int(time()) + 900)}
+
+    @staticmethod
+    def http_error(status_code, error_code):
+        response = MagicMock(status_code=status_code)
+        response.json.return_value = {'errors': [{'code': error_code}]} if error_code else {'request': URL}
+        return requests.exceptions.HTTPError(response=response)
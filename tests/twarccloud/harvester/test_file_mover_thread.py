@@ -1,4 +1,6 @@
 from unittest.mock import patch, MagicMock
+from threading import Event
+from time import sleep
 from tempfile import mkdtemp
 from queue import Queue
 import os
@@ -54,6 +56,19 @@ class TestS3FileMoverThread(TestCase):
         mock_aws_client.upload_file.assert_called_once_with(self.filepath, self.bucket,
                                                             get_collection_file(self.collection_id, 'test.txt'))
 
+    @patch('twarccloud.harvester.file_mover_thread.aws_client')
+    def test_move_with_sha1(self, mock_aws_client_factory):
+        mock_aws_client = MagicMock()
+        mock_aws_client_factory.return_value = mock_aws_client
+        with S3FileMoverThread(self.file_queue, self.collections_path, self.bucket):
+            os.makedirs(os.path.dirname(self.filepath))
+            with open(self.filepath, 'w') as file:
+                file.write('test')
+            self.file_queue.put(AddFile(self.filepath, True, sha1='a94a8fe5ccb19ba61c4c0873d391e987982fbbd3'))
+        mock_aws_client.upload_file.assert_called_once_with(
+            self.filepath, self.bucket, get_collection_file(self.collection_id, 'test.txt'),
+            ExtraArgs={'Metadata': {'sha1': 'a94a8fe5ccb19ba61c4c0873d391e987982fbbd3'}})
+
     @patch('twarccloud.harvester.file_mover_thread.aws_client')
     def test_delete(self, mock_aws_client_factory):
         mock_aws_client = MagicMock()
@@ -63,3 +78,156 @@ class TestS3FileMoverThread(TestCase):
         self.assertTrue(self.file_queue.empty())
         mock_aws_client.delete_object.assert_called_once_with(Bucket=self.bucket,
                                                               Key=get_collection_file(self.collection_id, 'test.txt'))
+
+    def test_delete_local(self):
+        os.makedirs(os.path.dirname(self.filepath))
+        with open(self.filepath, 'w') as file:
+            file.write('test')
+        with S3FileMoverThread(self.file_queue, self.collections_path, None):
+            self.file_queue.put(DeleteFile(self.filepath))
+        self.assertFalse(os.path.exists(self.filepath))
+
+    @patch('twarccloud.harvester.file_mover_thread.aws_client')
+    def test_priority_and_coalescing(self, mock_aws_client_factory):
+        mock_aws_client = MagicMock()
+        mock_aws_client_factory.return_value = mock_aws_client
+        uploads = []
+        release_event = Event()
+
+        def upload_file(filepath, *_, **__):
+            uploads.append(os.path.basename(filepath))
+            # Hold up the first upload so that the others wait.
+            release_event.wait()
+
+        mock_aws_client.upload_file.side_effect = upload_file
+        filepaths = [self.write_file(filename) for filename in ('tweets-1.jsonl.gz', 'manifest-sha1.txt',
+                                                                  'tweets-2.jsonl.gz')]
+        with S3FileMoverThread(self.file_queue, self.collections_path, self.bucket, workers=1,
+                               debounce_secs=0) as mover:
+            self.file_queue.put(AddFile(filepaths[0], False))
+            self.file_queue.put(AddFile(filepaths[1], False))
+            self.file_queue.put(AddFile(filepaths[2], False))
+            self.file_queue.put(AddFile(filepaths[1], False))
+            while mover.pending.qsize() < 2:
+                sleep(.01)
+            release_event.set()
+        # Tweet files first, and the manifest only once.
+        self.assertEqual(['tweets-1.jsonl.gz', 'tweets-2.jsonl.gz', 'manifest-sha1.txt'], uploads)
+        self.assertTrue(self.file_queue.empty())
+
+    @patch('twarccloud.harvester.file_mover_thread.aws_client')
+    def test_queued_while_uploading(self, mock_aws_client_factory):
+        mock_aws_client = MagicMock()
+        mock_aws_client_factory.return_value = mock_aws_client
+        uploads = []
+        release_event = Event()
+
+        def upload_file(filepath, *_, **__):
+            # The file is there for every upload.
+            uploads.append(os.path.exists(filepath))
+            if len(uploads) == 1:
+                release_event.wait()
+
+        mock_aws_client.upload_file.side_effect = upload_file
+        filepath = self.write_file('users.jsonl')
+        with S3FileMoverThread(self.file_queue, self.collections_path, self.bucket, workers=2,
+                               debounce_secs=0) as mover:
+            self.file_queue.put(AddFile(filepath, True))
+            while not mover.in_flight:
+                sleep(.01)
+            self.file_queue.put(AddFile(filepath, True))
+            self.file_queue.put(AddFile(filepath, True))
+            while filepath not in mover.held:
+                sleep(.01)
+            # Not uploaded by the other worker.
+            sleep(.1)
+            self.assertEqual(1, len(uploads))
+            release_event.set()
+        # Uploaded again once after the first upload, and deleted after the last.
+        self.assertEqual([True, True], uploads)
+        self.assertFalse(os.path.exists(filepath))
+        self.assertTrue(self.file_queue.empty())
+
+    @patch('twarccloud.harvester.file_mover_thread.aws_client')
+    def test_debounce(self, mock_aws_client_factory):
+        mock_aws_client = MagicMock()
+        mock_aws_client_factory.return_value = mock_aws_client
+        filepath = self.write_file('manifest-sha1.txt')
+        with S3FileMoverThread(self.file_queue, self.collections_path, self.bucket, debounce_secs=.5):
+            self.file_queue.put(AddFile(filepath, False))
+            sleep(.1)
+            self.file_queue.put(AddFile(filepath, False))
+            sleep(.1)
+            # Still waiting
+            mock_aws_client.upload_file.assert_not_called()
+            sleep(.5)
+            mock_aws_client.upload_file.assert_called_once()
+            # Queued again after uploaded.
+            self.file_queue.put(AddFile(filepath, False))
+        # Released when stopped.
+        self.assertEqual(2, mock_aws_client.upload_file.call_count)
+
+    @patch('twarccloud.harvester.file_mover_thread.aws_client')
+    def test_barrier(self, mock_aws_client_factory):
+        mock_aws_client = MagicMock()
+        mock_aws_client_factory.return_value = mock_aws_client
+        calls = []
+
+        def upload_file(filepath, *_, **__):
+            sleep(.25)
+            calls.append(os.path.basename(filepath))
+
+        mock_aws_client.upload_file.side_effect = upload_file
+        mock_aws_client.delete_object.side_effect = lambda **kwargs: calls.append(kwargs['Key'])
+        filepaths = [self.write_file(filename) for filename in ('tweets-1.jsonl.gz', 'tweets-2.jsonl.gz')]
+        with S3FileMoverThread(self.file_queue, self.collections_path, self.bucket, workers=2):
+            self.file_queue.put(AddFile(filepaths[0], True))
+            self.file_queue.put(AddFile(filepaths[1], True))
+            self.file_queue.put(DeleteFile(get_collection_file(self.collection_id, 'lock.json',
+                                                               collections_path=self.collections_path)))
+        # The lock is deleted after the tweet files are uploaded.
+        self.assertEqual(get_collection_file(self.collection_id, 'lock.json'), calls[-1])
+        self.assertEqual(3, len(calls))
+
+    @patch('twarccloud.harvester.file_mover_thread.aws_client')
+    def test_flush(self, mock_aws_client_factory):
+        mock_aws_client = MagicMock()
+        mock_aws_client_factory.return_value = mock_aws_client
+        mock_aws_client.upload_file.side_effect = lambda *_, **__: sleep(.25)
+        filepaths = [self.write_file(filename) for filename in ('tweets-1.jsonl.gz', 'manifest-sha1.txt')]
+        with S3FileMoverThread(self.file_queue, self.collections_path, self.bucket, debounce_secs=10) as file_mover:
+            for filepath in filepaths:
+                self.file_queue.put(AddFile(filepath, False))
+            file_mover.flush()
+            # Including the debounced file.
+            self.assertEqual(2, mock_aws_client.upload_file.call_count)
+
+    @patch('twarccloud.harvester.file_mover_thread.aws_client')
+    def test_flush_exception(self, mock_aws_client_factory):
+        mock_aws_client = MagicMock()
+        mock_aws_client_factory.return_value = mock_aws_client
+        mock_aws_client.upload_file.side_effect = Exception('Upload failed')
+        filepath = self.write_file('tweets-1.jsonl.gz')
+        with self.assertRaises(Exception):
+            with S3FileMoverThread(self.file_queue, self.collections_path, self.bucket) as file_mover:
+                self.file_queue.put(AddFile(filepath, True))
+                file_mover.flush()
+
+    @patch('twarccloud.harvester.file_mover_thread.aws_client')
+    def test_upload_exception(self, mock_aws_client_factory):
+        mock_aws_client = MagicMock()
+        mock_aws_client_factory.return_value = mock_aws_client
+        mock_aws_client.upload_file.side_effect = Exception('Upload failed')
+        filepath = self.write_file('tweets-1.jsonl.gz')
+        with self.assertRaises(Exception):
+            with S3FileMoverThread(self.file_queue, self.collections_path, self.bucket):
+                self.file_queue.put(AddFile(filepath, True))
+        # Not deleted.
+        self.assertTrue(os.path.exists(filepath))
+
+    def write_file(self, filename):
+        filepath = get_collection_file(self.collection_id, filename, collections_path=self.collections_path)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with open(filepath, 'w') as file:
+            file.write('test')
+        return filepath
@@ -11,6 +11,8 @@ class TestHarvestInfo(TestCase):
         harvest_info.tweets.incr(amount=5)
         harvest_info.files.incr()
         harvest_info.file_bytes.incr(amount=2048)
+        harvest_info.batches.incr(amount=2)
+        harvest_info.batch_millis.incr(amount=30)
         harvest_info.end()
 
         harvest_dict = harvest_info.to_dict()
@@ -18,8 +20,30 @@ class TestHarvestInfo(TestCase):
         self.assertEqual(5, harvest_dict['tweets'])
         self.assertEqual(1, harvest_dict['files'])
         self.assertEqual(2048, harvest_dict['file_bytes'])
+        self.assertEqual(0, harvest_dict['queue_depth'])
+        self.assertEqual(2, harvest_dict['batches'])
+        self.assertEqual(15, harvest_dict['avg_batch_millis'])
         self.assertTrue('harvest_timestamp' in harvest_dict)
         self.assertTrue('harvest_end_timestamp' in harvest_dict)
+        self.assertFalse('shards' in harvest_dict)
+
+    def test_shards_to_dict(self):
+        harvest_info = HarvestInfo('test', datetime.utcnow())
+        shard_info = harvest_info.add_shard()
+        shard_info.tweets.incr(amount=10)
+        shard_info.duplicates.incr()
+        shard_info.disconnects.incr(amount=2)
+        harvest_info.add_shard()
+
+        shards = harvest_info.to_dict()['shards']
+        self.assertEqual(2, len(shards))
+        self.assertEqual(1, shards[0]['shard'])
+        self.assertEqual(10, shards[0]['tweets'])
+        self.assertEqual(1, shards[0]['duplicates'])
+        self.assertEqual(2, shards[0]['disconnects'])
+        self.assertTrue(shards[0]['tweets_per_sec'] > 0)
+        self.assertEqual(2, shards[1]['shard'])
+        self.assertEqual(0, shards[1]['tweets'])
 
 
 class TestAtomicInteger(TestCase):
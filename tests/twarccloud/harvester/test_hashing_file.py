@@ -0,0 +1,15 @@
+import hashlib
+import io
+from twarccloud.harvester.hashing_file import HashingFile
+from tests import TestCase
+
+
+class TestHashingFile(TestCase):
+    def test_write(self):
+        file = io.BytesIO()
+        hashing_file = HashingFile(file)
+        hashing_file.write(b'foo')
+        hashing_file.write(b'bar')
+        self.assertEqual(b'foobar', file.getvalue())
+        self.assertEqual(6, hashing_file.bytes_written)
+        self.assertEqual(hashlib.sha1(b'foobar').hexdigest(), hashing_file.hexdigest())
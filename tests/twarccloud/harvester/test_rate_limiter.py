@@ -0,0 +1,56 @@
+from threading import Event, Timer
+from time import time
+from twarccloud.harvester.rate_limiter import RateLimiter, RateLimitInterrupted
+from tests import TestCase
+
+URL = 'https://api.twitter.com/1.1/statuses/user_timeline.json'
+
+
+class TestRateLimiter(TestCase):
+    def setUp(self):
+        self.rate_limiter = RateLimiter()
+
+    def test_unknown_limit(self):
+        self.rate_limiter.acquire(URL)
+        self.assertIsNone(self.rate_limiter.remaining(URL))
+
+    def test_acquire(self):
+        self.rate_limiter.update(URL, {'x-rate-limit-remaining': '2', 'x-rate-limit-reset': str(int(time()) + 900)})
+        self.rate_limiter.acquire(URL)
+        self.assertEqual(1, self.rate_limiter.remaining(URL))
+        # A response from an earlier request doesn't give back reserved requests.
+        self.rate_limiter.update(URL, {'x-rate-limit-remaining': '2', 'x-rate-limit-reset': str(int(time()) + 900)})
+        self.assertEqual(1, self.rate_limiter.remaining(URL))
+        # Other endpoints are limited separately.
+        self.assertIsNone(self.rate_limiter.remaining('https://api.twitter.com/1.1/users/lookup.json?user_id=1'))
+
+    def test_wait_for_reset(self):
+        self.rate_limiter.update(URL, {'x-rate-limit-remaining': '0', 'x-rate-limit-reset': str(int(time()) + 2)})
+        start = time()
+        self.rate_limiter.acquire(URL)
+        self.assertTrue(time() - start > .1)
+
+    def test_new_window(self):
+        self.rate_limiter.update(URL, {'x-rate-limit-remaining': '0', 'x-rate-limit-reset': str(int(time()) + 900)})
+        # Another thread learns of the new window.
+        Timer(.2, self.rate_limiter.update,
+              [URL, {'x-rate-limit-remaining': '900', 'x-rate-limit-reset': str(int(time()) + 1800)}]).start()
+        self.rate_limiter.acquire(URL)
+        self.assertEqual(899, self.rate_limiter.remaining(URL))
+
+    def test_interrupt(self):
+        self.rate_limiter.update(URL, {'x-rate-limit-remaining': '0', 'x-rate-limit-reset': str(int(time()) + 900)})
+        event = Event()
+        Timer(.2, event.set).start()
+        with self.assertRaises(RateLimitInterrupted):
+            self.rate_limiter.acquire(URL, event=event)
+
+    def test_allowance(self):
+        other_rate_limiter = RateLimiter()
+        self.assertEqual((float('inf'), 0), self.rate_limiter.allowance(URL))
+        self.rate_limiter.update(URL, {'x-rate-limit-remaining': '0', 'x-rate-limit-reset': str(int(time()) + 900)})
+        other_rate_limiter.update(URL, {'x-rate-limit-remaining': '0', 'x-rate-limit-reset': str(int(time()) + 300)})
+        # Resets sooner
+        self.assertGreater(other_rate_limiter.allowance(URL), self.rate_limiter.allowance(URL))
+        other_rate_limiter.update(URL, {'x-rate-limit-remaining': '5', 'x-rate-limit-reset': str(int(time()) + 1200)})
+        self.assertEqual(5, other_rate_limiter.allowance(URL)[0])
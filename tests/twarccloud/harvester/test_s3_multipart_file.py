@@ -0,0 +1,67 @@
+from datetime import datetime
+from unittest.mock import patch
+import os
+import boto3
+try:
+    from moto import mock_aws
+except ImportError:
+    from moto import mock_s3 as mock_aws
+from twarccloud.harvester.s3_multipart_file import S3MultipartFile, MIN_PART_SIZE
+from twarccloud.aws.s3 import abort_multipart_uploads
+from tests import TestCase
+
+
+@mock_aws
+class TestS3MultipartFile(TestCase):
+    def setUp(self):
+        os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+        os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+        os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+        self.bucket = 'test-bucket'
+        self.key = 'collections/test_id/harvests/2019/03/09/15/35/07/tweets-20190309153508.jsonl.gz'
+        self.client = boto3.client('s3')
+        self.client.create_bucket(Bucket=self.bucket)
+
+    def test_write(self):
+        data = os.urandom(MIN_PART_SIZE * 2 + 100)
+        file = S3MultipartFile(self.bucket, self.key, part_size=MIN_PART_SIZE)
+        for start in range(0, len(data), 1024 * 1024):
+            file.write(data[start:start + 1024 * 1024])
+        # Full parts have been uploaded, but the object is not visible.
+        self.assertEqual(2, len(file.parts))
+        self.assertFalse(self.client.list_objects_v2(Bucket=self.bucket).get('Contents'))
+        file.close()
+        self.assertEqual(3, len(file.parts))
+        self.assertEqual(data, self.client.get_object(Bucket=self.bucket, Key=self.key)['Body'].read())
+        self.assertFalse(self.client.list_multipart_uploads(Bucket=self.bucket).get('Uploads'))
+
+    def test_write_empty(self):
+        file = S3MultipartFile(self.bucket, self.key)
+        file.close()
+        self.assertEqual(b'', self.client.get_object(Bucket=self.bucket, Key=self.key)['Body'].read())
+
+    def test_abort(self):
+        file = S3MultipartFile(self.bucket, self.key, part_size=MIN_PART_SIZE)
+        file.write(os.urandom(MIN_PART_SIZE))
+        file.abort()
+        self.assertFalse(self.client.list_objects_v2(Bucket=self.bucket).get('Contents'))
+        self.assertFalse(self.client.list_multipart_uploads(Bucket=self.bucket).get('Uploads'))
+        with self.assertRaises(ValueError):
+            file.write(b'more')
+
+    def test_failed_part_aborts(self):
+        file = S3MultipartFile(self.bucket, self.key, part_size=MIN_PART_SIZE)
+        with patch.object(file, 'upload_id', 'not_an_upload'):
+            with self.assertRaises(Exception):
+                file.write(os.urandom(MIN_PART_SIZE))
+        self.assertTrue(file.closed)
+
+    def test_abort_multipart_uploads(self):
+        S3MultipartFile(self.bucket, self.key)
+        S3MultipartFile(self.bucket, 'collections/other_id/tweets.jsonl.gz')
+        # Uploads initiated after are left alone.
+        self.assertEqual(0, abort_multipart_uploads(self.bucket, 'collections/test_id',
+                                                    initiated_before=datetime(2000, 1, 1)))
+        self.assertEqual(1, abort_multipart_uploads(self.bucket, 'collections/test_id'))
+        uploads = self.client.list_multipart_uploads(Bucket=self.bucket)['Uploads']
+        self.assertEqual(['collections/other_id/tweets.jsonl.gz'], [upload['Key'] for upload in uploads])
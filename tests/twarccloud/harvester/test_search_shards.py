@@ -0,0 +1,43 @@
+from twarccloud.harvester.search_shards import SearchShard, create_shards, shards_since_id
+from twarccloud.raw_tweet_helper import timestamp_tweet_id
+from tests import TestCase
+
+NOW = 1551448230
+
+
+class TestSearchShards(TestCase):
+    def test_create_shards(self):
+        shards = create_shards('1101479829856149504', 4, now=NOW + 60 * 60)
+        self.assertEqual(4, len(shards))
+        self.assertEqual(1101479829856149504, shards[0].since_id)
+        self.assertEqual(timestamp_tweet_id(NOW + 60 * 60), shards[3].max_id)
+        # Shards are contiguous.
+        for shard, next_shard in zip(shards, shards[1:]):
+            self.assertEqual(shard.max_id, next_shard.since_id)
+
+    def test_create_shards_without_since_id(self):
+        shards = create_shards(None, 7, now=NOW)
+        self.assertEqual(timestamp_tweet_id(NOW - 7 * 24 * 60 * 60), shards[0].since_id)
+
+    def test_create_shards_since_id_in_future(self):
+        shards = create_shards(str(timestamp_tweet_id(NOW + 60)), 4, now=NOW)
+        self.assertEqual(1, len(shards))
+
+    def test_shards_since_id(self):
+        shards = [SearchShard(0, 10, done=True), SearchShard(10, 20), SearchShard(20, 30, done=True)]
+        # Shard 10 to 20 must be searched again.
+        self.assertEqual(10, shards_since_id(shards))
+        shards[1].done = True
+        self.assertEqual(30, shards_since_id(shards))
+        shards[0].done = False
+        self.assertIsNone(shards_since_id(shards))
+
+    def test_found(self):
+        shard = SearchShard(10, 20)
+        self.assertTrue(shard.is_outside(10))
+        self.assertFalse(shard.is_outside(20))
+        shard.found(18)
+        shard.found(15)
+        self.assertEqual(14, shard.next_max_id)
+        self.assertEqual(18, shard.newest_id)
+        self.assertEqual(shard.to_dict(), SearchShard.from_dict(shard.to_dict()).to_dict())
@@ -0,0 +1,64 @@
+import json
+from unittest.mock import patch, MagicMock
+from time import time
+from twarc import Twarc
+from twarccloud.harvester.twarc_client import TwarcClient
+from tests import TestCase
+
+
+class TestTwarcClient(TestCase):
+    def setUp(self):
+        self.twarc = TwarcClient('consumer_key', 'consumer_secret', 'access_token', 'access_token_secret',
+                                 validate_keys=False)
+
+    @patch.object(TwarcClient, 'get')
+    def test_search_raw(self, mock_get):
+        mock_get.side_effect = [
+            self.response({'statuses': [self.tweet(5), self.tweet(4)], 'search_metadata': {}}),
+            self.response({'statuses': [self.tweet(3), self.tweet(2)], 'search_metadata': {}})
+        ]
+        raw_tweets = list(self.twarc.search_raw('foo', since_id='2'))
+        self.assertEqual([json.dumps(self.tweet(tweet_id)).encode('utf-8') for tweet_id in (5, 4, 3)], raw_tweets)
+        self.assertEqual('1', mock_get.call_args_list[0][1]['params']['since_id'])
+        self.assertEqual('3', mock_get.call_args_list[1][1]['params']['max_id'])
+
+    @patch.object(TwarcClient, 'get')
+    def test_timeline_raw(self, mock_get):
+        other_user_tweet = self.tweet(3)
+        other_user_tweet['user'] = {'id': 13, 'id_str': '13'}
+        mock_get.side_effect = [
+            self.response([self.tweet(5), other_user_tweet]),
+            self.response([])
+        ]
+        raw_tweets = list(self.twarc.timeline_raw('12'))
+        self.assertEqual([json.dumps(self.tweet(5)).encode('utf-8')], raw_tweets)
+        self.assertEqual('2', mock_get.call_args_list[1][1]['params']['max_id'])
+
+    @patch.object(TwarcClient, 'post')
+    def test_filter_raw(self, mock_post):
+        mock_post.return_value = MagicMock(iter_lines=MagicMock(return_value=[b'{"id":1}', b'', b'{"id":2}']))
+        raw_tweets = []
+        # Stream is reconnected when it ends, so stop after the first connection.
+        for raw_tweet in self.twarc.filter_raw(track='foo'):
+            raw_tweets.append(raw_tweet)
+            if len(raw_tweets) == 2:
+                break
+        self.assertEqual([b'{"id":1}', b'{"id":2}'], raw_tweets)
+
+    @patch.object(Twarc, 'get')
+    def test_get_rate_limited(self, mock_get):
+        url = 'https://api.twitter.com/1.1/statuses/user_timeline.json'
+        mock_get.return_value = MagicMock(headers={'x-rate-limit-remaining': '899',
+                                                   'x-rate-limit-reset': str(int(time()) + 900)})
+        self.twarc.get(url, params={})
+        self.assertEqual(899, self.twarc.rate_limiter.remaining(url))
+        self.twarc.get(url, params={})
+        mock_get.assert_called_with(self.twarc, url, params={})
+
+    @staticmethod
+    def tweet(tweet_id):
+        return {'id': tweet_id, 'id_str': str(tweet_id), 'user': {'id': 12, 'id_str': '12'}}
+
+    @staticmethod
+    def response(body):
+        return MagicMock(content=json.dumps(body).encode('utf-8'))
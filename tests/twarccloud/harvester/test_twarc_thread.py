@@ -0,0 +1,371 @@
+from tempfile import mkdtemp
+from datetime import datetime
+from queue import Queue
+from threading import Event, Thread
+from unittest.mock import patch, MagicMock
+import json
+import os
+import shutil
+import requests
+from twarccloud.harvester.twarc_thread import TwarcThread
+from twarccloud.harvester.search_shards import SearchShard
+from twarccloud.harvester.harvest_info import HarvestInfo
+from twarccloud.changeset import Changeset
+from twarccloud.filepaths_helper import get_users_filepath, get_user_changes_filepath, get_user_activity_filepath, \
+    get_harvest_checkpoint_filepath, get_tweet_index_path, get_harvest_duplicates_filepath
+from twarccloud.harvester.file_mover_thread import AddFile, DeleteFile
+from twarccloud.tweet_index import TweetIndex
+from tests import TestCase, timeline_config, search_config, filter_config
+
+
+# pylint: disable=too-many-public-methods
+class TestTwarcThread(TestCase):
+    def setUp(self):
+        self.collections_path = mkdtemp()
+        self.harvest_timestamp = datetime.utcnow()
+        self.config = timeline_config()
+        self.config['users'] = {
+            '1': {'screen_name': 'one'},
+            '2': {'screen_name': 'two'},
+            '3': {'screen_name': 'three'},
+            '4': {},
+            '5': {'screen_name': 'five'}
+        }
+        self.mock_twarc = MagicMock()
+        # Timeline workers share the mock client.
+        self.create_twarc_patcher = patch.object(TwarcThread, '_create_twarc', return_value=self.mock_twarc)
+        self.create_twarc_patcher.start()
+        self.changeset = Changeset()
+        self.twarc_thread = TwarcThread(self.config, self.collections_path, self.harvest_timestamp, Queue(),
+                                        self.changeset, Event(), HarvestInfo(self.config['id'],
+                                                                             self.harvest_timestamp),
+                                        timeline_workers=2)
+        self.twarc_thread.writer = MagicMock()
+        self.mock_twarc.timeline.return_value = []
+        # 1 is OK. 2 is protected. 3 is not found. 4 is found. 5 is suspended.
+        self.mock_twarc.get.side_effect = self.get
+
+    def tearDown(self):
+        self.create_twarc_patcher.stop()
+        shutil.rmtree(self.collections_path, ignore_errors=True)
+
+    def get(self, url, params=None, **_):
+        if url.endswith('users/lookup.json'):
+            # Not in the order requested.
+            users = [self.user('2', 'two', protected=True), self.user('1', 'one'), self.user('4', 'four')]
+            return self.response([user for user in users if user['id_str'] in params['user_id'].split(',')])
+        if params['user_id'] == '3':
+            raise self.http_error(404, 50)
+        raise self.http_error(403, 63)
+
+    # pylint: disable=protected-access
+    def test_lookup_users(self):
+        self.assertEqual([('1', 'OK', self.user('1', 'one')), ('2', 'protected', self.user('2', 'two', True)),
+                          ('3', 'not_found', None), ('4', 'OK', self.user('4', 'four')), ('5', 'suspended', None)],
+                         list(self.twarc_thread._lookup_users(self.config['users'].keys())))
+        self.assertEqual('1,2,3,4,5', self.mock_twarc.get.call_args_list[0][1]['params']['user_id'])
+        # Only users missing from the lookup are looked up individually.
+        self.assertEqual(3, self.mock_twarc.get.call_count)
+
+    def test_user_timelines(self):
+        self.twarc_thread.user_timelines()
+        with open(get_users_filepath(self.config['id'], self.harvest_timestamp,
+                                     collections_path=self.collections_path)) as file:
+            self.assertEqual([self.user('1', 'one'), self.user('4', 'four')], [json.loads(line) for line in file])
+        with open(get_user_changes_filepath(self.config['id'], self.harvest_timestamp,
+                                            collections_path=self.collections_path)) as file:
+            self.assertEqual([{'user_id': '2', 'change': 'protected', 'screen_name': 'two'},
+                              {'user_id': '3', 'change': 'not_found', 'screen_name': 'three'},
+                              {'user_id': '4', 'change': 'screen name found', 'screen_name': 'four'},
+                              {'user_id': '5', 'change': 'suspended', 'screen_name': 'five'}], json.load(file))
+        self.assertEqual(2, self.mock_twarc.timeline.call_count)
+
+    def test_user_timelines_since_id(self):
+        self.config['users']['1']['since_id'] = '100'
+        self.config['users']['4']['since_id'] = '200'
+
+        def timeline(user_id=None, **_):
+            # User 4 has no new tweets.
+            return [{'id': 150}, {'id': 120}] if user_id == '1' else []
+
+        self.mock_twarc.timeline.side_effect = timeline
+        self.twarc_thread.user_timelines()
+        self.assertEqual('150', self.changeset['update']['users']['1']['since_id'])
+        self.assertNotIn('since_id', self.changeset['update']['users']['4'])
+        self.assertEqual(2, self.twarc_thread.writer.write.call_count)
+
+    def test_user_activity(self):
+        user_activity_filepath = get_user_activity_filepath(self.config['id'], collections_path=self.collections_path)
+        os.makedirs(os.path.dirname(user_activity_filepath))
+        with open(user_activity_filepath, 'w') as file:
+            # 4 is dormant. 6 is no longer in the collection.
+            json.dump({'1': [1551448230, 5, 0, 0], '4': [1551448230, 0, 3, 0], '6': [1551448230, 1, 0, 0]}, file)
+        self.config['max_skip_harvests'] = 8
+        self.mock_twarc.timeline.side_effect = lambda user_id=None, **_: [{'id': 150}] if user_id == '1' else []
+        self.twarc_thread.user_timelines()
+        with open(get_user_changes_filepath(self.config['id'], self.harvest_timestamp,
+                                            collections_path=self.collections_path)) as file:
+            self.assertEqual({'user_id': '4', 'change': 'skipped', 'empty_harvests': 3, 'skipped_harvests': 1},
+                             json.load(file)[0])
+        self.mock_twarc.timeline.assert_called_once_with(user_id='1', since_id=None)
+        with open(user_activity_filepath) as file:
+            self.assertEqual({'1': [1551448230, 3.0, 0, 0], '4': [1551448230, 0, 3, 1]}, json.load(file))
+
+    def test_checkpoint(self):
+        # Checkpoint before every user.
+        self.twarc_thread.checkpoint_secs = 1e-9
+        self.twarc_thread.last_checkpoint = 0
+        self.mock_twarc.timeline.side_effect = lambda user_id=None, **_: [{'id': 150}] if user_id == '1' else []
+        self.twarc_thread.user_timelines()
+        checkpoint_filepath = get_harvest_checkpoint_filepath(self.config['id'], self.harvest_timestamp,
+                                                              collections_path=self.collections_path)
+        done_counts = []
+        for call in self.twarc_thread.writer.checkpoint.call_args_list:
+            # The writer calls back once the tweets before are in a closed file.
+            call[0][0]()
+            with open(checkpoint_filepath) as file:
+                checkpoint = json.load(file)
+            done_counts.append(len(checkpoint['done_user_ids']))
+            # Progress for a user is only checkpointed once the user is done.
+            self.assertEqual('1' in checkpoint['done_user_ids'],
+                             'since_id' in checkpoint['changeset']['update'].get('users', {}).get('1', {}))
+            self.assertEqual('1' in checkpoint['done_user_ids'], '1' in checkpoint['user_activity'])
+            protected_change = {'user_id': '2', 'change': 'protected', 'screen_name': 'two'}
+            self.assertEqual('2' in checkpoint['done_user_ids'], protected_change in checkpoint['user_changes'])
+        self.assertTrue(done_counts)
+        self.assertEqual(sorted(done_counts), done_counts)
+
+    def test_resume_user_timelines(self):
+        self.twarc_thread.resume = {'done_user_ids': ['1', '2', '3']}
+        self.twarc_thread.user_timelines()
+        self.assertEqual('4,5', self.mock_twarc.get.call_args_list[0][1]['params']['user_id'])
+        self.mock_twarc.timeline.assert_called_once_with(user_id='4', since_id=None)
+
+    def test_resume_user_timelines_with_user_activity(self):
+        user_activity_filepath = get_user_activity_filepath(self.config['id'], collections_path=self.collections_path)
+        self.twarc_thread.resume = {
+            'done_user_ids': ['1', '2', '3'],
+            'user_changes': [{'user_id': '2', 'change': 'protected', 'screen_name': 'two'},
+                             {'user_id': '3', 'change': 'not_found', 'screen_name': 'three'}],
+            'user_activity': {'1': [1551448230, 1, 0, 0]}
+        }
+        self.twarc_thread.user_timelines()
+        self.mock_twarc.timeline.assert_called_once_with(user_id='4', since_id=None)
+        # The changes and activity of the users done before the checkpoint are kept.
+        with open(get_user_changes_filepath(self.config['id'], self.harvest_timestamp,
+                                            collections_path=self.collections_path)) as file:
+            self.assertEqual([{'user_id': '2', 'change': 'protected', 'screen_name': 'two'},
+                              {'user_id': '3', 'change': 'not_found', 'screen_name': 'three'},
+                              {'user_id': '4', 'change': 'screen name found', 'screen_name': 'four'},
+                              {'user_id': '5', 'change': 'suspended', 'screen_name': 'five'}], json.load(file))
+        with open(user_activity_filepath) as file:
+            self.assertEqual({'1': [1551448230, 1, 0, 0], '4': [None, 0, 1, 0]}, json.load(file))
+
+    def test_resume_user_timelines_skipped(self):
+        user_activity_filepath = get_user_activity_filepath(self.config['id'], collections_path=self.collections_path)
+        self.config['max_skip_harvests'] = 8
+        # 4 was skipped before the checkpoint, which recorded the skip.
+        self.twarc_thread.resume = {
+            'done_user_ids': [],
+            'user_changes': [{'user_id': '4', 'change': 'skipped', 'empty_harvests': 3, 'skipped_harvests': 1}],
+            'user_activity': {'4': [1551448230, 0, 3, 1]}
+        }
+        self.twarc_thread.user_timelines()
+        self.assertEqual(1, self.mock_twarc.timeline.call_count)
+        self.mock_twarc.timeline.assert_called_once_with(user_id='1', since_id=None)
+        with open(user_activity_filepath) as file:
+            # Not skipped again.
+            self.assertEqual([1551448230, 0, 3, 1], json.load(file)['4'])
+
+    def test_resume_user_timelines_with_deleted_user(self):
+        # The checkpoint's changes deleted a user that was done.
+        del self.config['users']['3']
+        self.twarc_thread.resume = {'done_user_ids': ['1', '2', '3']}
+        self.twarc_thread.user_timelines()
+        self.assertEqual('4,5', self.mock_twarc.get.call_args_list[0][1]['params']['user_id'])
+
+    def test_resume_search(self):
+        config = search_config()
+        config['search']['since_id'] = '100'
+        twarc_thread = TwarcThread(config, self.collections_path, self.harvest_timestamp, Queue(), self.changeset,
+                                   Event(), HarvestInfo(config['id'], self.harvest_timestamp),
+                                   resume={'search': {'max_id': 300, 'next_max_id': '199'}})
+        twarc_thread.writer = MagicMock()
+        self.mock_twarc.search.return_value = [{'id': 150}]
+        twarc_thread.search()
+        self.mock_twarc.search.assert_called_once_with(q=config['search']['query'], since_id='100', max_id='199')
+        # The newest tweet found before stopping.
+        self.assertEqual('300', self.changeset['update']['search']['since_id'])
+
+    def test_sharded_search(self):
+        config = search_config()
+        config['search']['since_id'] = '100'
+        twarc_thread = TwarcThread(config, self.collections_path, self.harvest_timestamp, Queue(), self.changeset,
+                                   Event(), HarvestInfo(config['id'], self.harvest_timestamp), search_shards=3)
+        twarc_thread.writer = MagicMock()
+        tweet_ids = list(range(101, 131))
+
+        def search(since_id=None, max_id=None, **_):
+            # Like search_raw, since_id is inclusive, so boundary tweets are returned by both shards.
+            return [{'id': tweet_id} for tweet_id in reversed(tweet_ids) if int(since_id) <= tweet_id <= int(max_id)]
+
+        self.mock_twarc.search.side_effect = search
+        with patch('twarccloud.harvester.twarc_thread.create_shards') as mock_create_shards:
+            mock_create_shards.return_value = [SearchShard(100, 110), SearchShard(110, 120), SearchShard(120, 130)]
+            twarc_thread.search()
+        written_ids = [call[0][0]['id'] for call in twarc_thread.writer.write.call_args_list]
+        self.assertEqual(tweet_ids, sorted(written_ids))
+        self.assertEqual('130', self.changeset['update']['search']['since_id'])
+
+    def test_resume_sharded_search(self):
+        config = search_config()
+        twarc_thread = TwarcThread(config, self.collections_path, self.harvest_timestamp, Queue(), self.changeset,
+                                   Event(), HarvestInfo(config['id'], self.harvest_timestamp),
+                                   resume={'search_shards': [SearchShard(100, 110, done=True).to_dict(),
+                                                             SearchShard(110, 120, next_max_id=115).to_dict()]})
+        twarc_thread.writer = MagicMock()
+        self.mock_twarc.search.return_value = []
+        twarc_thread.search()
+        self.mock_twarc.search.assert_called_once_with(q=config['search']['query'], since_id='110', max_id='115')
+        self.assertEqual('120', self.changeset['update']['search']['since_id'])
+
+    def test_sharded_filter(self):
+        config = filter_config()
+        config['keys'] = [config['keys'], dict(config['keys'])]
+        config['filter']['track'] = ','.join('term{}'.format(term) for term in range(500))
+        harvest_info = HarvestInfo(config['id'], self.harvest_timestamp)
+        twarc_thread = TwarcThread(config, self.collections_path, self.harvest_timestamp, Queue(), self.changeset,
+                                   Event(), harvest_info)
+        twarc_thread.writer = MagicMock()
+        # Both shards match tweet 2.
+        streams = {
+            'term0': [b'{"id": 1}', b'{"id": 2}', b'{"limit": {"track": 5}}'],
+            'term1': [b'{"id": 2}', b'{"id": 3}']
+        }
+
+        def filter_raw(track=None, **_):
+            return iter(streams[track.split(',')[0]])
+
+        shard_twarc = MagicMock()
+        shard_twarc.filter_raw.side_effect = filter_raw
+        with patch('twarccloud.harvester.credential_pool.Credential.create_client', return_value=shard_twarc):
+            twarc_thread.filter()
+        self.assertEqual(2, shard_twarc.filter_raw.call_count)
+        for call in shard_twarc.filter_raw.call_args_list:
+            self.assertEqual(250, len(call[1]['track'].split(',')))
+        written = [call[0][0] for call in twarc_thread.writer.write.call_args_list]
+        self.assertEqual([1, 2, 3], sorted(tweet['id'] for tweet in written if 'id' in tweet))
+        self.assertEqual(4, len(written))
+        self.assertEqual(2, len(harvest_info.shards))
+        self.assertEqual(1, sum(shard_info.duplicates.value for shard_info in harvest_info.shards))
+        self.assertEqual(4, sum(shard_info.tweets.value for shard_info in harvest_info.shards))
+
+    def test_sharded_filter_max_records(self):
+        config = filter_config()
+        config['keys'] = [config['keys'], dict(config['keys'])]
+        config['filter']['track'] = ','.join('term{}'.format(term) for term in range(500))
+        config['filter']['max_records'] = 3
+        stop_event = Event()
+        twarc_thread = TwarcThread(config, self.collections_path, self.harvest_timestamp, Queue(), self.changeset,
+                                   stop_event, HarvestInfo(config['id'], self.harvest_timestamp))
+        twarc_thread.writer = MagicMock()
+
+        def filter_raw(track=None, **_):
+            start = 0 if track.startswith('term0,') else 1000
+            return iter('{{"id": {}}}'.format(start + tweet_id).encode('utf-8') for tweet_id in range(10))
+
+        shard_twarc = MagicMock()
+        shard_twarc.filter_raw.side_effect = filter_raw
+        with patch('twarccloud.harvester.credential_pool.Credential.create_client', return_value=shard_twarc):
+            twarc_thread.filter()
+        self.assertEqual(3, twarc_thread.writer.write.call_count)
+        # Only this collection is stopped.
+        self.assertTrue(twarc_thread.stop_event.is_set())
+        self.assertFalse(stop_event.is_set())
+
+    # pylint: disable=protected-access
+    def test_stop_with_harvester(self):
+        harvester_stop_event = Event()
+        twarc_thread = TwarcThread(self.config, self.collections_path, self.harvest_timestamp, Queue(),
+                                   self.changeset, harvester_stop_event,
+                                   HarvestInfo(self.config['id'], self.harvest_timestamp))
+        stop_thread = Thread(target=twarc_thread._stop_with_harvester)
+        stop_thread.start()
+        self.assertFalse(twarc_thread.stop_event.is_set())
+        harvester_stop_event.set()
+        stop_thread.join(timeout=5)
+        self.assertTrue(twarc_thread.stop_event.is_set())
+
+    def test_dedup(self):
+        self.config['dedup'] = 'skip'
+        tweet_index_path = get_tweet_index_path(self.config['id'], collections_path=self.collections_path)
+        tweet_index = TweetIndex(tweet_index_path)
+        tweet_index.add(120)
+        tweet_index.write_segment(tweet_index.take_new_ids())
+        tweet_index.close()
+        self.twarc_thread.tweet_index = TweetIndex(tweet_index_path)
+        self.mock_twarc.timeline.side_effect = lambda user_id=None, **_: [{'id': 150}, {'id': 120}] \
+            if user_id == '1' else []
+        self.twarc_thread.user_timelines()
+        self.twarc_thread.writer.write.assert_called_once_with({'id': 150})
+        self.assertEqual(1, self.twarc_thread.harvest_info.tweets_duplicate.value)
+
+        self.twarc_thread._close_tweet_index()
+        # Merged into a new segment, which is uploaded before the segment it replaces is deleted.
+        segment_filepaths = [os.path.join(tweet_index_path, filename) for filename in ('0000000001.bin',
+                                                                                       '0000000002.bin')]
+        self.assertEqual([AddFile(segment_filepaths[1], False), DeleteFile(segment_filepaths[0])],
+                         [queued_file for queued_file in self.twarc_thread.file_queue.queue
+                          if queued_file.filepath.startswith(tweet_index_path)])
+        os.remove(segment_filepaths[0])
+        self.assertEqual([120, 150], list(TweetIndex(tweet_index_path).segments[0].ids))
+
+    def test_checkpoint_flushes_tweet_index(self):
+        self.config['dedup'] = 'skip'
+        tweet_index_path = get_tweet_index_path(self.config['id'], collections_path=self.collections_path)
+        self.twarc_thread.tweet_index = TweetIndex(tweet_index_path)
+        self.twarc_thread.checkpoint_secs = 1
+        self.twarc_thread.last_checkpoint = 0
+        self.twarc_thread._write({'id': 150})
+        self.twarc_thread._checkpoint_if_due()
+        self.assertEqual(set(), self.twarc_thread.tweet_index.new_ids)
+        # The ids are written by the writer, before the checkpoint.
+        self.assertEqual(2, self.twarc_thread.writer.checkpoint.call_count)
+        self.assertFalse(os.path.exists(tweet_index_path))
+        self.twarc_thread.writer.checkpoint.call_args_list[0][0][0]()
+        self.assertIn(AddFile(os.path.join(tweet_index_path, '0000000001.bin'), False),
+                      self.twarc_thread.file_queue.queue)
+        self.assertFalse(self.twarc_thread.tweet_index.add(150))
+
+    def test_dedup_flag(self):
+        self.config['dedup'] = 'flag'
+        self.twarc_thread.tweet_index = TweetIndex(get_tweet_index_path(self.config['id'],
+                                                                        collections_path=self.collections_path))
+        # A tweet returned twice.
+        self.mock_twarc.timeline.side_effect = lambda user_id=None, **_: [{'id': 150}, {'id': 150}] \
+            if user_id == '1' else []
+        self.twarc_thread.user_timelines()
+        self.assertEqual(2, self.twarc_thread.writer.write.call_count)
+        self.twarc_thread._close_tweet_index()
+        with open(get_harvest_duplicates_filepath(self.config['id'], self.harvest_timestamp,
+                                                  collections_path=self.collections_path)) as file:
+            self.assertEqual('150\n', file.read())
+
+    def test_user_timeline_exception(self):
+        self.mock_twarc.timeline.side_effect = requests.exceptions.HTTPError('Darn')
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self.twarc_thread.user_timelines()
+
+    @staticmethod
+    def user(user_id, screen_name, protected=False):
+        return {'id_str': user_id, 'screen_name': screen_name, 'protected': protected}
+
+    @staticmethod
+    def response(body):
+        return MagicMock(json=MagicMock(return_value=body))
+
+    @staticmethod
+    def http_error(status_code, error_code):
+        response = MagicMock(status_code=status_code)
+        response.json.return_value = {'errors': [{'code': error_code}]}
+        return requests.exceptions.HTTPError(response=response)
@@ -0,0 +1,15 @@
+from twarccloud.harvester.tweet_dedup import RecentTweetIds
+from tests import TestCase
+
+
+class TestRecentTweetIds(TestCase):
+    def test_add(self):
+        recent_tweet_ids = RecentTweetIds(capacity=2)
+        self.assertTrue(recent_tweet_ids.add(1))
+        self.assertFalse(recent_tweet_ids.add(1))
+        self.assertTrue(recent_tweet_ids.add(2))
+        # Seeing 1 again makes 2 the oldest.
+        self.assertFalse(recent_tweet_ids.add(1))
+        self.assertTrue(recent_tweet_ids.add(3))
+        self.assertFalse(recent_tweet_ids.add(1))
+        self.assertTrue(recent_tweet_ids.add(2))
@@ -1,18 +1,31 @@
 from tempfile import mkdtemp
+from io import BytesIO
 import shutil
 from datetime import datetime
 from queue import Queue
 import glob
-import gzip
 import json
 import os
+import hashlib
 from time import sleep
+from unittest.mock import patch
+import gzip
+try:
+    from moto import mock_aws
+except ImportError:
+    from moto import mock_s3 as mock_aws
 from twarccloud.harvester.tweet_writer_thread import TweetWriterThread
 from twarccloud.harvester.harvest_info import HarvestInfo
-from twarccloud.filepaths_helper import get_harvest_path, get_harvest_manifest_filepath
-from tests import TestCase
+from twarccloud.compression import open_tweet_file
+from twarccloud.filepaths_helper import get_harvest_path, get_harvest_manifest_filepath, \
+    get_harvest_manifest_segment_filepath, DEFAULT_COLLECTIONS_PATH
+from twarccloud.tweet_stats import get_stats_filepath, may_match
+from twarccloud.tweet_file_index import TweetFileIndex, get_index_filepath
+from twarccloud.harvester.file_mover_thread import AddFile, DeleteFile
+from tests import TestCase, create_test_bucket
 
 
+# pylint: disable=too-many-public-methods
 class TestTweetWriterThread(TestCase):
     def setUp(self):
         self.collections_path = mkdtemp()
@@ -43,6 +56,125 @@ class TestTweetWriterThread(TestCase):
         self.assertEqual(1, self.harvest_info.files.value)
         self.assertTrue(self.harvest_info.file_bytes.value)
 
+    def test_stats(self):
+        with TweetWriterThread(self.collections_path, self.collection_id, self.harvest_timestamp, self.file_queue,
+                               self.harvest_info) as writer:
+            writer.write({'id': 1101479829856149504, 'user': {'id': 12}})
+            writer.write(b'{"id":1101479829856149600,"user":{"id":481186914}}')
+            writer.write({'limit': {'track': 5}})
+        tweet_file = glob.glob('{}/*.jsonl.gz'.format(self.harvest_path))[0]
+        with open(get_stats_filepath(tweet_file)) as file:
+            stats = json.load(file)
+        self.assertEqual(3, stats['tweets'])
+        self.assertEqual(1101479829856149504, stats['min_tweet_id'])
+        self.assertEqual(1101479829856149600, stats['max_tweet_id'])
+        self.assertEqual('2019-03-01T13:50:30', stats['min_created_at'])
+        self.assertTrue(may_match(stats, user_ids=['481186914']))
+
+    def test_blocks(self):
+        tweets = [{'id': tweet_id} for tweet_id in range(1, 6)]
+        with TweetWriterThread(self.collections_path, self.collection_id, self.harvest_timestamp, self.file_queue,
+                               self.harvest_info, tweets_per_block=2, batch_size=3) as writer:
+            for tweet in tweets:
+                writer.write(tweet)
+        tweet_file = glob.glob('{}/*.jsonl.gz'.format(self.harvest_path))[0]
+        with open_tweet_file(tweet_file) as file:
+            self.assertEqual(tweets, [json.loads(line) for line in file])
+        index = TweetFileIndex.load(get_index_filepath(tweet_file))
+        # 3 blocks
+        self.assertEqual(4, len(index.offsets))
+        self.assertEqual(os.path.getsize(tweet_file), index.offsets[-1])
+        # A block can be decompressed on its own.
+        (start, end), = index.find([3])
+        with open(tweet_file, 'rb') as file:
+            file.seek(start)
+            block = gzip.decompress(file.read(end - start))
+        self.assertEqual(tweets[2:4], [json.loads(line) for line in block.splitlines()])
+        self.assertTrue(get_index_filepath(tweet_file) in self.get_queued_files())
+
+    def test_sha1_and_size(self):
+        with TweetWriterThread(self.collections_path, self.collection_id, self.harvest_timestamp, self.file_queue,
+                               self.harvest_info) as writer:
+            writer.write(self.generate_tweet(1))
+        tweet_file = glob.glob('{}/*.jsonl.gz'.format(self.harvest_path))[0]
+        with open(tweet_file, 'rb') as file:
+            sha1 = hashlib.sha1(file.read()).hexdigest()
+        with open(get_harvest_manifest_filepath(self.collection_id, self.harvest_timestamp,
+                                                collections_path=self.collections_path)) as file:
+            self.assertEqual('{}  {}\n'.format(sha1, os.path.basename(tweet_file)), file.read())
+        self.assertEqual(os.path.getsize(tweet_file), self.harvest_info.file_bytes.value)
+        queued_files = [self.file_queue.get(), self.file_queue.get()]
+        self.assertIn((tweet_file, sha1), [(queued_file.filepath, queued_file.sha1) for queued_file in queued_files])
+
+    def test_write_raw(self):
+        with TweetWriterThread(self.collections_path, self.collection_id, self.harvest_timestamp, self.file_queue,
+                               self.harvest_info) as writer:
+            writer.write(json.dumps(self.generate_tweet(1)).encode('utf-8'))
+            writer.write(self.generate_tweet(2))
+        tweet_files = glob.glob('{}/*.jsonl.gz'.format(self.harvest_path))
+        self.assertTweetsInFile(tweet_files[0], 1, 2)
+
+    def test_write_zstd(self):
+        with TweetWriterThread(self.collections_path, self.collection_id, self.harvest_timestamp, self.file_queue,
+                               self.harvest_info, codec='zstd:1') as writer:
+            writer.write(self.generate_tweet(1))
+            writer.write(self.generate_tweet(2))
+        tweet_files = glob.glob('{}/*.jsonl.zst'.format(self.harvest_path))
+        self.assertEqual(1, len(tweet_files))
+        self.assertTweetsInFile(tweet_files[0], 1, 2)
+        self.assertManifestFile(tweet_files)
+
+    @mock_aws
+    def test_write_to_s3(self):
+        client = create_test_bucket()
+        with TweetWriterThread(self.collections_path, self.collection_id, self.harvest_timestamp, self.file_queue,
+                               self.harvest_info, s3_bucket='test-bucket') as writer:
+            writer.write(self.generate_tweet(1))
+            writer.write(self.generate_tweet(2))
+        # Not written locally.
+        self.assertFalse(glob.glob('{}/*.jsonl.gz'.format(self.harvest_path)))
+        keys = [obj['Key'] for obj in client.list_objects_v2(Bucket='test-bucket')['Contents']]
+        self.assertEqual(1, len(keys))
+        self.assertTrue(keys[0].startswith(get_harvest_path(self.collection_id, self.harvest_timestamp)))
+        body = client.get_object(Bucket='test-bucket', Key=keys[0])['Body'].read()
+        with gzip.open(BytesIO(body)) as file:
+            self.assertEqual([self.generate_tweet(1), self.generate_tweet(2)],
+                             [json.loads(line) for line in file])
+        # Only the manifest, the stats sidecar and the index are queued.
+        self.assertManifestFile([keys[0]])
+        local_filepath = keys[0].replace(DEFAULT_COLLECTIONS_PATH, self.collections_path, 1)
+        self.assertEqual({get_harvest_manifest_filepath(self.collection_id, self.harvest_timestamp,
+                                                        collections_path=self.collections_path),
+                          get_stats_filepath(local_filepath), get_index_filepath(local_filepath)},
+                         self.get_queued_files())
+        self.assertEqual(len(body), self.harvest_info.file_bytes.value)
+
+    def test_manifest_segments(self):
+        with TweetWriterThread(self.collections_path, self.collection_id, self.harvest_timestamp, self.file_queue,
+                               self.harvest_info, tweets_per_file=1, manifest_segments=True) as writer:
+            writer.write(self.generate_tweet(1))
+            # Sleep so that file has new timestamp
+            sleep(1)
+            writer.write(self.generate_tweet(2))
+        tweet_files = glob.glob('{}/*.jsonl.gz'.format(self.harvest_path))
+        self.assertEqual(2, len(tweet_files))
+        self.assertManifestFile(tweet_files)
+        manifest_filepath = get_harvest_manifest_filepath(self.collection_id, self.harvest_timestamp,
+                                                          collections_path=self.collections_path)
+        segment_filepaths = [get_harvest_manifest_segment_filepath(self.collection_id, self.harvest_timestamp, segment,
+                                                                   collections_path=self.collections_path)
+                             for segment in (1, 2)]
+        queued_files = []
+        while not self.file_queue.empty():
+            queued_files.append(self.file_queue.get())
+        # Segments are queued instead of the manifest.
+        self.assertEqual(segment_filepaths, [queued_file.filepath for queued_file in queued_files
+                                             if isinstance(queued_file, AddFile)
+                                             and 'manifest' in queued_file.filepath][:2])
+        # Then the manifest replaces the segments.
+        self.assertEqual([AddFile(manifest_filepath, False)] + [DeleteFile(filepath) for filepath in segment_filepaths],
+                         queued_files[-3:])
+
     def test_rollover_by_tweet_count(self):
         with TweetWriterThread(self.collections_path, self.collection_id, self.harvest_timestamp, self.file_queue,
                                self.harvest_info, tweets_per_file=2) as writer:
@@ -60,6 +192,19 @@ class TestTweetWriterThread(TestCase):
         self.assertEqual(2, self.harvest_info.files.value)
         self.assertTrue(self.harvest_info.file_bytes.value)
 
+    def test_rollover_by_bytes(self):
+        with TweetWriterThread(self.collections_path, self.collection_id, self.harvest_timestamp, self.file_queue,
+                               self.harvest_info, bytes_per_file=1, batch_size=1) as writer:
+            writer.write(self.generate_tweet(1))
+            # Wait for the tweet to be written and sleep so that file has new timestamp
+            sleep(1)
+            writer.write(self.generate_tweet(2))
+        tweet_files = sorted(glob.glob('{}/*.jsonl.gz'.format(self.harvest_path)))
+        self.assertEqual(2, len(tweet_files))
+        self.assertTweetsInFile(tweet_files[0], 1, 1)
+        self.assertTweetsInFile(tweet_files[1], 2, 2)
+        self.assertEqual(2, self.harvest_info.files.value)
+
     def test_rollover_by_time(self):
         with TweetWriterThread(self.collections_path, self.collection_id, self.harvest_timestamp, self.file_queue,
                                self.harvest_info, secs_per_file=1) as writer:
@@ -77,6 +222,116 @@ class TestTweetWriterThread(TestCase):
         self.assertEqual(2, self.harvest_info.files.value)
         self.assertTrue(self.harvest_info.file_bytes.value)
 
+    def test_checkpoint(self):
+        queued_filepaths = []
+        with TweetWriterThread(self.collections_path, self.collection_id, self.harvest_timestamp, self.file_queue,
+                               self.harvest_info) as writer:
+            writer.write(self.generate_tweet(1))
+            writer.checkpoint(lambda: queued_filepaths.extend(
+                [queued_file.filepath for queued_file in self.file_queue.queue]))
+            writer.write(self.generate_tweet(2))
+        tweet_files = sorted(glob.glob('{}/*.jsonl.gz'.format(self.harvest_path)))
+        self.assertEqual(2, len(tweet_files))
+        # The tweet written before the checkpoint is in a closed, queued file.
+        self.assertTweetsInFile(tweet_files[0], 1, 1)
+        self.assertIn(tweet_files[0], queued_filepaths)
+        self.assertNotIn(tweet_files[1], queued_filepaths)
+
+    def test_backpressure_drop_oldest(self):
+        writer = TweetWriterThread(self.collections_path, self.collection_id, self.harvest_timestamp, self.file_queue,
+                                   self.harvest_info, queue_size=2, backpressure='drop_oldest')
+        # Queue is full before writing starts.
+        writer.write(self.generate_tweet(1))
+        writer.write(self.generate_tweet(2))
+        writer.write(self.generate_tweet(3))
+        self.assertEqual(2, self.harvest_info.queue_depth.value)
+        with writer:
+            pass
+        tweet_files = glob.glob('{}/*.jsonl.gz'.format(self.harvest_path))
+        self.assertTweetsInFile(tweet_files[0], 2, 3)
+        self.assertEqual(2, self.harvest_info.tweets.value)
+        self.assertEqual(1, self.harvest_info.tweets_dropped.value)
+        self.assertEqual(0, self.harvest_info.queue_depth.value)
+
+    def test_backpressure_drop_oldest_keeps_checkpoint(self):
+        writer = TweetWriterThread(self.collections_path, self.collection_id, self.harvest_timestamp, self.file_queue,
+                                   self.harvest_info, queue_size=2, backpressure='drop_oldest')
+        checkpoints = []
+        writer.checkpoint(lambda: checkpoints.append(True))
+        writer.write(self.generate_tweet(1))
+        writer.write(self.generate_tweet(2))
+        with writer:
+            pass
+        # The tweet after the checkpoint is dropped instead.
+        self.assertEqual([True], checkpoints)
+        self.assertEqual(1, self.harvest_info.tweets_dropped.value)
+        tweet_files = glob.glob('{}/*.jsonl.gz'.format(self.harvest_path))
+        self.assertTweetsInFile(tweet_files[0], 2, 2)
+
+    def test_exit_after_thread_died(self):
+        writer = TweetWriterThread(self.collections_path, self.collection_id, self.harvest_timestamp, self.file_queue,
+                                   self.harvest_info, queue_size=1)
+        with patch.object(writer, '_write_batch', side_effect=Exception('Died')):
+            with self.assertRaisesRegex(Exception, 'Died'):
+                with writer:
+                    writer.write(self.generate_tweet(1))
+                    writer.join(timeout=5)
+                    # Died with a full queue.
+                    writer.tweet_queue.put_nowait(self.generate_tweet(2))
+
+    def test_backpressure_spill(self):
+        writer = TweetWriterThread(self.collections_path, self.collection_id, self.harvest_timestamp, self.file_queue,
+                                   self.harvest_info, queue_size=2, backpressure='spill')
+        for tweet_id in range(1, 6):
+            writer.write(self.generate_tweet(tweet_id))
+        self.assertEqual(3, self.harvest_info.tweets_spilled.value)
+        with writer:
+            pass
+        tweet_files = glob.glob('{}/*.jsonl.gz'.format(self.harvest_path))
+        self.assertEqual(1, len(tweet_files))
+        self.assertTweetsInFile(tweet_files[0], 1, 5)
+        self.assertEqual(5, self.harvest_info.tweets.value)
+        self.assertFalse(glob.glob('{}/spill/*'.format(self.harvest_path)))
+
+    def test_backpressure_spill_keeps_order(self):
+        writer = TweetWriterThread(self.collections_path, self.collection_id, self.harvest_timestamp, self.file_queue,
+                                   self.harvest_info, queue_size=2, backpressure='spill')
+        for tweet_id in range(1, 4):
+            writer.write(self.generate_tweet(tweet_id))
+        # Room on the queue, as if the writer had taken the oldest tweet.
+        writer.tweet_queue.get_nowait()
+        # Spilled after the tweet before it rather than queued ahead of it.
+        writer.write(self.generate_tweet(4))
+        self.assertEqual(2, self.harvest_info.tweets_spilled.value)
+        self.assertEqual(1, writer.tweet_queue.qsize())
+        with writer:
+            pass
+        tweet_files = glob.glob('{}/*.jsonl.gz'.format(self.harvest_path))
+        self.assertTweetsInFile(tweet_files[0], 2, 4)
+        # Queued again once the spill is written.
+        self.assertFalse(writer.spill.is_pending())
+
+    def test_backpressure_spill_checkpoint(self):
+        writer = TweetWriterThread(self.collections_path, self.collection_id, self.harvest_timestamp, self.file_queue,
+                                   self.harvest_info, queue_size=2, backpressure='spill')
+        for tweet_id in range(1, 4):
+            writer.write(self.generate_tweet(tweet_id))
+        writer.tweet_queue.get_nowait()
+        checkpoint_tweets = []
+        writer.checkpoint(lambda: checkpoint_tweets.append(self.harvest_info.tweets.value))
+        writer.write(self.generate_tweet(4))
+        with writer:
+            pass
+        # The tweet spilled before the checkpoint is written before it.
+        self.assertEqual([3], checkpoint_tweets)
+        tweet_files = sorted(glob.glob('{}/*.jsonl.gz'.format(self.harvest_path)))
+        self.assertTweetsInFile(tweet_files[0], 2, 4)
+
+    def test_unknown_backpressure(self):
+        with self.assertRaises(ValueError):
+            TweetWriterThread(self.collections_path, self.collection_id, self.harvest_timestamp, self.file_queue,
+                              self.harvest_info, backpressure='shrug')
+
     @staticmethod
     def generate_tweet(tweet_id):
         return {
@@ -85,10 +340,10 @@ class TestTweetWriterThread(TestCase):
 
     # pylint: disable=invalid-name
     def assertTweetsInFile(self, filepath, start_tweet_id, stop_tweet_id):
-        with gzip.open(filepath) as tweet_file:
-            for tweet_id in range(start_tweet_id, stop_tweet_id + 1):
-                line = tweet_file.readline()
-                self.assertDictEqual(self.generate_tweet(tweet_id), json.loads(line))
+        with open_tweet_file(filepath) as tweet_file:
+            lines = tweet_file.read().splitlines()
+        for tweet_id in range(start_tweet_id, stop_tweet_id + 1):
+            self.assertDictEqual(self.generate_tweet(tweet_id), json.loads(lines[tweet_id - start_tweet_id]))
 
     # pylint: disable=invalid-name
     def assertQueuedFiles(self, tweet_files):
@@ -0,0 +1,20 @@
+from twarccloud.bloom_filter import BloomFilter
+from tests import TestCase
+
+
+class TestBloomFilter(TestCase):
+    def test_contains(self):
+        bloom_filter = BloomFilter.create(1000)
+        for key in range(1000):
+            bloom_filter.add(key)
+        self.assertTrue(all(key in bloom_filter for key in range(1000)))
+        false_positives = len([key for key in range(1000, 11000) if key in bloom_filter])
+        self.assertLess(false_positives, 300)
+
+    def test_to_dict(self):
+        bloom_filter = BloomFilter.create(10)
+        bloom_filter.add(481186914)
+        loaded_bloom_filter = BloomFilter.from_dict(bloom_filter.to_dict())
+        self.assertTrue(481186914 in loaded_bloom_filter)
+        self.assertTrue('481186914' in loaded_bloom_filter)
+        self.assertEqual(bloom_filter.num_bits, loaded_bloom_filter.num_bits)
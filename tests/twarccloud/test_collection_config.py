@@ -27,6 +27,16 @@ class TestInvalidReasons(TestCase):
         del self.timeline_config['keys']['access_token_secret']
         self.assertEqual(len(self.timeline_config.invalid_reasons()), 4)
 
+    def test_key_sets(self):
+        other_keys = dict(self.timeline_config['keys'])
+        self.timeline_config['keys'] = [self.timeline_config['keys'], other_keys]
+        self.assertFalse(self.timeline_config.invalid_reasons())
+        self.assertEqual(2, len(self.timeline_config.key_sets()))
+        del other_keys['access_token']
+        self.assertEqual(['Keys 2: Missing access_token.'], self.timeline_config.invalid_reasons())
+        self.timeline_config['keys'] = []
+        self.assertEqual(['Keys is empty.'], self.timeline_config.invalid_reasons())
+
     def test_invalid_type(self):
         self.timeline_config['type'] = 'foo'
         self.assertEqual(len(self.timeline_config.invalid_reasons()), 1)
@@ -47,6 +57,31 @@ class TestInvalidReasons(TestCase):
         del self.filter_config['filter']['track']
         self.assertEqual(len(self.filter_config.invalid_reasons()), 1)
 
+    def test_filter_needs_keys(self):
+        self.filter_config['filter']['track'] = ','.join('term{}'.format(term) for term in range(500))
+        self.assertEqual(['Filter needs 2 connections, but only 1 sets of keys.'],
+                         self.filter_config.invalid_reasons())
+        self.filter_config['keys'] = [self.filter_config['keys'], dict(self.filter_config['keys'])]
+        self.assertFalse(self.filter_config.invalid_reasons())
+
+    def test_invalid_dedup(self):
+        self.search_config['dedup'] = 'skip'
+        self.assertFalse(self.search_config.invalid_reasons())
+        self.search_config['dedup'] = 'drop'
+        self.assertEqual(['dedup must be one of skip, flag.'], self.search_config.invalid_reasons())
+
+    def test_invalid_max_skip_harvests(self):
+        self.timeline_config['max_skip_harvests'] = -1
+        self.assertEqual(len(self.timeline_config.invalid_reasons()), 1)
+        self.timeline_config['max_skip_harvests'] = 8
+        self.assertFalse(self.timeline_config.invalid_reasons())
+
+    def test_invalid_codec(self):
+        self.timeline_config['codec'] = 'zstd:99'
+        self.assertEqual(len(self.timeline_config.invalid_reasons()), 1)
+        self.timeline_config['codec'] = 'zstd:3'
+        self.assertFalse(self.timeline_config.invalid_reasons())
+
     def test_missing_query(self):
         del self.search_config['search']['query']
         self.assertEqual(len(self.search_config.invalid_reasons()), 1)
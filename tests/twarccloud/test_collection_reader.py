@@ -0,0 +1,92 @@
+from tempfile import mkdtemp
+from datetime import datetime
+import os
+import shutil
+try:
+    from moto import mock_aws
+except ImportError:
+    from moto import mock_s3 as mock_aws
+from twarccloud.collection_reader import CollectionReader
+from twarccloud.tweet_file_index import index_tweet_file
+from twarccloud.filepaths_helper import get_collection_config_filepath
+from tests import TestCase, create_test_bucket, upload_collections, write_tweet_file
+
+# Created 2019-03-01 and 2019-03-10.
+MARCH_1_TWEETS = [{'id': 1101479829856149504 + tweet_id, 'user': {'id': 12, 'id_str': '12'}}
+                  for tweet_id in range(3)]
+MARCH_10_TWEETS = [{'id': 1104744219066998784 + tweet_id, 'user': {'id': 481186914, 'id_str': '481186914'}}
+                   for tweet_id in range(2)]
+
+
+class TestCollectionReader(TestCase):
+    def setUp(self):
+        self.collections_path = mkdtemp()
+        self.collection_id = 'test_id'
+        os.makedirs(os.path.dirname(get_collection_config_filepath(self.collection_id,
+                                                                   collections_path=self.collections_path)))
+        with open(get_collection_config_filepath(self.collection_id, collections_path=self.collections_path),
+                  'w') as file:
+            file.write('{}')
+        self.march_1_filepath = self.write_tweet_file(datetime(2019, 3, 1), MARCH_1_TWEETS)
+        self.march_10_filepath = self.write_tweet_file(datetime(2019, 3, 10), MARCH_10_TWEETS)
+        # A file without a sidecar.
+        self.no_stats_filepath = self.write_tweet_file(datetime(2019, 3, 11), MARCH_10_TWEETS[:1], stats=False)
+        self.reader = CollectionReader(self.collection_id, collections_path=self.collections_path, workers=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.collections_path, ignore_errors=True)
+
+    def write_tweet_file(self, harvest_timestamp, tweets, stats=True):
+        return write_tweet_file(self.collection_id, harvest_timestamp, tweets, self.collections_path, stats=stats)
+
+    def test_tweet_files(self):
+        self.assertEqual([self.march_1_filepath, self.march_10_filepath, self.no_stats_filepath],
+                         self.reader.tweet_files())
+
+    def test_tweets(self):
+        self.assertEqual(MARCH_1_TWEETS + MARCH_10_TWEETS + MARCH_10_TWEETS[:1], list(self.reader.tweets()))
+        self.assertEqual(0, self.reader.skipped_files)
+
+    def test_tweets_since(self):
+        self.assertEqual(MARCH_10_TWEETS + MARCH_10_TWEETS[:1], list(self.reader.tweets(since=datetime(2019, 3, 5))))
+        self.assertEqual(1, self.reader.skipped_files)
+
+    def test_tweets_until(self):
+        self.assertEqual(MARCH_1_TWEETS, list(self.reader.tweets(until=datetime(2019, 3, 5))))
+        self.assertEqual(1, self.reader.skipped_files)
+
+    def test_tweets_user_ids(self):
+        self.assertEqual(MARCH_1_TWEETS, list(self.reader.tweets(user_ids=[12])))
+        self.assertEqual(1, self.reader.skipped_files)
+
+    def test_get_tweets(self):
+        index_tweet_file(self.march_1_filepath, tweets_per_block=2)
+        self.assertEqual([MARCH_1_TWEETS[2], MARCH_10_TWEETS[1]],
+                         list(self.reader.get_tweets([MARCH_10_TWEETS[1]['id'], str(MARCH_1_TWEETS[2]['id'])])))
+        # Stopped once found.
+        self.assertEqual(0, self.reader.skipped_files)
+
+    def test_get_tweets_not_found(self):
+        index_tweet_file(self.march_1_filepath, tweets_per_block=2)
+        self.assertEqual([], list(self.reader.get_tweets([1])))
+        # Skipped by the index and the sidecar, but the file without a sidecar is read.
+        self.assertEqual(2, self.reader.skipped_files)
+
+    @mock_aws
+    def test_tweets_from_s3(self):
+        reader = self.upload_to_s3()
+        self.assertEqual(3, len(reader.tweet_files()))
+        self.assertEqual(MARCH_10_TWEETS + MARCH_10_TWEETS[:1], list(reader.tweets(user_ids=['481186914'])))
+        self.assertEqual(1, reader.skipped_files)
+
+    @mock_aws
+    def test_get_tweets_from_s3(self):
+        index_tweet_file(self.march_1_filepath, tweets_per_block=2)
+        reader = self.upload_to_s3()
+        self.assertEqual([MARCH_1_TWEETS[2], MARCH_10_TWEETS[1]],
+                         list(reader.get_tweets([MARCH_1_TWEETS[2]['id'], MARCH_10_TWEETS[1]['id']])))
+
+    def upload_to_s3(self):
+        client = create_test_bucket()
+        upload_collections(client, self.collections_path)
+        return CollectionReader(self.collection_id, bucket='test-bucket', workers=2)
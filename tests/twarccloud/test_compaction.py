@@ -0,0 +1,160 @@
+from tempfile import mkdtemp
+from datetime import datetime
+import gzip
+import hashlib
+import json
+import os
+import shutil
+try:
+    from moto import mock_aws
+except ImportError:
+    from moto import mock_s3 as mock_aws
+from twarccloud.compaction import plan_compaction, compact_harvest, compact_collection, locked_harvest_path
+from twarccloud.collection_reader import CollectionReader
+from twarccloud.filepaths_helper import get_harvest_path, get_lock_file
+from twarccloud.tweet_file_index import TweetFileIndex, index_tweet_file, get_index_filepath
+from twarccloud.tweet_stats import TweetStats, get_stats_filepath
+from tests import TestCase, create_test_bucket, upload_collections
+
+TWEETS = [{'id': 1101479829856149504 + count, 'user': {'id': count % 2}} for count in range(6)]
+HARVEST_TIMESTAMP = datetime(2019, 3, 10, 15)
+
+
+class TestPlanCompaction(TestCase):
+    def test_plan(self):
+        files = [('tweets-20190310150000.jsonl.gz', 40), ('tweets-20190310153000.jsonl.gz', 40),
+                 ('tweets-20190310160000.jsonl.gz', 40), ('tweets-20190310163000.jsonl.gz', 200),
+                 ('tweets-20190310170000.jsonl.gz', 30), ('tweets-20190310173000.jsonl.zst', 30),
+                 ('tweets-20190310180000.jsonl.zst', 30)]
+        self.assertEqual([['tweets-20190310150000.jsonl.gz', 'tweets-20190310153000.jsonl.gz'],
+                          ['tweets-20190310173000.jsonl.zst', 'tweets-20190310180000.jsonl.zst']],
+                         plan_compaction(reversed(files), target_bytes=100))
+
+    def test_nothing_to_compact(self):
+        self.assertEqual([], plan_compaction([('tweets-20190310150000.jsonl.gz', 40)], target_bytes=100))
+        self.assertEqual([], plan_compaction([], target_bytes=100))
+
+
+class TestCompaction(TestCase):
+    def setUp(self):
+        self.collections_path = mkdtemp()
+        self.collection_id = 'test_id'
+        self.harvest_path = get_harvest_path(self.collection_id, HARVEST_TIMESTAMP,
+                                             collections_path=self.collections_path)
+        os.makedirs(self.harvest_path)
+        sha1s = {}
+        for count, minute in enumerate(('00', '10', '20')):
+            filename = 'tweets-201903101500{}.jsonl.gz'.format(minute)
+            # The last file has no index.
+            sha1s[filename] = self.write_tweet_file(filename, TWEETS[count * 2:count * 2 + 2], index=count < 2)
+        self.write_manifest(sha1s)
+
+    def tearDown(self):
+        shutil.rmtree(self.collections_path, ignore_errors=True)
+
+    def write_tweet_file(self, filename, tweets, index=True):
+        filepath = os.path.join(self.harvest_path, filename)
+        stats = TweetStats()
+        with gzip.open(filepath, 'wb') as file:
+            for tweet in tweets:
+                file.write('{}\n'.format(json.dumps(tweet)).encode('utf-8'))
+                stats.add(tweet)
+        with open(get_stats_filepath(filepath), 'w') as file:
+            json.dump(stats.to_dict(), file)
+        if index:
+            return index_tweet_file(filepath, tweets_per_block=1)
+        with open(filepath, 'rb') as file:
+            return hashlib.sha1(file.read()).hexdigest()
+
+    def write_manifest(self, sha1s):
+        with open(os.path.join(self.harvest_path, 'manifest-sha1.txt'), 'w') as file:
+            file.write('sha1  harvester.json\n')
+            for filename, sha1 in sha1s.items():
+                file.write('{}  {}\n'.format(sha1, filename))
+
+    def test_compact(self):
+        self.assertEqual(3, compact_harvest(self.harvest_path, target_bytes=1024 * 1024))
+        filename = 'tweets-20190310150000-20190310150020.jsonl.gz'
+        filepath = os.path.join(self.harvest_path, filename)
+        self.assertEqual(sorted([filename, 'tweets-20190310150000-20190310150020.stats.json',
+                                 'tweets-20190310150000-20190310150020.idx', 'compacted_files.json',
+                                 'manifest-sha1.txt']), sorted(os.listdir(self.harvest_path)))
+        # Concatenated gzip members are read as one file.
+        with gzip.open(filepath) as file:
+            self.assertEqual(TWEETS, [json.loads(line) for line in file])
+        with open(filepath, 'rb') as file:
+            sha1 = hashlib.sha1(file.read()).hexdigest()
+        with open(os.path.join(self.harvest_path, 'manifest-sha1.txt')) as file:
+            self.assertEqual(['sha1  harvester.json', '{}  {}'.format(sha1, filename)], file.read().splitlines())
+        with open(os.path.join(self.harvest_path, 'compacted_files.json')) as file:
+            self.assertEqual({'tweets-20190310150000.jsonl.gz': filename, 'tweets-20190310150010.jsonl.gz': filename,
+                              'tweets-20190310150020.jsonl.gz': filename}, json.load(file))
+        with open(get_stats_filepath(filepath)) as file:
+            stats = json.load(file)
+        self.assertEqual(6, stats['tweets'])
+        self.assertEqual(TWEETS[0]['id'], stats['min_tweet_id'])
+        self.assertEqual(TWEETS[-1]['id'], stats['max_tweet_id'])
+        # Four single tweet blocks from the indexed files, then the file without an index as one block.
+        index = TweetFileIndex.load(get_index_filepath(filepath))
+        self.assertEqual(6, len(index.offsets))
+        self.assertEqual(os.path.getsize(filepath), index.offsets[-1])
+        reader = CollectionReader(self.collection_id, collections_path=self.collections_path)
+        self.assertEqual([TWEETS[1], TWEETS[4]], list(reader.get_tweets([TWEETS[4]['id'], TWEETS[1]['id']])))
+
+    def test_compact_without_manifest(self):
+        os.remove(os.path.join(self.harvest_path, 'manifest-sha1.txt'))
+        self.assertEqual(3, compact_harvest(self.harvest_path, target_bytes=1024 * 1024))
+        self.assertFalse(os.path.exists(os.path.join(self.harvest_path, 'manifest-sha1.txt')))
+
+    def test_compact_again(self):
+        compact_harvest(self.harvest_path, target_bytes=1024 * 1024)
+        self.write_tweet_file('tweets-20190310150030.jsonl.gz', TWEETS[:1])
+        self.assertEqual(2, compact_harvest(self.harvest_path, target_bytes=1024 * 1024))
+        filename = 'tweets-20190310150000-20190310150030.jsonl.gz'
+        with gzip.open(os.path.join(self.harvest_path, filename)) as file:
+            self.assertEqual(TWEETS + TWEETS[:1], [json.loads(line) for line in file])
+        with open(os.path.join(self.harvest_path, 'compacted_files.json')) as file:
+            compaction_map = json.load(file)
+        # The original files and the first compacted file all map to the new file.
+        self.assertEqual(5, len(compaction_map))
+        self.assertEqual({filename}, set(compaction_map.values()))
+
+    def test_compact_collection_skips_locked(self):
+        with open(get_lock_file(self.collection_id, collections_path=self.collections_path), 'w') as file:
+            json.dump({'harvest_id': HARVEST_TIMESTAMP.isoformat()}, file)
+        skip_harvest_path = locked_harvest_path(self.collection_id, collections_path=self.collections_path)
+        self.assertEqual(self.harvest_path, skip_harvest_path)
+        self.assertEqual(0, compact_collection(self.collection_id, collections_path=self.collections_path,
+                                               target_bytes=1024 * 1024, skip_harvest_path=skip_harvest_path))
+        self.assertEqual(3, compact_collection(self.collection_id, collections_path=self.collections_path,
+                                               target_bytes=1024 * 1024))
+
+    @mock_aws
+    def test_compact_s3(self):
+        client = create_test_bucket()
+        for filename in os.listdir(self.harvest_path):
+            client.upload_file(os.path.join(self.harvest_path, filename), 'test-bucket',
+                               '{}/{}'.format(get_harvest_path(self.collection_id, HARVEST_TIMESTAMP), filename))
+        self.assertIsNone(locked_harvest_path(self.collection_id, bucket='test-bucket'))
+        self.assertEqual(3, compact_collection(self.collection_id, bucket='test-bucket', target_bytes=1024 * 1024))
+        harvest_path = get_harvest_path(self.collection_id, HARVEST_TIMESTAMP)
+        keys = sorted(obj['Key'][len(harvest_path) + 1:]
+                      for obj in client.list_objects_v2(Bucket='test-bucket')['Contents'])
+        self.assertEqual(['compacted_files.json', 'manifest-sha1.txt', 'tweets-20190310150000-20190310150020.idx',
+                          'tweets-20190310150000-20190310150020.jsonl.gz',
+                          'tweets-20190310150000-20190310150020.stats.json'], keys)
+        key = '{}/tweets-20190310150000-20190310150020.jsonl.gz'.format(harvest_path)
+        self.assertTrue(client.head_object(Bucket='test-bucket', Key=key)['Metadata']['sha1'])
+        self.assertEqual(TWEETS, [json.loads(line) for line in gzip.decompress(
+            client.get_object(Bucket='test-bucket', Key=key)['Body'].read()).splitlines()])
+
+    @mock_aws
+    def test_compact_s3_without_manifest(self):
+        os.remove(os.path.join(self.harvest_path, 'manifest-sha1.txt'))
+        client = create_test_bucket()
+        upload_collections(client, self.collections_path)
+        self.assertEqual(3, compact_collection(self.collection_id, bucket='test-bucket', target_bytes=1024 * 1024))
+        harvest_path = get_harvest_path(self.collection_id, HARVEST_TIMESTAMP)
+        keys = [obj['Key'][len(harvest_path) + 1:] for obj in client.list_objects_v2(Bucket='test-bucket')['Contents']]
+        self.assertIn('compacted_files.json', keys)
+        self.assertNotIn('manifest-sha1.txt', keys)
@@ -0,0 +1,131 @@
+from tempfile import mkdtemp
+from io import BytesIO
+import gzip
+import os
+import shutil
+import struct
+import zlib
+from twarccloud.compression import get_codec, get_codec_for_filepath, open_tweet_file, benchmark, ParallelGzipFile, \
+    BGZF_EOF
+from tests import TestCase
+
+SAMPLE = b''.join('{{"id": {0}, "text": "Tweet number {0}"}}\n'.format(i).encode('utf-8') for i in range(1000))
+
+
+class TestCompression(TestCase):
+    def setUp(self):
+        self.path = mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def test_get_codec(self):
+        self.assertEqual('gzip:9', str(get_codec()))
+        self.assertEqual('gzip:6', str(get_codec('gzip:6')))
+        self.assertEqual('zstd:3', str(get_codec('zstd')))
+        self.assertEqual('zstd:19', str(get_codec('zstd:19')))
+
+    def test_invalid_codec(self):
+        with self.assertRaises(ValueError):
+            get_codec('lzma')
+        with self.assertRaises(ValueError):
+            get_codec('gzip:10')
+        with self.assertRaises(ValueError):
+            get_codec('zstd:fast')
+
+    def test_round_trip(self):
+        for codec_spec in ('gzip:1', 'pgzip:6', 'bgzf:6', 'zstd:3'):
+            codec = get_codec(codec_spec)
+            filepath = os.path.join(self.path, 'tweets.jsonl{}'.format(codec.extension))
+            with open(filepath, 'wb') as file:
+                with codec.open(file) as compressed_file:
+                    compressed_file.write(SAMPLE)
+                # Closing the compressed file does not close the underlying file.
+                self.assertFalse(file.closed)
+            self.assertEqual(codec.extension, get_codec_for_filepath(filepath).extension)
+            with open_tweet_file(filepath) as file:
+                self.assertEqual(SAMPLE, file.read())
+
+    def test_end_block(self):
+        for codec_spec in ('gzip:1', 'pgzip:6', 'bgzf:6', 'zstd:3'):
+            codec = get_codec(codec_spec, threads=2)
+            compressed = BytesIO()
+            compressed_file = codec.open(compressed)
+            compressed_file.write(SAMPLE)
+            codec.end_block(compressed_file)
+            offset = len(compressed.getvalue())
+            # Only gzip has to be reopened. The others keep the same stream and its threads.
+            self.assertEqual(codec.name == 'gzip', compressed_file.closed)
+            if compressed_file.closed:
+                compressed_file = codec.open(compressed)
+            compressed_file.write(SAMPLE)
+            compressed_file.close()
+            # The second block can be decompressed on its own.
+            self.assertEqual(SAMPLE, codec.open_reader(BytesIO(compressed.getvalue()[offset:])).read())
+            self.assertEqual(SAMPLE * 2, codec.open_reader(BytesIO(compressed.getvalue())).read())
+
+    def test_get_codec_for_unknown_filepath(self):
+        with self.assertRaises(ValueError):
+            get_codec_for_filepath('tweets.jsonl.bz2')
+
+    def test_benchmark(self):
+        results = benchmark(SAMPLE, ['gzip:1', 'zstd:3'])
+        self.assertEqual(['gzip:1', 'zstd:3'], [codec for codec, _, _ in results])
+        for _, mb_per_sec, ratio in results:
+            self.assertTrue(mb_per_sec > 0)
+            self.assertTrue(ratio > 1)
+
+
+    def test_parallel_gzip(self):
+        compressed = BytesIO()
+        with ParallelGzipFile(compressed, threads=2, block_size=1000) as file:
+            for i in range(0, len(SAMPLE), 700):
+                file.write(SAMPLE[i:i + 700])
+        self.assertFalse(compressed.closed)
+        self.assertEqual(SAMPLE, gzip.decompress(compressed.getvalue()))
+        # Independent members, one per block.
+        self.assertEqual(-(-len(SAMPLE) // 1000), self.count_members(compressed.getvalue()))
+
+    def test_parallel_gzip_flush(self):
+        compressed = BytesIO()
+        with ParallelGzipFile(compressed, threads=2) as file:
+            file.write(SAMPLE)
+            file.flush()
+            # Everything written so far is readable.
+            self.assertEqual(SAMPLE, gzip.decompress(compressed.getvalue()))
+            file.write(SAMPLE)
+        self.assertEqual(SAMPLE + SAMPLE, gzip.decompress(compressed.getvalue()))
+
+    def test_bgzf(self):
+        sample = SAMPLE * 10
+        compressed = BytesIO()
+        with ParallelGzipFile(compressed, threads=2, bgzf=True) as file:
+            file.write(sample)
+        data = compressed.getvalue()
+        self.assertEqual(sample, gzip.decompress(data))
+        self.assertTrue(data.endswith(BGZF_EOF))
+        # Every block has a BC subfield with the block size.
+        offset = 0
+        while offset < len(data):
+            self.assertEqual(b'\x1f\x8b\x08\x04', data[offset:offset + 4])
+            self.assertEqual(b'BC', data[offset + 12:offset + 14])
+            block_size = struct.unpack('<H', data[offset + 16:offset + 18])[0] + 1
+            self.assertTrue(block_size <= 65536)
+            offset += block_size
+        self.assertEqual(len(data), offset)
+
+    def test_write_after_close(self):
+        file = ParallelGzipFile(BytesIO())
+        file.close()
+        with self.assertRaises(ValueError):
+            file.write(SAMPLE)
+
+    @staticmethod
+    def count_members(data):
+        members = 0
+        while data:
+            decompressor = zlib.decompressobj(31)
+            decompressor.decompress(data)
+            data = decompressor.unused_data
+            members += 1
+        return members
@@ -0,0 +1,18 @@
+from twarccloud.config_helpers import parse_size
+from tests import TestCase
+
+
+class TestParseSize(TestCase):
+    def test_parse_size(self):
+        self.assertEqual(1024, parse_size('1024'))
+        self.assertEqual(1024, parse_size(1024))
+        self.assertEqual(256 * 1024 * 1024, parse_size('256MB'))
+        self.assertEqual(256 * 1024 * 1024, parse_size('256 mb'))
+        self.assertEqual(512 * 1024, parse_size('0.5M'))
+        self.assertEqual(2 * 1024 ** 3, parse_size('2GiB'))
+
+    def test_invalid_size(self):
+        with self.assertRaises(ValueError):
+            parse_size('256 megabytes')
+        with self.assertRaises(ValueError):
+            parse_size('')
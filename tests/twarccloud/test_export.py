@@ -0,0 +1,150 @@
+from tempfile import mkdtemp
+from datetime import datetime
+import gzip
+import json
+import os
+import shutil
+from unittest import skipIf
+try:
+    from moto import mock_aws
+except ImportError:
+    from moto import mock_s3 as mock_aws
+from twarccloud.export import Field, export_collection, PARTITION_CREATED_HOUR
+from twarccloud.compaction import compact_harvest
+from twarccloud.filepaths_helper import get_harvest_path
+from tests import TestCase, create_test_bucket, upload_collections
+try:
+    import pyarrow.parquet
+except ImportError:
+    # pylint: disable=invalid-name
+    pyarrow = None
+
+# Created 2019-03-01 13:50 and 2019-03-10 14:02.
+TWEETS = [
+    {'id': 1101479829856149504, 'id_str': '1101479829856149504', 'created_at': 'Fri Mar 01 13:50:30 +0000 2019',
+     'text': 'Short', 'extended_tweet': {'full_text': 'Long #twarc'}, 'retweet_count': 2,
+     'user': {'id_str': '12', 'screen_name': 'jack', 'verified': True},
+     'entities': {'hashtags': [{'text': 'twarc'}, {'text': 'cloud'}]}},
+    {'id': 1104744219066998784, 'id_str': '1104744219066998784', 'created_at': 'Sun Mar 10 14:02:01 +0000 2019',
+     'text': 'Text', 'retweet_count': 0, 'user': {'id_str': '481186914', 'screen_name': 'justin_littman'},
+     'entities': {'hashtags': []}},
+    {'limit': {'track': 5}}
+]
+
+
+class TestField(TestCase):
+    def test_field(self):
+        field = Field('text=extended_tweet.full_text|text')
+        self.assertEqual('text', field.name)
+        self.assertEqual('Long #twarc', field.value(TWEETS[0]))
+        self.assertEqual('Text', field.value(TWEETS[1]))
+
+    def test_default_name(self):
+        self.assertEqual('user_screen_name', Field('user.screen_name').name)
+
+    def test_types(self):
+        self.assertEqual(2, Field('retweet_count:int64').value(TWEETS[0]))
+        self.assertEqual(datetime(2019, 3, 1, 13, 50, 30), Field('created_at:timestamp').value(TWEETS[0]))
+        self.assertEqual(['twarc', 'cloud'], Field('entities.hashtags.text:list').value(TWEETS[0]))
+        self.assertIsNone(Field('entities.hashtags.text:list').value(TWEETS[1]))
+        self.assertEqual('{"full_text": "Long #twarc"}', Field('extended_tweet').value(TWEETS[0]))
+        self.assertIsNone(Field('user.verified:bool').value(TWEETS[1]))
+
+    def test_coerce(self):
+        tweet = {'count': '12', 'ratio': 2, 'verified': 'true', 'big': 2 ** 64, 'created_at': 'yesterday',
+                 'bad': {'count': 1}}
+        self.assertEqual(12, Field('count:int64').value(tweet))
+        self.assertEqual(2.0, Field('ratio:float64').value(tweet))
+        self.assertIs(True, Field('verified:bool').value(tweet))
+        # Values that don't convert are None.
+        self.assertIsNone(Field('verified:int64').value(tweet))
+        self.assertIsNone(Field('big:int64').value(tweet))
+        self.assertIsNone(Field('bad:float64').value(tweet))
+        self.assertIsNone(Field('count:bool').value(tweet))
+        self.assertIsNone(Field('created_at:timestamp').value(tweet))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            Field('text:str')
+        with self.assertRaises(ValueError):
+            Field('user["id"]')
+
+
+@skipIf(pyarrow is None, 'pyarrow not installed')
+class TestExport(TestCase):
+    def setUp(self):
+        self.collections_path = mkdtemp()
+        self.output_path = mkdtemp()
+        self.collection_id = 'test_id'
+        for harvest_timestamp, tweets in ((datetime(2019, 3, 10, 15), TWEETS), (datetime(2019, 3, 11), TWEETS[1:2])):
+            harvest_path = get_harvest_path(self.collection_id, harvest_timestamp,
+                                            collections_path=self.collections_path)
+            os.makedirs(harvest_path)
+            with gzip.open('{}/tweets-{}.jsonl.gz'.format(harvest_path, harvest_timestamp.strftime('%Y%m%d%H%M%S')),
+                           'wb') as file:
+                for tweet in tweets:
+                    file.write('{}\n'.format(json.dumps(tweet)).encode('utf-8'))
+
+    def tearDown(self):
+        shutil.rmtree(self.collections_path, ignore_errors=True)
+        shutil.rmtree(self.output_path, ignore_errors=True)
+
+    def test_export(self):
+        stats = export_collection(self.collection_id, self.output_path, collections_path=self.collections_path,
+                                  workers=2)
+        self.assertEqual(2, stats.files)
+        self.assertEqual(3, stats.tweets)
+        self.assertEqual(['harvest_date=2019-03-10', 'harvest_date=2019-03-11'], sorted(os.listdir(self.output_path)))
+        table = pyarrow.parquet.read_table(
+            os.path.join(self.output_path, 'harvest_date=2019-03-10', 'tweets-20190310150000.parquet'))
+        self.assertEqual(20, table.num_columns)
+        rows = table.to_pylist()
+        self.assertEqual(2, len(rows))
+        self.assertEqual('1101479829856149504', rows[0]['id'])
+        self.assertEqual(datetime(2019, 3, 1, 13, 50, 30), rows[0]['created_at'])
+        self.assertEqual('Long #twarc', rows[0]['text'])
+        self.assertEqual(['twarc', 'cloud'], rows[0]['hashtags'])
+        self.assertTrue(rows[0]['user_verified'])
+        self.assertIsNone(rows[1]['hashtags'])
+
+    def test_export_by_created_hour(self):
+        export_collection(self.collection_id, self.output_path, collections_path=self.collections_path,
+                          fields=['id=id_str', 'retweet_count:int64'], partition=PARTITION_CREATED_HOUR, workers=1,
+                          batch_size=1)
+        self.assertEqual(['created_hour=2019-03-01T13', 'created_hour=2019-03-10T14'],
+                         sorted(os.listdir(self.output_path)))
+        self.assertEqual(['tweets-20190310150000.parquet', 'tweets-20190311000000.parquet'],
+                         sorted(os.listdir(os.path.join(self.output_path, 'created_hour=2019-03-10T14'))))
+        table = pyarrow.parquet.read_table(os.path.join(self.output_path, 'created_hour=2019-03-01T13'))
+        self.assertEqual([{'id': '1101479829856149504', 'retweet_count': 2}], table.to_pylist())
+
+    def test_export_after_compaction(self):
+        harvest_path = get_harvest_path(self.collection_id, datetime(2019, 3, 10, 15),
+                                        collections_path=self.collections_path)
+        with gzip.open('{}/tweets-20190310150500.jsonl.gz'.format(harvest_path), 'wb') as file:
+            file.write('{}\n'.format(json.dumps(TWEETS[1])).encode('utf-8'))
+        export_collection(self.collection_id, self.output_path, collections_path=self.collections_path, workers=1)
+        self.assertEqual(2, compact_harvest(harvest_path, target_bytes=1024 * 1024))
+
+        stats = export_collection(self.collection_id, self.output_path, collections_path=self.collections_path,
+                                  workers=1)
+        self.assertEqual(4, stats.tweets)
+        # The exports of the compacted files are replaced by the export of the file they were compacted into.
+        self.assertEqual(['tweets-20190310150000-20190310150500.parquet'],
+                         os.listdir(os.path.join(self.output_path, 'harvest_date=2019-03-10')))
+        table = pyarrow.parquet.read_table(os.path.join(self.output_path, 'harvest_date=2019-03-10'))
+        self.assertEqual(3, table.num_rows)
+
+    def test_unknown_partition(self):
+        with self.assertRaises(ValueError):
+            export_collection(self.collection_id, self.output_path, collections_path=self.collections_path,
+                              partition='month')
+
+    @mock_aws
+    def test_export_from_s3(self):
+        client = create_test_bucket()
+        upload_collections(client, self.collections_path)
+        # Moto only mocks this process.
+        stats = export_collection(self.collection_id, self.output_path, bucket='test-bucket', workers=1)
+        self.assertEqual(3, stats.tweets)
+        self.assertEqual(['harvest_date=2019-03-10', 'harvest_date=2019-03-11'], sorted(os.listdir(self.output_path)))
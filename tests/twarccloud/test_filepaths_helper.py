@@ -0,0 +1,35 @@
+from datetime import datetime
+from twarccloud.filepaths_helper import get_harvest_prefixes
+from tests import TestCase
+
+
+class TestHarvestPrefixes(TestCase):
+    def test_whole_months(self):
+        self.assertEqual(['collections/test_id/harvests/2019/03/', 'collections/test_id/harvests/2019/04/'],
+                         get_harvest_prefixes('test_id', datetime(2019, 3, 1), datetime(2019, 5, 1)))
+
+    def test_whole_year(self):
+        self.assertEqual(['collections/test_id/harvests/2019/'],
+                         get_harvest_prefixes('test_id', datetime(2019, 1, 1), datetime(2020, 1, 1)))
+
+    def test_partial_units(self):
+        self.assertEqual(['test/test_id/harvests/2018/12/31/23/59/58/',
+                          'test/test_id/harvests/2018/12/31/23/59/59/',
+                          'test/test_id/harvests/2019/',
+                          'test/test_id/harvests/2020/01/01/00/00/',
+                          'test/test_id/harvests/2020/01/01/00/01/00/'],
+                         get_harvest_prefixes('test_id', datetime(2018, 12, 31, 23, 59, 58),
+                                              datetime(2020, 1, 1, 0, 1, 0, 500), collections_path='test'))
+
+    def test_empty_range(self):
+        self.assertEqual([], get_harvest_prefixes('test_id', datetime(2019, 3, 1), datetime(2019, 3, 1)))
+
+    def test_covers_range(self):
+        since = datetime(2019, 2, 27, 13, 7, 11)
+        until = datetime(2019, 3, 2, 2, 0, 0)
+        prefixes = get_harvest_prefixes('test_id', since, until)
+        for timestamp, expected in ((datetime(2019, 2, 27, 13, 7, 10), False), (since, True),
+                                    (datetime(2019, 2, 28, 23, 59, 59), True), (datetime(2019, 3, 2, 1, 59, 59), True),
+                                    (until, False)):
+            path = 'collections/test_id/harvests/{}/'.format(timestamp.strftime('%Y/%m/%d/%H/%M/%S'))
+            self.assertEqual(expected, any(path.startswith(prefix) for prefix in prefixes))
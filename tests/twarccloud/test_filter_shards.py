@@ -0,0 +1,30 @@
+from twarccloud.filter_shards import split_filter, TRACK_LIMIT, FOLLOW_LIMIT
+from tests import TestCase
+
+
+class TestFilterShards(TestCase):
+    def test_within_limits(self):
+        filter_config = {'track': 'foo,#bar', 'max_records': 10}
+        self.assertEqual([{'track': 'foo,#bar', 'follow': None, 'locations': None}], split_filter(filter_config))
+
+    def test_split_track(self):
+        terms = ['term{}'.format(term) for term in range(TRACK_LIMIT + 1)]
+        shards = split_filter({'track': ','.join(terms), 'follow': '1,2,3'})
+        self.assertEqual(2, len(shards))
+        self.assertEqual(terms, sorted(shards[0]['track'].split(',') + shards[1]['track'].split(','),
+                                       key=lambda term: int(term[4:])))
+        self.assertEqual('1,3', shards[0]['follow'])
+        self.assertEqual('2', shards[1]['follow'])
+
+    def test_split_follow(self):
+        shards = split_filter({'follow': [str(user_id) for user_id in range(FOLLOW_LIMIT * 2 + 1)]})
+        self.assertEqual(3, len(shards))
+        self.assertTrue(all(len(shard['follow'].split(',')) <= FOLLOW_LIMIT for shard in shards))
+        self.assertIsNone(shards[0]['track'])
+
+    def test_split_locations(self):
+        box = '-74,40,-73,41'
+        shards = split_filter({'locations': ','.join([box] * 26)})
+        self.assertEqual(2, len(shards))
+        self.assertEqual(','.join([box] * 13), shards[0]['locations'])
+        self.assertEqual(','.join([box] * 13), shards[1]['locations'])
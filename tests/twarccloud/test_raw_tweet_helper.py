@@ -0,0 +1,59 @@
+import json
+from twarccloud.raw_tweet_helper import extract_id, extract_user_id, split_json_array, tweet_timestamp, \
+    timestamp_tweet_id
+from tests import TestCase
+
+
+class TestRawTweetHelper(TestCase):
+    def test_extract_id(self):
+        raw_tweet = b'{"created_at":"Wed Oct 10 20:19:24 +0000 2018","id":1050118621198921728,' \
+                    b'"user":{"id":6253282}}'
+        self.assertEqual(1050118621198921728, extract_id(raw_tweet))
+
+    def test_extract_id_after_nested(self):
+        raw_tweet = b'{"user":{"id":6253282},"text":"{\\"id\\":5}","id":1050118621198921728}'
+        self.assertEqual(1050118621198921728, extract_id(raw_tweet))
+
+    def test_extract_user_id(self):
+        raw_tweet = b'{"id":1050118621198921728,"entities":{"user_mentions":[{"id":12}]},' \
+                    b'"user":{"id":6253282},"retweeted_status":{"user":{"id":481186914}}}'
+        self.assertEqual(6253282, extract_user_id(raw_tweet))
+
+    def test_extract_user_id_after_nested(self):
+        raw_tweet = b'{"quoted_status":{"user":{"id":481186914}},"user":{"id":6253282}}'
+        self.assertEqual(6253282, extract_user_id(raw_tweet))
+
+    def test_extract_user_id_with_brace_in_text(self):
+        # Braces and escaped quotes in strings are not counted.
+        raw_tweet = json.dumps({'id': 1050118621198921728, 'text': 'RT }} {"user": ', 'user': {'id': 111},
+                                'retweeted_status': {'user': {'id': 222}}}).encode('utf-8')
+        self.assertEqual(111, extract_user_id(raw_tweet))
+        raw_tweet = json.dumps({'id': 1050118621198921728, 'text': '\\} user', 'user': {'id': 111},
+                                'quoted_status': {'user': {'id': 222}}}).encode('utf-8')
+        self.assertEqual(111, extract_user_id(raw_tweet))
+
+    def test_extract_id_with_brace_in_text(self):
+        raw_tweet = json.dumps({'text': 'RT } {"id": 5', 'retweeted_status': {'id': 5},
+                                'id': 1050118621198921728}).encode('utf-8')
+        self.assertEqual(1050118621198921728, extract_id(raw_tweet))
+
+    def test_split_json_array(self):
+        tweets = [{'id': 1, 'text': 'café ] } \\" ['}, {'id': 2, 'entities': {'urls': []}}]
+        raw = json.dumps({'statuses': tweets}, ensure_ascii=False).encode('utf-8')
+        raw_tweets = list(split_json_array(raw, raw.index(b'[')))
+        self.assertEqual([json.dumps(tweet, ensure_ascii=False).encode('utf-8') for tweet in tweets], raw_tweets)
+
+    def test_split_empty_json_array(self):
+        self.assertFalse(list(split_json_array(b' [ ] ')))
+
+    def test_split_invalid_json_array(self):
+        with self.assertRaises(ValueError):
+            list(split_json_array(b'{"id": 1}'))
+        with self.assertRaises(ValueError):
+            list(split_json_array(b'[{"id": 1}'))
+
+    def test_tweet_timestamp(self):
+        # 2019-03-01T13:50:30Z
+        self.assertEqual(1551448230, tweet_timestamp('1101479829856149504'))
+        self.assertEqual(1551448230, tweet_timestamp(timestamp_tweet_id(1551448230)))
+        self.assertLess(timestamp_tweet_id(1551448230), 1101479829856149504)
@@ -0,0 +1,120 @@
+from tempfile import mkdtemp
+from datetime import datetime
+from io import BytesIO
+import json
+import shutil
+try:
+    from moto import mock_aws
+except ImportError:
+    from moto import mock_s3 as mock_aws
+from twarccloud.scan import Expression, ScanPredicate, scan_collection
+from tests import TestCase, create_test_bucket, upload_collections, write_tweet_file
+
+# Created 2019-03-01 and 2019-03-10.
+TWEETS = [
+    {'id': 1101479829856149504, 'text': 'Hello twarc', 'lang': 'en',
+     'user': {'id': 12, 'id_str': '12', 'followers_count': 50},
+     'entities': {'hashtags': [{'text': 'Cloud'}]}},
+    {'id': 1101479829856149505, 'text': 'Hola', 'extended_tweet': {'full_text': 'Hola mundo'}, 'lang': 'es',
+     'user': {'id': 12, 'id_str': '12', 'followers_count': 50}, 'entities': {'hashtags': []}},
+    {'id': 1104744219066998784, 'text': 'Bonjour', 'lang': 'fr',
+     'user': {'id': 481186914, 'id_str': '481186914', 'followers_count': 5000}, 'entities': {'hashtags': []}},
+    {'limit': {'track': 5}}
+]
+
+
+class TestExpression(TestCase):
+    def test_matches(self):
+        self.assertTrue(Expression('lang=en').matches(TWEETS[0]))
+        self.assertFalse(Expression('lang!=en').matches(TWEETS[0]))
+        self.assertTrue(Expression('user.followers_count>1000').matches(TWEETS[2]))
+        self.assertFalse(Expression('user.followers_count>=1000').matches(TWEETS[0]))
+        self.assertTrue(Expression('user.followers_count < 1000').matches(TWEETS[0]))
+        self.assertTrue(Expression('entities.hashtags.text~cloud').matches(TWEETS[0]))
+        self.assertFalse(Expression('entities.hashtags.text~cloud').matches(TWEETS[1]))
+        self.assertFalse(Expression('place.full_name=Paris').matches(TWEETS[0]))
+        self.assertTrue(Expression('place.full_name!=Paris').matches(TWEETS[0]))
+        # Compared as strings
+        self.assertTrue(Expression('lang>de').matches(TWEETS[0]))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            Expression('lang')
+
+
+class TestScanPredicate(TestCase):
+    def test_keywords(self):
+        predicate = ScanPredicate(keywords=['MUNDO', 'twarc'])
+        self.assertEqual([TWEETS[0], TWEETS[1]], self.matches(predicate))
+
+    def test_hashtags(self):
+        self.assertEqual([TWEETS[0]], self.matches(ScanPredicate(hashtags=['#cloud'])))
+
+    def test_user_ids(self):
+        self.assertEqual([TWEETS[2]], self.matches(ScanPredicate(user_ids=[481186914])))
+
+    def test_since_until(self):
+        self.assertEqual([TWEETS[2]], self.matches(ScanPredicate(since=datetime(2019, 3, 5))))
+        self.assertEqual(TWEETS[:2], self.matches(ScanPredicate(until=datetime(2019, 3, 5))))
+
+    def test_all(self):
+        predicate = ScanPredicate(user_ids=['12'], expressions=['lang=es'])
+        self.assertEqual([TWEETS[1]], self.matches(predicate))
+
+    def test_none(self):
+        self.assertEqual(TWEETS[:3], self.matches(ScanPredicate()))
+
+    @staticmethod
+    def matches(predicate):
+        matches = []
+        for tweet in TWEETS:
+            line = json.dumps(tweet).encode('utf-8')
+            if predicate.may_match_raw(line) and predicate.matches(tweet):
+                matches.append(tweet)
+        return matches
+
+
+class TestScanCollection(TestCase):
+    def setUp(self):
+        self.collections_path = mkdtemp()
+        self.collection_id = 'test_id'
+        self.write_tweet_file(datetime(2019, 3, 1), TWEETS[:2] + TWEETS[3:])
+        self.write_tweet_file(datetime(2019, 3, 10), TWEETS[2:3])
+        # A file without a sidecar.
+        self.write_tweet_file(datetime(2019, 3, 11), TWEETS[:1], stats=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.collections_path, ignore_errors=True)
+
+    def write_tweet_file(self, harvest_timestamp, tweets, stats=True):
+        return write_tweet_file(self.collection_id, harvest_timestamp, tweets, self.collections_path, stats=stats)
+
+    def test_scan(self):
+        output_file = BytesIO()
+        stats = scan_collection(self.collection_id, output_file, ScanPredicate(user_ids=['12']),
+                                collections_path=self.collections_path, workers=2)
+        self.assertEqual([TWEETS[0], TWEETS[1], TWEETS[0]],
+                         [json.loads(line) for line in output_file.getvalue().splitlines()])
+        self.assertEqual(3, stats.files)
+        # Skipped by its sidecar.
+        self.assertEqual(1, stats.skipped)
+        self.assertEqual(3, stats.matches)
+
+    def test_scan_unordered(self):
+        output_file = BytesIO()
+        stats = scan_collection(self.collection_id, output_file, ScanPredicate(keywords=['bonjour', 'twarc']),
+                                collections_path=self.collections_path, workers=2, ordered=False)
+        self.assertEqual(3, stats.matches)
+        self.assertCountEqual([TWEETS[0], TWEETS[2], TWEETS[0]],
+                              [json.loads(line) for line in output_file.getvalue().splitlines()])
+
+    @mock_aws
+    def test_scan_from_s3(self):
+        client = create_test_bucket()
+        upload_collections(client, self.collections_path)
+        output_file = BytesIO()
+        # Moto only mocks this process.
+        stats = scan_collection(self.collection_id, output_file, ScanPredicate(since=datetime(2019, 3, 5)),
+                                bucket='test-bucket', workers=1)
+        self.assertEqual([TWEETS[2]], [json.loads(line) for line in output_file.getvalue().splitlines()])
+        self.assertEqual(1, stats.skipped)
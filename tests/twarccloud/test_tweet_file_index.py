@@ -0,0 +1,130 @@
+from tempfile import mkdtemp
+from io import BytesIO
+import gzip
+import hashlib
+import json
+import os
+import shutil
+try:
+    from moto import mock_aws
+except ImportError:
+    from moto import mock_s3 as mock_aws
+import zstandard
+from twarccloud.tweet_file_index import TweetFileIndex, get_index_filepath, index_tweet_file, update_manifest, \
+    backfill_indexes
+from twarccloud.compression import open_tweet_file, ZstdCodec
+from tests import TestCase, create_test_bucket
+
+TWEETS = [{'id': tweet_id, 'text': 'Tweet {}'.format(tweet_id)} for tweet_id in (50, 10, 40, 20, 30)]
+
+
+class TestTweetFileIndex(TestCase):
+    def setUp(self):
+        self.path = mkdtemp()
+        self.harvest_path = os.path.join(self.path, 'test_id', 'harvests', '2019', '03', '10')
+        os.makedirs(self.harvest_path)
+        self.filepath = os.path.join(self.harvest_path, 'tweets-20190310140201.jsonl.gz')
+        with gzip.open(self.filepath, 'wb') as file:
+            for tweet in TWEETS:
+                file.write('{}\n'.format(json.dumps(tweet)).encode('utf-8'))
+            file.write(b'{"limit": {"track": 5}}\n')
+        self.manifest_filepath = os.path.join(self.harvest_path, 'manifest-sha1.txt')
+        with open(self.manifest_filepath, 'w') as file:
+            file.write('abc  {}\n'.format(os.path.basename(self.filepath)))
+            file.write('def  tweets-20190310150201.jsonl.gz\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def test_get_index_filepath(self):
+        self.assertEqual('/tweets-20190310140201.idx', get_index_filepath('/tweets-20190310140201.jsonl.gz'))
+        self.assertEqual('/tweets-20190310140201.idx', get_index_filepath('/tweets-20190310140201.jsonl.zst'))
+
+    def test_find(self):
+        index = TweetFileIndex()
+        index.add({'id': 20})
+        index.add(b'{"id": 10}')
+        # Not a tweet
+        index.add({'limit': {'track': 5}})
+        index.end_block(100)
+        index.add({'id': 30})
+        index.add({'id': 10})
+        index.end_block(150)
+        index = TweetFileIndex.from_bytes(index.to_bytes())
+        self.assertEqual([10, 10, 20, 30], list(index.tweet_ids))
+        self.assertEqual([(0, 100), (100, 150)], index.find([10]))
+        self.assertEqual([(100, 150)], index.find([30, 40]))
+        self.assertEqual([], index.find([5, 35]))
+
+    def test_from_bytes_not_index(self):
+        with self.assertRaises(ValueError):
+            TweetFileIndex.from_bytes(b'{}')
+
+    def test_index_tweet_file(self):
+        sha1 = index_tweet_file(self.filepath, tweets_per_block=2)
+        with open(self.filepath, 'rb') as file:
+            self.assertEqual(hashlib.sha1(file.read()).hexdigest(), sha1)
+        # Tweets unchanged.
+        with open_tweet_file(self.filepath) as file:
+            self.assertEqual(TWEETS, [json.loads(line) for line in file][:-1])
+        index = TweetFileIndex.load(get_index_filepath(self.filepath))
+        self.assertEqual(4, len(index.offsets))
+        (start, end), = index.find([20])
+        with open(self.filepath, 'rb') as file:
+            file.seek(start)
+            self.assertEqual(TWEETS[2:4], [json.loads(line) for line in
+                                           gzip.decompress(file.read(end - start)).splitlines()])
+
+    def test_index_zstd_tweet_file(self):
+        filepath = self.filepath.replace('.gz', '.zst')
+        with open(filepath, 'wb') as file:
+            file.write(zstandard.ZstdCompressor().compress(
+                b''.join('{}\n'.format(json.dumps(tweet)).encode('utf-8') for tweet in TWEETS)))
+        index_tweet_file(filepath, tweets_per_block=2)
+        index = TweetFileIndex.load(get_index_filepath(filepath))
+        (start, end), = index.find([30])
+        with open(filepath, 'rb') as file:
+            file.seek(start)
+            with ZstdCodec.open_reader(BytesIO(file.read(end - start))) as block:
+                self.assertEqual(TWEETS[4:], [json.loads(line) for line in block])
+
+    def test_update_manifest(self):
+        update_manifest(self.manifest_filepath, {'tweets-20190310150201.jsonl.gz': 'ghi'})
+        with open(self.manifest_filepath) as file:
+            self.assertEqual('abc  tweets-20190310140201.jsonl.gz\nghi  tweets-20190310150201.jsonl.gz\n',
+                             file.read())
+
+    def test_backfill_indexes(self):
+        self.assertEqual(1, backfill_indexes([self.filepath], tweets_per_block=2))
+        self.assertTrue(os.path.exists(get_index_filepath(self.filepath)))
+        self.assertManifestSha1()
+        # Already indexed.
+        self.assertEqual(0, backfill_indexes([self.filepath]))
+
+    @mock_aws
+    def test_backfill_indexes_from_s3(self):
+        client = create_test_bucket()
+        key = 'collections/test_id/harvests/2019/03/10/tweets-20190310140201.jsonl.gz'
+        manifest_key = 'collections/test_id/harvests/2019/03/10/manifest-sha1.txt'
+        client.upload_file(self.filepath, 'test-bucket', key)
+        client.upload_file(self.manifest_filepath, 'test-bucket', manifest_key)
+
+        self.assertEqual(1, backfill_indexes([key], bucket='test-bucket', tweets_per_block=2))
+        client.download_file('test-bucket', key, self.filepath)
+        client.download_file('test-bucket', manifest_key, self.manifest_filepath)
+        self.assertManifestSha1()
+        self.assertEqual(self.get_sha1(),
+                         client.head_object(Bucket='test-bucket', Key=key)['Metadata']['sha1'])
+        index = TweetFileIndex.from_bytes(
+            client.get_object(Bucket='test-bucket', Key=get_index_filepath(key))['Body'].read())
+        self.assertEqual(4, len(index.offsets))
+        self.assertEqual(0, backfill_indexes([key], bucket='test-bucket'))
+
+    # pylint: disable=invalid-name
+    def assertManifestSha1(self):
+        with open(self.manifest_filepath) as file:
+            self.assertEqual('{}  tweets-20190310140201.jsonl.gz'.format(self.get_sha1()), file.readline().strip())
+
+    def get_sha1(self):
+        with open(self.filepath, 'rb') as file:
+            return hashlib.sha1(file.read()).hexdigest()
@@ -0,0 +1,71 @@
+from tempfile import mkdtemp
+import os
+import shutil
+from twarccloud.tweet_index import TweetIndex
+from tests import TestCase
+
+
+class TestTweetIndex(TestCase):
+    def setUp(self):
+        self.path = os.path.join(mkdtemp(), 'tweet_index')
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.path), ignore_errors=True)
+
+    def test_add(self):
+        tweet_index = TweetIndex(self.path)
+        self.assertTrue(tweet_index.add(5))
+        self.assertFalse(tweet_index.add('5'))
+        self.assertTrue(5 in tweet_index)
+        self.assertFalse(6 in tweet_index)
+        self.assertEqual(1, len(tweet_index))
+
+    def test_take_new_ids(self):
+        tweet_index = TweetIndex(self.path)
+        tweet_index.add(5)
+        self.assertEqual({5}, tweet_index.take_new_ids())
+        self.assertEqual(set(), tweet_index.new_ids)
+        # Still looked up until written.
+        self.assertFalse(tweet_index.add(5))
+        self.assertEqual(1, len(tweet_index))
+        self.assertEqual(set(), tweet_index.take_new_ids())
+        self.assertEqual((None, []), tweet_index.write_segment(set()))
+
+    def test_write_segment(self):
+        tweet_index = TweetIndex(self.path)
+        for tweet_id in (30, 10, 20, 40):
+            tweet_index.add(tweet_id)
+        filepath, merged_filepaths = tweet_index.write_segment(tweet_index.take_new_ids())
+        self.assertEqual(os.path.join(self.path, '0000000001.bin'), filepath)
+        self.assertEqual([], merged_filepaths)
+        self.assertEqual(32, os.path.getsize(filepath))
+
+        # Less than half the size of the segment before, so not merged.
+        tweet_index.add(35)
+        filepath, merged_filepaths = tweet_index.write_segment(tweet_index.take_new_ids())
+        self.assertEqual(os.path.join(self.path, '0000000002.bin'), filepath)
+        self.assertEqual([], merged_filepaths)
+
+        # Merged with both segments before.
+        for tweet_id in (5, 15, 1101479829856149504):
+            tweet_index.add(tweet_id)
+        self.assertFalse(tweet_index.add(20))
+        filepath, merged_filepaths = tweet_index.write_segment(tweet_index.take_new_ids())
+        self.assertEqual(os.path.join(self.path, '0000000003.bin'), filepath)
+        self.assertEqual([os.path.join(self.path, '0000000001.bin'), os.path.join(self.path, '0000000002.bin')],
+                         merged_filepaths)
+        self.assertEqual(1, len(tweet_index.segments))
+        tweet_index.close()
+        for merged_filepath in merged_filepaths:
+            os.remove(merged_filepath)
+
+        tweet_index = TweetIndex(self.path)
+        self.assertEqual(8, len(tweet_index))
+        self.assertEqual([5, 10, 15, 20, 30, 35, 40, 1101479829856149504], list(tweet_index.segments[0].ids))
+        self.assertFalse(tweet_index.add(15))
+        self.assertFalse(tweet_index.add(1101479829856149504))
+        self.assertTrue(tweet_index.add(25))
+        # Numbered after the existing segments.
+        filepath, _ = tweet_index.write_segment(tweet_index.take_new_ids())
+        self.assertEqual(os.path.join(self.path, '0000000004.bin'), filepath)
+        tweet_index.close()
@@ -0,0 +1,38 @@
+from datetime import datetime
+from twarccloud.tweet_stats import TweetStats, get_stats_filepath, may_match
+from tests import TestCase
+
+
+class TestTweetStats(TestCase):
+    def setUp(self):
+        self.tweet_stats = TweetStats()
+        # Created 2019-03-01T13:50:30 and 2019-03-10T14:02:01.
+        self.tweet_stats.add({'id': 1101479829856149504, 'user': {'id': 12}})
+        self.tweet_stats.add(b'{"id":1104744219066998784,"user":{"id":481186914}}')
+        self.tweet_stats.add({'limit': {'track': 5}})
+        self.stats = self.tweet_stats.to_dict()
+
+    def test_to_dict(self):
+        self.assertEqual(3, self.stats['tweets'])
+        self.assertEqual(1101479829856149504, self.stats['min_tweet_id'])
+        self.assertEqual(1104744219066998784, self.stats['max_tweet_id'])
+        self.assertEqual('2019-03-01T13:50:30', self.stats['min_created_at'])
+        self.assertEqual('2019-03-10T14:02:01', self.stats['max_created_at'])
+
+    def test_may_match(self):
+        self.assertTrue(may_match(self.stats))
+        self.assertTrue(may_match(self.stats, since=datetime(2019, 3, 5), until=datetime(2019, 3, 6)))
+        self.assertFalse(may_match(self.stats, since=datetime(2019, 3, 11)))
+        self.assertFalse(may_match(self.stats, until=datetime(2019, 3, 1)))
+        self.assertTrue(may_match(self.stats, user_ids=['12', '13']))
+        self.assertFalse(may_match(self.stats, user_ids=['13']))
+
+    def test_may_match_no_tweets(self):
+        stats = TweetStats().to_dict()
+        self.assertFalse(may_match(stats))
+
+    def test_get_stats_filepath(self):
+        self.assertEqual('harvests/tweets-20190309153508.stats.json',
+                         get_stats_filepath('harvests/tweets-20190309153508.jsonl.gz'))
+        self.assertEqual('harvests/tweets-20190309153508_2.stats.json',
+                         get_stats_filepath('harvests/tweets-20190309153508_2.jsonl.zst'))
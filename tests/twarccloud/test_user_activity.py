@@ -0,0 +1,65 @@
+from tempfile import mkdtemp
+import json
+import os
+import shutil
+from twarccloud.user_activity import UserActivity
+from tests import TestCase
+
+
+class TestUserActivity(TestCase):
+    def setUp(self):
+        self.user_activity = UserActivity()
+
+    def test_record(self):
+        self.user_activity.record('1', 10, max_id='1101479829856149504')
+        self.assertEqual([1551448230, 10, 0, 0], self.user_activity['1'])
+        self.user_activity.record('1', 0)
+        self.user_activity.record('1', 0)
+        self.assertEqual([1551448230, 2.5, 2, 0], self.user_activity['1'])
+
+    def test_priority_order(self):
+        self.user_activity.record('1', 1, max_id='1101479829856149504')
+        self.user_activity.record('2', 5, max_id='1101479829856149504')
+        self.user_activity.record('3', 5, max_id='1101479829856149505000')
+        self.assertEqual(['4', '3', '2', '1'], self.user_activity.priority_order(['1', '2', '3', '4']))
+
+    def test_should_skip(self):
+        self.assertFalse(self.user_activity.should_skip('1', 8))
+        self.user_activity.record('1', 0)
+        # Polled after one empty harvest.
+        self.assertFalse(self.user_activity.should_skip('1', 8))
+        self.user_activity.record('1', 0)
+        self.user_activity.record('1', 0)
+        # Skips 3 harvests after three empty harvests.
+        skips = 0
+        while self.user_activity.should_skip('1', 8):
+            self.user_activity.skip('1')
+            skips += 1
+        self.assertEqual(3, skips)
+        # Limited by max skip.
+        self.user_activity['1'][1:] = [0, 10, 0]
+        self.assertTrue(self.user_activity.should_skip('1', 2))
+        self.user_activity['1'][3] = 2
+        self.assertFalse(self.user_activity.should_skip('1', 2))
+        # Not skipping
+        self.assertFalse(self.user_activity.should_skip('1', None))
+        # Any tweets reset the streak.
+        self.user_activity.record('1', 1)
+        self.assertFalse(self.user_activity.should_skip('1', 8))
+
+    def test_load(self):
+        path = mkdtemp()
+        try:
+            filepath = os.path.join(path, 'user_activity.json')
+            self.assertEqual({}, UserActivity.load(filepath))
+            with open(filepath, 'w') as file:
+                json.dump({'1': [1551448230, 2.5, 2, 0]}, file)
+            self.assertEqual({'1': [1551448230, 2.5, 2, 0]}, UserActivity.load(filepath))
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def test_prune(self):
+        self.user_activity.record('1', 1)
+        self.user_activity.record('2', 1)
+        self.user_activity.prune(['2', '3'])
+        self.assertEqual(['2'], list(self.user_activity.keys()))
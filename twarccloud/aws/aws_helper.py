@@ -2,8 +2,9 @@ import shutil
 import os
 import botocore
 from twarccloud.filepaths_helper import get_collection_config_filepath, get_lock_file, get_collection_path, \
-    get_changesets_path
+    get_changesets_path, get_user_activity_filepath, get_harvest_checkpoint_filepath, get_tweet_index_path
 from twarccloud.aws import aws_resource
+from twarccloud.aws.s3 import download_all
 
 
 # Synchronize collection configuration from bucket to local.
@@ -19,10 +20,28 @@ def sync_collection_config(local_collections_path, collection_id, bucket):
     # Collection config file
     aws_resource('s3').Bucket(bucket).download_file(bucket_collection_config_filepath, local_collection_config_filepath)
     # Lock
+    _download_if_exists(bucket, get_lock_file(collection_id),
+                        get_lock_file(collection_id, collections_path=local_collections_path))
+    # User activity
+    _download_if_exists(bucket, get_user_activity_filepath(collection_id),
+                        get_user_activity_filepath(collection_id, collections_path=local_collections_path))
+    # Tweet index segments
+    download_all(bucket, get_tweet_index_path(collection_id),
+                 get_tweet_index_path(collection_id, collections_path=local_collections_path))
+
+
+# Synchronize a harvest's checkpoint file from bucket to local, if there is one.
+def sync_checkpoint(local_collections_path, collection_id, harvest_timestamp, bucket):
+    local_checkpoint_filepath = get_harvest_checkpoint_filepath(collection_id, harvest_timestamp,
+                                                                collections_path=local_collections_path)
+    os.makedirs(os.path.dirname(local_checkpoint_filepath), exist_ok=True)
+    _download_if_exists(bucket, get_harvest_checkpoint_filepath(collection_id, harvest_timestamp),
+                        local_checkpoint_filepath)
+
+
+def _download_if_exists(bucket, bucket_filepath, local_filepath):
     try:
-        local_lock_filepath = get_lock_file(collection_id, collections_path=local_collections_path)
-        bucket_lock_filepath = get_lock_file(collection_id)
-        aws_resource('s3').Bucket(bucket).download_file(bucket_lock_filepath, local_lock_filepath)
+        aws_resource('s3').Bucket(bucket).download_file(bucket_filepath, local_filepath)
     except botocore.exceptions.ClientError as error:
         if error.response['Error']['Code'] != "404":
             raise
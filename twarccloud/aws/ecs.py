@@ -86,8 +86,11 @@ def list_scheduled_tasks(rule_prefix, enabled_only=False):
 def register_task_definition(task_definition_family, tags, command, aws_config,
                              skip_if_exists=True):
 
+    # An existing task definition is only reused if it runs the same command, e.g., the same group of collections.
     if skip_if_exists and _has_task_definition(task_definition_family):
-        return _task_definition_arn(task_definition_family)
+        task_definition = _task_definition(task_definition_family)
+        if task_definition['containerDefinitions'][0]['command'] == command:
+            return task_definition['taskDefinitionArn']
     response = aws_client('ecs').register_task_definition(
         family=task_definition_family,
         taskRoleArn=aws_config.task_role_arn,
@@ -275,11 +278,11 @@ def _has_task_definition(task_definition_family):
     return False
 
 
-def _task_definition_arn(task_definition_family):
+def _task_definition(task_definition_family):
     response = aws_client('ecs').describe_task_definition(
         taskDefinition=task_definition_family
     )
-    return response['taskDefinition']['taskDefinitionArn']
+    return response['taskDefinition']
 
 
 def _cluster_arn(aws_config):
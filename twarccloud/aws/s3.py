@@ -1,10 +1,19 @@
 import json
 import io
 import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatch
+from itertools import chain
+from time import time
 import botocore
-from twarccloud.aws import aws_resource
+from twarccloud.aws import aws_resource, aws_client
 from twarccloud import log
 
+SYNC_STATE_FILENAME = '.sync-state.json'
+
+DownloadStats = namedtuple('DownloadStats', ['files', 'skipped', 'bytes', 'secs'])
+
 
 # Iterable of all keys at a path
 def list_keys(bucket, path):
@@ -15,21 +24,97 @@ def list_keys(bucket, path):
 
 
 # Download all files at a path and descendants.
-def download_all(bucket, path, local_path):
-    paginator = aws_resource('s3').meta.client.get_paginator('list_objects')
-    for result in paginator.paginate(Bucket=bucket, Prefix=_prefix(path)):
-        for obj in result['Contents']:
-            object_key = obj['Key']
-            if object_key.endswith('/'):
-                continue
+# Files are downloaded by a pool of workers. The ETag and size of each downloaded file is recorded in a sync state file
+# in the local path, so that files that have not changed are not downloaded again.
+# Include and exclude are lists of glob patterns matched against the path of the file relative to path, e.g.,
+# harvests/2019/03/*. If include patterns are provided, a file must match one of them.
+# If prefixes are provided, only the files directly in path and the files under those prefixes are listed, rather than
+# everything under path.
+# Returns DownloadStats.
+# pylint: disable=too-many-arguments, too-many-locals
+def download_all(bucket, path, local_path, workers=8, include=None, exclude=None, prefixes=None):
+    start = time()
+    sync_state_filepath = os.path.join(local_path, SYNC_STATE_FILENAME)
+    sync_state = _load_sync_state(sync_state_filepath)
+    downloads = []
+    skipped = 0
+    for obj in _list_objects(bucket, path, prefixes=prefixes):
+        filepath = _remove_prefix(obj['Key'], path)
+        if not _included(filepath, include, exclude):
+            continue
+        dest_filepath = os.path.join(local_path, filepath)
+        if _is_synced(sync_state.get(filepath), obj, dest_filepath):
+            log.debug('Skipping downloading s3://%s/%s to %s', bucket, obj['Key'], dest_filepath)
+            skipped += 1
+        else:
+            downloads.append((obj, filepath, dest_filepath))
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [(executor.submit(_download, bucket, obj['Key'], dest_filepath), obj, filepath)
+                       for obj, filepath, dest_filepath in downloads]
+            for future, obj, filepath in futures:
+                future.result()
+                sync_state[filepath] = {'etag': obj['ETag'], 'size': obj['Size']}
+    finally:
+        # Record what was downloaded, even if not everything was.
+        _save_sync_state(sync_state_filepath, sync_state)
+    return DownloadStats(len(downloads), skipped, sum(obj['Size'] for obj, _, _ in downloads), time() - start)
+
+
+# Iterable of the keys of all files at a path and descendants.
+def list_files(bucket, path):
+    for obj in _list_objects(bucket, path):
+        yield obj['Key']
+
+
+# Iterable of (key, size) of all files at a path and descendants.
+def list_file_sizes(bucket, path):
+    for obj in _list_objects(bucket, path):
+        yield obj['Key'], obj['Size']
+
+
+def _list_objects(bucket, path, prefixes=None):
+    paginator = aws_client('s3').get_paginator('list_objects_v2')
+    if prefixes is None:
+        pages = paginator.paginate(Bucket=bucket, Prefix=_prefix(path))
+    else:
+        pages = chain(paginator.paginate(Bucket=bucket, Prefix=_prefix(path), Delimiter='/'),
+                      *[paginator.paginate(Bucket=bucket, Prefix=prefix) for prefix in prefixes])
+    for result in pages:
+        for obj in result.get('Contents', []):
+            if not obj['Key'].endswith('/'):
+                yield obj
+
 
-            dest_filepath = os.path.join(local_path, _remove_prefix(object_key, path))
-            if os.path.isfile(dest_filepath) and os.path.getsize(dest_filepath) == obj['Size']:
-                log.debug('Skipping downloading s3://%s/%s to %s', bucket, object_key, dest_filepath)
-            else:
-                log.debug('Downloading s3://%s/%s to %s', bucket, object_key, dest_filepath)
-                os.makedirs(os.path.dirname(dest_filepath), exist_ok=True)
-                aws_resource('s3').Bucket(bucket).download_file(object_key, dest_filepath)
+def _included(filepath, include, exclude):
+    if include and not any(fnmatch(filepath, pattern) for pattern in include):
+        return False
+    return not exclude or not any(fnmatch(filepath, pattern) for pattern in exclude)
+
+
+def _is_synced(file_state, obj, dest_filepath):
+    return file_state is not None and file_state['etag'] == obj['ETag'] and file_state['size'] == obj['Size'] \
+           and os.path.isfile(dest_filepath) and os.path.getsize(dest_filepath) == obj['Size']
+
+
+def _download(bucket, key, dest_filepath):
+    log.debug('Downloading s3://%s/%s to %s', bucket, key, dest_filepath)
+    os.makedirs(os.path.dirname(dest_filepath), exist_ok=True)
+    aws_client('s3').download_file(bucket, key, dest_filepath)
+
+
+def _load_sync_state(sync_state_filepath):
+    if not os.path.exists(sync_state_filepath):
+        return {}
+    with open(sync_state_filepath) as file:
+        return json.load(file)
+
+
+def _save_sync_state(sync_state_filepath, sync_state):
+    os.makedirs(os.path.dirname(sync_state_filepath), exist_ok=True)
+    with open(sync_state_filepath, 'w') as file:
+        json.dump(sync_state, file, indent=2)
 
 
 # Download a single file.
@@ -50,6 +135,22 @@ def download_json(bucket, filepath):
     return json.loads(file.getvalue().decode('utf-8'))
 
 
+# Abort multipart uploads at a path and descendants, e.g., those abandoned by a harvester that crashed.
+# If initiated_before is provided, only uploads started before that datetime are aborted.
+def abort_multipart_uploads(bucket, path, initiated_before=None):
+    aborted = 0
+    paginator = aws_resource('s3').meta.client.get_paginator('list_multipart_uploads')
+    for result in paginator.paginate(Bucket=bucket, Prefix=_prefix(path)):
+        for upload in result.get('Uploads', []):
+            if initiated_before and upload['Initiated'].replace(tzinfo=None) >= initiated_before:
+                continue
+            log.info('Aborting multipart upload to s3://%s/%s', bucket, upload['Key'])
+            aws_resource('s3').meta.client.abort_multipart_upload(Bucket=bucket, Key=upload['Key'],
+                                                                  UploadId=upload['UploadId'])
+            aborted += 1
+    return aborted
+
+
 def _prefix(path):
     return path + '/' if not path.endswith('/') else ''
 
@@ -0,0 +1,45 @@
+import base64
+import hashlib
+import math
+import struct
+
+
+# A Bloom filter: a compact set that may report that it contains a key that was never added, at the error rate it was
+# sized for, but never that it does not contain a key that was added.
+# Keys are hashed as strings. The positions for a key are derived from two halves of a single hash.
+class BloomFilter:
+    def __init__(self, num_bits, num_hashes, bits=None):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bits or bytearray((num_bits + 7) // 8)
+
+    # Returns a Bloom filter sized for capacity keys at the error rate.
+    @staticmethod
+    def create(capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        num_bits = max(int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)), 8)
+        num_hashes = max(int(round(num_bits / capacity * math.log(2))), 1)
+        return BloomFilter(num_bits, num_hashes)
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position // 8] |= 1 << (position % 8)
+
+    def __contains__(self, key):
+        return all(self.bits[position // 8] & (1 << (position % 8)) for position in self._positions(key))
+
+    def _positions(self, key):
+        hash1, hash2 = struct.unpack('<QQ', hashlib.blake2b(str(key).encode('utf-8'), digest_size=16).digest())
+        return ((hash1 + i * hash2) % self.num_bits for i in range(self.num_hashes))
+
+    def to_dict(self):
+        return {
+            'num_bits': self.num_bits,
+            'num_hashes': self.num_hashes,
+            'bits': base64.b64encode(bytes(self.bits)).decode('ascii')
+        }
+
+    @staticmethod
+    def from_dict(bloom_dict):
+        return BloomFilter(bloom_dict['num_bits'], bloom_dict['num_hashes'],
+                           bits=bytearray(base64.b64decode(bloom_dict['bits'])))
@@ -0,0 +1,22 @@
+import argparse
+from twarccloud.compression import get_codec
+from twarccloud.config_helpers import parse_size
+
+# Argument types shared by the command-line tools.
+
+
+# A size, e.g., 16MB. Returns the number of bytes.
+def size(value):
+    try:
+        return parse_size(value)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+
+# A codec specification, e.g., zstd:3.
+def codec_spec(value):
+    try:
+        get_codec(value)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+    return value
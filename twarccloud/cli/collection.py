@@ -1,16 +1,28 @@
 import argparse
 import os
 import shutil
-from twarccloud.filepaths_helper import get_collection_config_filepath, DEFAULT_COLLECTIONS_PATH, get_collection_path
+import sys
+from datetime import datetime, timedelta
+import dateutil.parser
+import dateutil.tz
+from twarccloud.filepaths_helper import get_collection_config_filepath, DEFAULT_COLLECTIONS_PATH, \
+    get_collection_path, get_harvest_prefixes
 from twarccloud.aws.s3 import list_keys, download_all, file_exists
 from twarccloud.aws.ecs import run_task, register_task_definition, schedule_task, service_exists, start_service, \
     stop_schedule, stop_service, list_tasks, tags_for_task, list_scheduled_tasks
 from twarccloud.config_helpers import bucket_value
+from twarccloud.collection_reader import CollectionReader
+from twarccloud.tweet_file_index import backfill_indexes, DEFAULT_TWEETS_PER_BLOCK
+from twarccloud.compaction import compact_collection, locked_harvest_path
+from twarccloud.scan import scan_collection, ScanPredicate, Expression
+from twarccloud.export import export_collection, Field, PARTITIONS, PARTITION_HARVEST_DATE, FIELD_TYPES
 from twarccloud.exceptions import TwarcCloudException
+from twarccloud.cli.arg_types import size
 from twarccloud.cli.collection_config import load_collection_config, collection_config_update, \
     assert_collection_type, get_collection_config
 
 
+# pylint: disable=too-many-statements, too-many-locals
 def add_collection_subparser(subparsers):
     collection_parser = subparsers.add_parser('collection', help='Collection-related commands.')
     collection_subparser = collection_parser.add_subparsers(help='sub-command help', dest='subcommand')
@@ -32,14 +44,24 @@ def add_collection_subparser(subparsers):
     common_collection_start_parser.add_argument('collection_id')
     common_collection_start_parser.add_argument('--bucket')
 
+    # This is shared by collection once and collection schedule, which may harvest a group of collections on one task.
+    group_collection_start_parser = argparse.ArgumentParser(add_help=False)
+    group_collection_start_parser.add_argument('collection_ids', nargs='+', metavar='collection_id',
+                                               help='Collection id. May be repeated to harvest a group of collections '
+                                                    'on one task.')
+    group_collection_start_parser.add_argument('--group',
+                                               help='Name for a group of collections. Required if more than one '
+                                                    'collection.')
+    group_collection_start_parser.add_argument('--bucket')
+
     # Run-once collection
-    collection_subparser.add_parser('once', help='Harvest once.', parents=[common_collection_start_parser])
+    collection_subparser.add_parser('once', help='Harvest once.', parents=[group_collection_start_parser])
 
     # Schedule collection
     collection_schedule_parser = collection_subparser.add_parser('schedule',
                                                                  help='Harvest according to a schedule. Will replace '
                                                                       'an existing schedule.',
-                                                                 parents=[common_collection_start_parser])
+                                                                 parents=[group_collection_start_parser])
     # pylint: disable=line-too-long
     collection_schedule_parser.add_argument('schedule',
                                             help='Cron or rate expression, e.g., rate(7 days). See '
@@ -48,7 +70,7 @@ def add_collection_subparser(subparsers):
     # Stop schedule
     collection_schedule_stop_parser = collection_subparser.add_parser('stop',
                                                                       help='Stop harvesting according to a schedule.')
-    collection_schedule_stop_parser.add_argument('collection_id')
+    collection_schedule_stop_parser.add_argument('collection_id', help='Collection id or group name.')
     collection_schedule_stop_parser.add_argument('--bucket')
 
     # List scheduled
@@ -75,20 +97,103 @@ def add_collection_subparser(subparsers):
                                             help='Path for download. Default is download/<bucket>/<collection_id>.')
     collection_download_parser.add_argument('--clean', action='store_true',
                                             help='Delete any files that have already been downloaded.')
+    collection_download_parser.add_argument('--workers', default='8', type=int,
+                                            help='Number of files to download at once. Default is 8.')
+    collection_download_parser.add_argument('--include', action='append',
+                                            help='Only download files matching this pattern, e.g., '
+                                                 'harvests/2019/03/*. May be repeated.')
+    collection_download_parser.add_argument('--exclude', action='append',
+                                            help='Do not download files matching this pattern. May be repeated.')
+    collection_download_parser.add_argument('--since', type=dateutil.parser.parse,
+                                            help='Only download harvests started at or after this UTC time, e.g., '
+                                                 '2019-03-01.')
+    collection_download_parser.add_argument('--until', type=dateutil.parser.parse,
+                                            help='Only download harvests started before this UTC time, e.g., '
+                                                 '2019-04-01.')
+
+    # Backfill tweet file indexes
+    collection_index_parser = collection_subparser.add_parser('index',
+                                                              help='Index tweet files written before tweet files were '
+                                                                   'indexed, so that tweets can be looked up by id.')
+    collection_index_parser.add_argument('collection_id')
+    collection_index_parser.add_argument('--bucket')
+    collection_index_parser.add_argument('--tweets-per-block', default=str(DEFAULT_TWEETS_PER_BLOCK), type=int,
+                                         help='Tweets per independently compressed block. Default is {:,}.'.format(
+                                             DEFAULT_TWEETS_PER_BLOCK))
+
+    # Compact collection
+    collection_compact_parser = collection_subparser.add_parser('compact',
+                                                                help='Compact adjacent small tweet files of each '
+                                                                     'harvest into larger files.')
+    collection_compact_parser.add_argument('collection_id')
+    collection_compact_parser.add_argument('--bucket')
+    collection_compact_parser.add_argument('--target-size', default='256MB', type=size,
+                                           help='Size of the files to compact into. Default is 256MB.')
+
+    # Export collection
+    collection_export_parser = collection_subparser.add_parser('export',
+                                                               help='Export a collection to Parquet. Requires pyarrow.')
+    collection_export_parser.add_argument('collection_id')
+    collection_export_parser.add_argument('--bucket')
+    collection_export_parser.add_argument('--collections-path',
+                                          help='Export from a local collections path instead of the bucket, e.g., '
+                                               'download/<bucket>/collections.')
+    collection_export_parser.add_argument('--output-path', help='Default is export/<collection_id>.')
+    collection_export_parser.add_argument('--fields', nargs='+', type=field_spec,
+                                          help='Fields to export as [<name>=]<dotted path>[|<dotted path>][:<type>], '
+                                               'e.g., user_id=user.id_str or retweet_count:int64. Types are {}. '
+                                               'Default is 20 common fields.'.format(', '.join(FIELD_TYPES)))
+    collection_export_parser.add_argument('--partition', default=PARTITION_HARVEST_DATE, choices=PARTITIONS,
+                                          help='Default is harvest_date.')
+    collection_export_parser.add_argument('--workers', type=int,
+                                          help='Number of files to export at once. Default is the number of CPUs.')
+    collection_export_parser.add_argument('--batch-size', default='10000', type=int,
+                                          help='Tweets per Parquet row group. Default is 10,000.')
+
+    # Scan collection
+    collection_scan_parser = collection_subparser.add_parser('scan', help='Search a collection for matching tweets.')
+    collection_scan_parser.add_argument('collection_id')
+    collection_scan_parser.add_argument('--bucket')
+    collection_scan_parser.add_argument('--collections-path',
+                                        help='Scan a local collections path instead of the bucket, e.g., '
+                                             'download/<bucket>/collections.')
+    collection_scan_parser.add_argument('--keyword', action='append',
+                                        help='Match tweets containing this keyword. May be repeated to match any.')
+    collection_scan_parser.add_argument('--hashtag', action='append',
+                                        help='Match tweets with this hashtag. May be repeated to match any.')
+    collection_scan_parser.add_argument('--user-id', action='append',
+                                        help='Match tweets by this user id. May be repeated to match any.')
+    collection_scan_parser.add_argument('--since', type=dateutil.parser.parse,
+                                        help='Match tweets created at or after this UTC time.')
+    collection_scan_parser.add_argument('--until', type=dateutil.parser.parse,
+                                        help='Match tweets created before this UTC time.')
+    collection_scan_parser.add_argument('--where', action='append', type=expression,
+                                        help='Match tweets for which this expression is true, e.g., lang=en or '
+                                             'user.followers_count>1000. Operators are =, !=, >, >=, <, <= and ~ '
+                                             '(contains). May be repeated to match all.')
+    collection_scan_parser.add_argument('--output', help='File to write matching tweets to. Default is stdout.')
+    collection_scan_parser.add_argument('--unordered', action='store_true',
+                                        help='Write matches as files finish rather than in the order of the files.')
+    collection_scan_parser.add_argument('--workers', type=int,
+                                        help='Number of files to scan at once. Default is the number of CPUs.')
 
     return collection_parser
 
 
+# pylint: disable=too-many-branches
 def handle_collection_command(args, ini_config, aws_config, collection_parser):
     if args.subcommand == 'list':
         collection_list_command(bucket_value(args, ini_config))
     elif args.subcommand == 'download':
         collection_download_command(bucket_value(args, ini_config), args.collection_id,
-                                    local_collection_path=args.collection_path, clean=args.clean)
+                                    local_collection_path=args.collection_path, clean=args.clean,
+                                    workers=args.workers, include=args.include, exclude=args.exclude,
+                                    since=args.since, until=args.until)
     elif args.subcommand == 'once':
-        collection_once_command(bucket_value(args, ini_config), args.collection_id, aws_config)
+        collection_once_command(bucket_value(args, ini_config), args.collection_ids, aws_config, group=args.group)
     elif args.subcommand == 'schedule':
-        collection_schedule_command(bucket_value(args, ini_config), args.collection_id, args.schedule, aws_config)
+        collection_schedule_command(bucket_value(args, ini_config), args.collection_ids, args.schedule, aws_config,
+                                    group=args.group)
     elif args.subcommand == 'stop':
         collection_stop_schedule_command(bucket_value(args, ini_config), args.collection_id)
     elif args.subcommand == 'scheduled':
@@ -97,6 +202,23 @@ def handle_collection_command(args, ini_config, aws_config, collection_parser):
         collection_service_start_command(bucket_value(args, ini_config), args.collection_id, aws_config)
     elif args.subcommand == 'filter-stop':
         collection_service_stop_command(bucket_value(args, ini_config), args.collection_id, aws_config)
+    elif args.subcommand == 'index':
+        collection_index_command(bucket_value(args, ini_config), args.collection_id,
+                                 tweets_per_block=args.tweets_per_block)
+    elif args.subcommand == 'compact':
+        collection_compact_command(bucket_value(args, ini_config), args.collection_id, target_bytes=args.target_size)
+    elif args.subcommand == 'export':
+        collection_export_command(bucket_value(args, ini_config), args.collection_id,
+                                  collections_path=args.collections_path, output_path=args.output_path,
+                                  fields=args.fields, partition=args.partition, workers=args.workers,
+                                  batch_size=args.batch_size)
+    elif args.subcommand == 'scan':
+        predicate = ScanPredicate(keywords=args.keyword, hashtags=args.hashtag, user_ids=args.user_id,
+                                  since=_utc(args.since) if args.since else None,
+                                  until=_utc(args.until) if args.until else None, expressions=args.where)
+        collection_scan_command(bucket_value(args, ini_config), args.collection_id, predicate,
+                                collections_path=args.collections_path, output_filepath=args.output,
+                                ordered=not args.unordered, workers=args.workers)
     elif args.subcommand == 'add':
         collection_add_command(bucket_value(args, ini_config), args.collection_config_filepath)
     else:
@@ -118,40 +240,135 @@ def collection_add_command(bucket, collection_config_filepath):
     print('Don\'t forget to start or schedule the collection.')
 
 
-def collection_download_command(bucket, collection_id, local_collection_path=None, clean=False):
+# pylint: disable=too-many-arguments
+def collection_download_command(bucket, collection_id, local_collection_path=None, clean=False, workers=8,
+                                include=None, exclude=None, since=None, until=None):
     if not local_collection_path:
         local_collection_path = os.path.join('download', bucket, DEFAULT_COLLECTIONS_PATH, collection_id)
 
     if clean:
         shutil.rmtree(local_collection_path, ignore_errors=True)
 
-    download_all(bucket, get_collection_path(collection_id), local_collection_path)
+    # Only list the harvests in the time range.
+    prefixes = None
+    if since or until:
+        prefixes = get_harvest_prefixes(collection_id, _utc(since) if since else datetime(2006, 1, 1),
+                                        _utc(until) if until else datetime.utcnow() + timedelta(seconds=1))
+
+    stats = download_all(bucket, get_collection_path(collection_id), local_collection_path, workers=workers,
+                         include=include, exclude=exclude, prefixes=prefixes)
     print('Collection downloaded to {}'.format(local_collection_path))
+    print('Downloaded {:,} files ({:,.1f} MB) in {:.1f} secs ({:.1f} MB/s). Skipped {:,} unchanged files.'.format(
+        stats.files, stats.bytes / 1024 / 1024, stats.secs, stats.bytes / 1024 / 1024 / max(stats.secs, .001),
+        stats.skipped))
 
 
-def collection_once_command(bucket, collection_id, aws_config):
+def collection_index_command(bucket, collection_id, tweets_per_block=DEFAULT_TWEETS_PER_BLOCK):
     assert_collection_exists(bucket, collection_id)
-    assert_collection_type(get_collection_config(bucket, collection_id), ('user_timeline', 'search'))
-    task_definition_arn = register_task_definition(_task_definition_family(bucket, collection_id, aws_config.image_tag),
-                                                   _tags(bucket, collection_id),
-                                                   _command(bucket, collection_id, shutdown=True), aws_config,
+    indexed = backfill_indexes(CollectionReader(collection_id, bucket=bucket).tweet_files(), bucket=bucket,
+                               tweets_per_block=tweets_per_block)
+    print('Indexed {:,} tweet files.'.format(indexed))
+
+
+def collection_compact_command(bucket, collection_id, target_bytes):
+    assert_collection_exists(bucket, collection_id)
+    # A harvest that is running is still writing files.
+    compacted = compact_collection(collection_id, bucket=bucket, target_bytes=target_bytes,
+                                   skip_harvest_path=locked_harvest_path(collection_id, bucket=bucket))
+    print('Compacted {:,} tweet files.'.format(compacted))
+
+
+# pylint: disable=too-many-arguments
+def collection_export_command(bucket, collection_id, collections_path=None, output_path=None, fields=None,
+                              partition=PARTITION_HARVEST_DATE, workers=None, batch_size=10000):
+    if not output_path:
+        output_path = os.path.join('export', collection_id)
+    if collections_path:
+        stats = export_collection(collection_id, output_path, collections_path=collections_path, fields=fields,
+                                  partition=partition, workers=workers, batch_size=batch_size)
+    else:
+        assert_collection_exists(bucket, collection_id)
+        stats = export_collection(collection_id, output_path, bucket=bucket, fields=fields, partition=partition,
+                                  workers=workers, batch_size=batch_size)
+    print('Collection exported to {}'.format(output_path))
+    print('Exported {:,} tweets from {:,} files in {:.1f} secs.'.format(stats.tweets, stats.files, stats.secs))
+
+
+# pylint: disable=too-many-arguments
+def collection_scan_command(bucket, collection_id, predicate, collections_path=None, output_filepath=None,
+                            ordered=True, workers=None):
+    if not collections_path:
+        assert_collection_exists(bucket, collection_id)
+    output_file = open(output_filepath, 'wb') if output_filepath else sys.stdout.buffer
+    try:
+        stats = scan_collection(collection_id, output_file, predicate,
+                                collections_path=collections_path or DEFAULT_COLLECTIONS_PATH,
+                                bucket=None if collections_path else bucket, workers=workers, ordered=ordered)
+    finally:
+        if output_filepath:
+            output_file.close()
+    # Summary goes to stderr, so that it doesn't mix with matches written to stdout.
+    print('Found {:,} matching tweets in {:,} files ({:,} skipped) in {:.1f} secs.'.format(
+        stats.matches, stats.files, stats.skipped, stats.secs), file=sys.stderr)
+
+
+def expression(value):
+    try:
+        Expression(value)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+    return value
+
+
+def field_spec(value):
+    try:
+        Field(value)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+    return value
+
+
+# Converts a datetime to naive UTC, like harvest timestamps. Naive datetimes are assumed to already be UTC.
+def _utc(value):
+    if value.tzinfo:
+        return value.astimezone(dateutil.tz.tzutc()).replace(tzinfo=None)
+    return value
+
+
+def collection_once_command(bucket, collection_ids, aws_config, group=None):
+    name = _group_name(bucket, collection_ids, group)
+    task_definition_arn = register_task_definition(_task_definition_family(bucket, name, aws_config.image_tag),
+                                                   _tags(bucket, name, collection_ids),
+                                                   _command(bucket, collection_ids, shutdown=True), aws_config,
                                                    skip_if_exists=True)
     run_task(task_definition_arn, aws_config)
     print('Started')
 
 
-def collection_schedule_command(bucket, collection_id, schedule, aws_config):
-    assert_collection_exists(bucket, collection_id)
-    assert_collection_type(get_collection_config(bucket, collection_id), ('user_timeline', 'search'))
-    task_definition_arn = register_task_definition(_task_definition_family(bucket, collection_id, aws_config.image_tag),
-                                                   _tags(bucket, collection_id),
-                                                   _command(bucket, collection_id, shutdown=True), aws_config,
+def collection_schedule_command(bucket, collection_ids, schedule, aws_config, group=None):
+    name = _group_name(bucket, collection_ids, group)
+    task_definition_arn = register_task_definition(_task_definition_family(bucket, name, aws_config.image_tag),
+                                                   _tags(bucket, name, collection_ids),
+                                                   _command(bucket, collection_ids, shutdown=True), aws_config,
                                                    skip_if_exists=True)
     # Note that this will replace existing rules and targets.
-    schedule_task(task_definition_arn, _rule_name(bucket, collection_id), schedule, aws_config)
+    schedule_task(task_definition_arn, _rule_name(bucket, name), schedule, aws_config)
     print('Scheduled')
 
 
+# Returns the name for harvesting collections on one task, after checking the collections.
+# A single collection is named by its id. A group of collections must be given a name.
+def _group_name(bucket, collection_ids, group):
+    if len(collection_ids) > 1 and not group:
+        raise TwarcCloudException('A group name is required for more than one collection.')
+    if group and ' ' in group:
+        raise TwarcCloudException('Group name contains spaces.')
+    for collection_id in collection_ids:
+        assert_collection_exists(bucket, collection_id)
+        assert_collection_type(get_collection_config(bucket, collection_id), ('user_timeline', 'search'))
+    return group or collection_ids[0]
+
+
 def collection_stop_schedule_command(bucket, collection_id):
     stop_schedule(_rule_name(bucket, collection_id))
     print('Stopped')
@@ -172,7 +389,7 @@ def collection_service_start_command(bucket, collection_id, aws_config):
     assert_collection_type(get_collection_config(bucket, collection_id), ('filter',))
     assert_no_service(bucket, collection_id, aws_config)
     task_definition_arn = register_task_definition(_task_definition_family(bucket, collection_id, aws_config.image_tag),
-                                                   _tags(bucket, collection_id), _command(bucket, collection_id),
+                                                   _tags(bucket, collection_id), _command(bucket, [collection_id]),
                                                    aws_config)
     start_service(task_definition_arn, _tags(bucket, collection_id), _service_name(bucket, collection_id), aws_config)
 
@@ -210,8 +427,8 @@ def _task_definition_family(bucket, collection_id, image_tag):
     return 'twarc-cloud_{}_{}_{}'.format(bucket, collection_id, image_tag)
 
 
-def _command(bucket, collection_id, monitor=False, shutdown=False):
-    command = ['aws', 'harvester', bucket, collection_id]
+def _command(bucket, collection_ids, monitor=False, shutdown=False):
+    command = ['aws', 'harvester', bucket] + list(collection_ids)
     if monitor:
         command.append('--monitor')
     if shutdown:
@@ -219,8 +436,9 @@ def _command(bucket, collection_id, monitor=False, shutdown=False):
     return command
 
 
-def _tags(bucket, collection_id):
-    return [
+# For a group of collections, collection_id is the group name and the collection ids are also tagged.
+def _tags(bucket, collection_id, collection_ids=None):
+    tags = [
         {
             'key': 'bucket',
             'value': bucket
@@ -230,6 +448,12 @@ def _tags(bucket, collection_id):
             'value': collection_id
         }
     ]
+    if collection_ids and len(collection_ids) > 1:
+        tags.append({
+            'key': 'collection_ids',
+            'value': ','.join(collection_ids)
+        })
+    return tags
 
 
 def assert_collection_exists(bucket, collection_id):
@@ -105,6 +105,9 @@ def add_collection_config_subparser(subparsers):
     collection_config_keys_parser.add_argument('--profile',
                                                help='Profile within the Twarc configuration file. Not necessary'
                                                     'if Twarc configuration only has one set of keys.')
+    collection_config_keys_parser.add_argument('--append', action='store_true',
+                                               help='Add to the existing keys rather than replacing them. Requests '
+                                                    'are spread across all of the keys.')
     return collection_config_parser
 
 
@@ -130,7 +133,7 @@ def handle_collection_config_command(args, ini_config, collection_config_parser)
                                                fileinput.input(files=args.files if args.files else ('-',)))
     elif args.subcommand == 'keys':
         collection_config_keys_command(args.collection_config_filepath, args.twarc_config_filepath,
-                                       args.profile)
+                                       args.profile, append=args.append)
     else:
         collection_config_parser.print_help()
         exit(1)
@@ -181,9 +184,13 @@ def collection_config_screen_names_command(collection_config_filepath, screen_na
             print(screen_name)
 
 
-def collection_config_keys_command(collection_config_filepath, twarc_config, profile):
+def collection_config_keys_command(collection_config_filepath, twarc_config, profile, append=False):
     collection_config = load_collection_config(collection_config_filepath)
-    collection_config['keys'] = get_twitter_keys(profile=profile, twarc_config=twarc_config)
+    keys = get_twitter_keys(profile=profile, twarc_config=twarc_config)
+    if append and 'keys' in collection_config:
+        collection_config['keys'] = collection_config.key_sets() + [keys]
+    else:
+        collection_config['keys'] = keys
     assert_collection_config_valid(collection_config)
     _write_collection_config(collection_config_filepath, collection_config)
     print('Added keys to {}.'.format(collection_config_filepath))
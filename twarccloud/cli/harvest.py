@@ -48,8 +48,9 @@ def harvest_list_command(aws_config):
     if tasks:
         for task in tasks:
             tags = tags_for_task(task)
-            print('{} => Bucket: {}. Status: {}'.format(tags.get('collection_id', 'Unknown'),
-                                                        tags.get('bucket', 'Unknown'),
+            # A group of collections is tagged with its collection ids.
+            collection_ids = tags.get('collection_ids', tags.get('collection_id', 'Unknown'))
+            print('{} => Bucket: {}. Status: {}'.format(collection_ids, tags.get('bucket', 'Unknown'),
                                                         task['lastStatus']))
     else:
         print('No running harvests.')
@@ -58,6 +59,9 @@ def harvest_list_command(aws_config):
 def harvest_running_command(bucket, collection_id, aws_config):
     dns_name = public_ip(_task(bucket, collection_id, aws_config))
     harvest_info = fetch_info(dns_name)
+    # A task harvesting a group of collections returns information for each.
+    if isinstance(harvest_info, list):
+        harvest_info = next(info for info in harvest_info if info['collection_id'] == collection_id)
     _print_harvest_info(bucket, harvest_info)
 
 
@@ -97,6 +101,7 @@ def _print_harvest_info(bucket, harvest_info):
 def _task(bucket, collection_id, aws_config):
     for task in list_tasks(aws_config):
         tags = tags_for_task(task)
-        if tags.get('bucket') == bucket and tags.get('collection_id') == collection_id:
+        if tags.get('bucket') == bucket and (tags.get('collection_id') == collection_id or collection_id in tags.get(
+                'collection_ids', '').split(',')):
             return task
     raise TwarcCloudException('Task not found.')
@@ -1,5 +1,8 @@
 from twarc import Twarc
 from .changeset import Changeset
+from .compression import get_codec
+from .filter_shards import split_filter
+from .tweet_index import DEDUP_MODES
 
 
 # Configuration specifying what is to be harvested and other information about the collection.
@@ -10,8 +13,11 @@ class CollectionConfig(dict):
         reasons.extend(self._check_id())
         reasons.extend(self._check_keys())
         reasons.extend(self._check_type())
+        reasons.extend(self._check_codec())
+        reasons.extend(self._check_dedup())
         if self['type'] == 'user_timeline':
             reasons.extend(self._check_timeline())
+            reasons.extend(self._check_max_skip_harvests())
         elif self['type'] == 'filter':
             reasons.extend(self._check_filter())
         elif self['type'] == 'search':
@@ -28,21 +34,38 @@ class CollectionConfig(dict):
             reasons.append('Id contains spaces.')
         return reasons
 
+    # Keys may be a single set of keys or a list of sets of keys.
     def _check_keys(self):
         reasons = []
-        if 'keys' in self:
-            if 'consumer_key' not in self['keys']:
-                reasons.append('Missing consumer_key.')
-            if 'consumer_secret' not in self['keys']:
-                reasons.append('Missing consumer_secret.')
-            if 'access_token' not in self['keys']:
-                reasons.append('Missing access_token.')
-            if 'access_token_secret' not in self['keys']:
-                reasons.append('Missing access_token_secret.')
-        else:
+        if 'keys' not in self:
             reasons.append('Missing keys.')
+            return reasons
+        if isinstance(self['keys'], dict):
+            reasons.extend(self._check_key_set(self['keys']))
+        elif isinstance(self['keys'], list):
+            if not self['keys']:
+                reasons.append('Keys is empty.')
+            for count, key_set in enumerate(self['keys']):
+                reasons.extend(['Keys {}: {}'.format(count + 1, reason) for reason in self._check_key_set(key_set)])
+        else:
+            reasons.append('Keys is not properly structured.')
+        return reasons
+
+    @staticmethod
+    def _check_key_set(key_set):
+        reasons = []
+        if not isinstance(key_set, dict):
+            reasons.append('Not properly structured.')
+            return reasons
+        for key in ('consumer_key', 'consumer_secret', 'access_token', 'access_token_secret'):
+            if key not in key_set:
+                reasons.append('Missing {}.'.format(key))
         return reasons
 
+    # Returns a list of the sets of keys.
+    def key_sets(self):
+        return self['keys'] if isinstance(self['keys'], list) else [self['keys']]
+
     def _check_type(self):
         reasons = []
         if 'type' not in self:
@@ -53,6 +76,21 @@ class CollectionConfig(dict):
             reasons.append('Unrecognized collection type.')
         return reasons
 
+    def _check_codec(self):
+        reasons = []
+        if 'codec' in self:
+            try:
+                get_codec(self['codec'])
+            except ValueError as error:
+                reasons.append('Invalid codec: {}.'.format(error))
+        return reasons
+
+    def _check_dedup(self):
+        reasons = []
+        if 'dedup' in self and self['dedup'] not in DEDUP_MODES:
+            reasons.append('dedup must be one of {}.'.format(', '.join(DEDUP_MODES)))
+        return reasons
+
     def _check_timeline(self):
         reasons = []
         if 'users' not in self:
@@ -68,6 +106,13 @@ class CollectionConfig(dict):
                 reasons.append('User {} is not properly structured.'.format(user_id))
         return reasons
 
+    def _check_max_skip_harvests(self):
+        reasons = []
+        if 'max_skip_harvests' in self and (not isinstance(self['max_skip_harvests'], int)
+                                            or self['max_skip_harvests'] < 0):
+            reasons.append('max_skip_harvests must be a number 0 or greater.')
+        return reasons
+
     def _check_filter(self):
         reasons = []
         if 'filter' not in self:
@@ -78,6 +123,12 @@ class CollectionConfig(dict):
             return reasons
         if 'track' not in self['filter'] and 'follow' not in self['filter'] and 'locations' not in self['filter']:
             reasons.append('Must provide track, follow, or locations for a filter.')
+        elif self.get('keys'):
+            # Each filter stream connection needs its own set of keys.
+            connections = len(split_filter(self['filter']))
+            if connections > len(self.key_sets()):
+                reasons.append('Filter needs {} connections, but only {} sets of keys.'.format(connections,
+                                                                                             len(self.key_sets())))
         return reasons
 
     def _check_search(self):
@@ -108,7 +159,7 @@ class CollectionConfig(dict):
     def add_users_by_screen_names(self, screen_names):
         if 'keys' not in self:
             raise CollectionConfigException('Keys are required to add users by screen name.')
-        keys = self['keys']
+        keys = self.key_sets()[0]
         twarc = Twarc(keys['consumer_key'],
                       keys['consumer_secret'],
                       keys['access_token'],
@@ -174,10 +225,13 @@ class CollectionConfig(dict):
 
         changeset = Changeset()
         self._diff_dict(self, other_config, changeset['update'], changeset['delete'], 'keys')
+        self._diff_dict(self, other_config, changeset['update'], changeset['delete'], 'codec')
+        self._diff_dict(self, other_config, changeset['update'], changeset['delete'], 'dedup')
         if other_config['type'] == 'filter':
             self._diff_dict(self, other_config, changeset['update'], changeset['delete'], 'filter')
         elif other_config['type'] == 'user_timeline':
             self._diff_dict(self, other_config, changeset['update'], changeset['delete'], 'users')
+            self._diff_dict(self, other_config, changeset['update'], changeset['delete'], 'max_skip_harvests')
         elif other_config['type'] == 'search':
             self._diff_dict(self, other_config, changeset['update'], changeset['delete'], 'search')
         return changeset
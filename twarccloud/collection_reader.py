@@ -0,0 +1,190 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import json
+import os
+import re
+import shutil
+from tempfile import mkdtemp
+import botocore
+from twarccloud.aws import aws_client
+from twarccloud.aws.s3 import list_files, download_json
+from twarccloud.compression import open_tweet_file, get_codec_for_filepath
+from twarccloud.filepaths_helper import get_collection_path, DEFAULT_COLLECTIONS_PATH
+from twarccloud.raw_tweet_helper import tweet_timestamp, extract_id
+from twarccloud.tweet_file_index import TweetFileIndex, get_index_filepath
+from twarccloud.tweet_stats import get_stats_filepath, may_match, to_epoch
+from twarccloud import log
+
+_TWEET_FILENAME_PATTERN = re.compile(r'^tweets-.*\.jsonl\.[a-z]+$')
+
+
+# Reads the tweets of a collection, either in a local collections path or in an S3 bucket.
+# Tweets can be limited to those created in [since, until) (naive UTC datetimes) or by a set of user ids. Tweet files
+# whose stats sidecars show that they cannot contain matching tweets are skipped without being read. Files without a
+# sidecar are always read.
+# Files are read in order. Up to workers files are fetched (i.e., their sidecars checked and, from S3, downloaded to a
+# temporary directory) ahead of the file being read.
+# Tweets can also be looked up by id. Only the blocks of indexed tweet files (see TweetFileIndex) that contain the
+# tweets are read.
+class CollectionReader:
+    def __init__(self, collection_id, collections_path=DEFAULT_COLLECTIONS_PATH, bucket=None, workers=4):
+        self.collection_id = collection_id
+        self.collections_path = collections_path
+        self.bucket = bucket
+        self.workers = workers
+        # Files skipped by the last read, based on their sidecars.
+        self.skipped_files = 0
+
+    # Returns the filepaths (or S3 keys) of the collection's tweet files, in order.
+    def tweet_files(self):
+        if self.bucket:
+            filepaths = list_files(self.bucket, get_collection_path(self.collection_id))
+        else:
+            filepaths = [os.path.join(path, filename) for path, _, filenames in
+                         os.walk(get_collection_path(self.collection_id, collections_path=self.collections_path))
+                         for filename in filenames]
+        return sorted(filepath for filepath in filepaths if _TWEET_FILENAME_PATTERN.match(os.path.basename(filepath)))
+
+    # Yields the tweets that match, as dicts.
+    def tweets(self, since=None, until=None, user_ids=None):
+        user_ids = {str(user_id) for user_id in user_ids} if user_ids else None
+        for tweet in self._read(since, until, user_ids):
+            if _matches(tweet, since, until, user_ids):
+                yield tweet
+
+    # Yields the tweets with the tweet ids, as dicts, in the order of the files they are in.
+    # A tweet that was collected more than once is only returned once. Files without an index, e.g., written before
+    # tweet files were indexed, are read whole, unless their sidecars show that they cannot contain the tweets.
+    def get_tweets(self, tweet_ids):
+        self.skipped_files = 0
+        remaining = {int(tweet_id) for tweet_id in tweet_ids}
+        for tweet_filepath in self.tweet_files():
+            if not remaining:
+                return
+            ranges = self._find(tweet_filepath, remaining)
+            if not ranges:
+                self.skipped_files += 1
+                continue
+            for start, end in ranges:
+                with self._open_range(tweet_filepath, start, end) as file:
+                    for line in file:
+                        tweet_id = _line_id(line)
+                        if tweet_id in remaining:
+                            remaining.discard(tweet_id)
+                            yield json.loads(line.decode('utf-8'))
+
+    # Returns a list of the (start, end) byte ranges of a tweet file that may contain the tweet ids. (None, None) is the
+    # whole file.
+    def _find(self, tweet_filepath, tweet_ids):
+        index_filepath = get_index_filepath(tweet_filepath)
+        if self.bucket:
+            try:
+                data = aws_client('s3').get_object(Bucket=self.bucket, Key=index_filepath)['Body'].read()
+                return TweetFileIndex.from_bytes(data).find(tweet_ids)
+            except botocore.exceptions.ClientError as error:
+                if error.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+                    raise
+        elif os.path.exists(index_filepath):
+            return TweetFileIndex.load(index_filepath).find(tweet_ids)
+        stats = self.load_stats(get_stats_filepath(tweet_filepath))
+        if stats is not None and not _may_contain(stats, tweet_ids):
+            return []
+        return [(None, None)]
+
+    # Opens a decompressing reader over a byte range of a tweet file.
+    def _open_range(self, tweet_filepath, start, end):
+        codec = get_codec_for_filepath(tweet_filepath)
+        if self.bucket:
+            kwargs = {'Range': 'bytes={}-{}'.format(start, end - 1)} if start is not None else {}
+            return codec.open_reader(aws_client('s3').get_object(Bucket=self.bucket, Key=tweet_filepath,
+                                                                 **kwargs)['Body'])
+        if start is None:
+            return open_tweet_file(tweet_filepath)
+        with open(tweet_filepath, 'rb') as file:
+            file.seek(start)
+            return codec.open_reader(BytesIO(file.read(end - start)))
+
+    def _read(self, since, until, user_ids):
+        self.skipped_files = 0
+        temp_path = mkdtemp() if self.bucket else None
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                in_flight = deque()
+                tweet_files = iter(self.tweet_files())
+                while True:
+                    # Keep workers files ahead.
+                    for tweet_filepath in tweet_files:
+                        in_flight.append(executor.submit(self._fetch, tweet_filepath, temp_path, since, until,
+                                                         user_ids))
+                        if len(in_flight) > self.workers:
+                            break
+                    if not in_flight:
+                        return
+                    local_filepath = in_flight.popleft().result()
+                    if local_filepath is None:
+                        self.skipped_files += 1
+                        continue
+                    with open_tweet_file(local_filepath) as file:
+                        for line in file:
+                            yield json.loads(line.decode('utf-8'))
+                    if self.bucket:
+                        os.remove(local_filepath)
+        finally:
+            if temp_path:
+                shutil.rmtree(temp_path, ignore_errors=True)
+
+    # Returns the local filepath of a tweet file, or None if its sidecar shows that it cannot match.
+    # pylint: disable=too-many-arguments
+    def _fetch(self, tweet_filepath, temp_path, since, until, user_ids):
+        stats = self.load_stats(get_stats_filepath(tweet_filepath))
+        if stats is not None and not may_match(stats, since=since, until=until, user_ids=user_ids):
+            log.debug('Skipping %s', tweet_filepath)
+            return None
+        if not self.bucket:
+            return tweet_filepath
+        local_filepath = os.path.join(temp_path, tweet_filepath.replace('/', '_'))
+        log.debug('Downloading s3://%s/%s', self.bucket, tweet_filepath)
+        aws_client('s3').download_file(self.bucket, tweet_filepath, local_filepath)
+        return local_filepath
+
+    # Returns a stats sidecar as a dict, or None if it does not exist.
+    def load_stats(self, stats_filepath):
+        if self.bucket:
+            try:
+                return download_json(self.bucket, stats_filepath)
+            except botocore.exceptions.ClientError as error:
+                if error.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+                    raise
+                return None
+        if not os.path.exists(stats_filepath):
+            return None
+        with open(stats_filepath) as file:
+            return json.load(file)
+
+
+# Returns the tweet id of a line of a tweet file, or None if the line is not a tweet.
+def _line_id(line):
+    try:
+        return extract_id(line)
+    except KeyError:
+        return None
+
+
+def _may_contain(stats_dict, tweet_ids):
+    if stats_dict['min_tweet_id'] is None:
+        return False
+    return any(stats_dict['min_tweet_id'] <= tweet_id <= stats_dict['max_tweet_id'] for tweet_id in tweet_ids)
+
+
+# Messages that are not tweets, e.g., filter stream limit notices, only match if there are no limits.
+def _matches(tweet, since, until, user_ids):
+    if not (since or until or user_ids):
+        return True
+    if 'id' not in tweet:
+        return False
+    if since and tweet_timestamp(tweet['id']) < to_epoch(since):
+        return False
+    if until and tweet_timestamp(tweet['id']) >= to_epoch(until):
+        return False
+    return not user_ids or tweet['user']['id_str'] in user_ids
@@ -0,0 +1,229 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+from tempfile import mkdtemp
+import botocore
+import dateutil.parser
+from twarccloud.aws import aws_client
+from twarccloud.aws.s3 import list_file_sizes, download_json, file_exists
+from twarccloud.compression import open_tweet_file
+from twarccloud.filepaths_helper import MANIFEST_FILENAME, COMPACTION_MAP_FILENAME, get_collection_path, \
+    get_harvest_path, get_lock_file, DEFAULT_COLLECTIONS_PATH
+from twarccloud.harvester.collection_lock import read_lock
+from twarccloud.tweet_file_index import TweetFileIndex, get_index_filepath, update_manifest
+from twarccloud.tweet_stats import TweetStats, get_stats_filepath
+from twarccloud import log
+
+DEFAULT_TARGET_BYTES = 256 * 1024 * 1024
+
+_TWEET_FILENAME_PATTERN = re.compile(r'^tweets-([^/]+?)(\.jsonl\.[a-z]+)$')
+
+
+# Returns the groups of adjacent tweet files to compact into files of no more than target bytes, given a list of
+# (filename, size) of the tweet files of a harvest. Files are only grouped with files compressed with the same codec.
+# Files that are already at least target bytes are left alone, as are groups of one.
+def plan_compaction(files, target_bytes=DEFAULT_TARGET_BYTES):
+    groups = []
+    group = []
+    group_bytes = 0
+    for filename, size in sorted(files):
+        if group and (group_bytes + size > target_bytes or _extension(filename) != _extension(group[0])):
+            groups.append(group)
+            group = []
+            group_bytes = 0
+        group.append(filename)
+        group_bytes += size
+    groups.append(group)
+    return [group for group in groups if len(group) > 1]
+
+
+# Compacts the small tweet files of a harvest into files of up to target bytes.
+# Gzip members and zstd frames can be concatenated, so files are concatenated without recompressing. The stats sidecar
+# of a compacted file is rebuilt by reading its tweets, and the indexes of its files are merged (a file without an
+# index becomes a single block).
+# The harvest's manifest, if it has one, is rewritten, and compacted_files.json maps the filenames of the files that
+# were compacted to the filename of the file they were compacted into.
+# Harvest path is a local path or, if a bucket, an S3 prefix. From S3, the files to compact are downloaded, and the
+# compacted files are uploaded before the files they replace are deleted.
+# Returns the number of files that were compacted.
+def compact_harvest(harvest_path, target_bytes=DEFAULT_TARGET_BYTES, bucket=None):
+    groups = plan_compaction(_list_tweet_files(harvest_path, bucket), target_bytes=target_bytes)
+    if not groups:
+        return 0
+    log.info('Compacting %s files in %s into %s files', sum(len(group) for group in groups), harvest_path,
+             len(groups))
+    local_path = mkdtemp() if bucket else harvest_path
+    try:
+        if bucket:
+            _download(bucket, harvest_path, local_path, [filename for group in groups for filename in group])
+        sha1s = {}
+        compaction_map = {}
+        for group in groups:
+            filename, sha1s[filename] = _concatenate(local_path, group)
+            compaction_map.update({old_filename: filename for old_filename in group})
+        manifest_filepath = os.path.join(local_path, MANIFEST_FILENAME)
+        # A harvest without a manifest isn't given a partial one.
+        if os.path.exists(manifest_filepath):
+            update_manifest(manifest_filepath, sha1s, removed_filenames=compaction_map)
+        _update_compaction_map(os.path.join(local_path, COMPACTION_MAP_FILENAME), compaction_map)
+        if bucket:
+            _upload(bucket, harvest_path, local_path, sha1s)
+        _delete(harvest_path, compaction_map, bucket)
+    finally:
+        if bucket:
+            shutil.rmtree(local_path, ignore_errors=True)
+    return len(compaction_map)
+
+
+# Compacts the harvests of a collection, in a local collections path or an S3 bucket.
+# Skip harvest path is a harvest that is in progress, which is not compacted.
+# Returns the number of files that were compacted.
+def compact_collection(collection_id, collections_path=DEFAULT_COLLECTIONS_PATH, bucket=None,
+                       target_bytes=DEFAULT_TARGET_BYTES, skip_harvest_path=None):
+    collection_path = get_collection_path(collection_id, collections_path=collections_path)
+    if bucket:
+        filepaths = [key for key, _ in list_file_sizes(bucket, collection_path)]
+    else:
+        filepaths = [os.path.join(path, filename) for path, _, filenames in os.walk(collection_path)
+                     for filename in filenames]
+    harvest_paths = sorted({os.path.dirname(filepath) for filepath in filepaths
+                            if _TWEET_FILENAME_PATTERN.match(os.path.basename(filepath))})
+    compacted = 0
+    for harvest_path in harvest_paths:
+        if harvest_path == skip_harvest_path:
+            log.info('Skipping %s, which is in progress', harvest_path)
+            continue
+        compacted += compact_harvest(harvest_path, target_bytes=target_bytes, bucket=bucket)
+    return compacted
+
+
+def _list_tweet_files(harvest_path, bucket):
+    if bucket:
+        files = [(key[len(harvest_path) + 1:], size) for key, size in list_file_sizes(bucket, harvest_path)]
+    else:
+        files = [(filename, os.path.getsize(os.path.join(harvest_path, filename)))
+                 for filename in os.listdir(harvest_path)]
+    # Only the files directly in the harvest.
+    return [(filename, size) for filename, size in files if _TWEET_FILENAME_PATTERN.match(filename)]
+
+
+# Concatenates tweet files into a new file and writes its sidecars. Returns (filename, sha1) of the new file.
+# pylint: disable=too-many-locals
+def _concatenate(path, filenames):
+    first_match = _TWEET_FILENAME_PATTERN.match(filenames[0])
+    last_match = _TWEET_FILENAME_PATTERN.match(filenames[-1])
+    # tweets-<first timestamp>-<last timestamp>. Files that were already compacted keep their first or last timestamp.
+    filename = 'tweets-{}-{}{}'.format(first_match.group(1).split('-')[0], last_match.group(1).split('-')[-1],
+                                       first_match.group(2))
+    filepath = os.path.join(path, filename)
+    log.debug('Compacting %s into %s', ', '.join(filenames), filename)
+    sha1 = hashlib.sha1()
+    stats = TweetStats()
+    index = TweetFileIndex()
+    with open(filepath, 'wb') as file:
+        for src_filename in filenames:
+            src_filepath = os.path.join(path, src_filename)
+            src_index = TweetFileIndex.load(get_index_filepath(src_filepath)) \
+                if os.path.exists(get_index_filepath(src_filepath)) else None
+            with open_tweet_file(src_filepath) as src_file:
+                for line in src_file:
+                    stats.add(line)
+                    if src_index is None:
+                        index.add(line)
+            with open(src_filepath, 'rb') as src_file:
+                while True:
+                    data = src_file.read(1024 * 1024)
+                    if not data:
+                        break
+                    sha1.update(data)
+                    file.write(data)
+            if src_index is None:
+                index.end_block(file.tell())
+            else:
+                index.append(src_index)
+    with open(get_stats_filepath(filepath), 'w') as file:
+        json.dump(stats.to_dict(), file)
+        file.write('\n')
+    with open(get_index_filepath(filepath), 'wb') as file:
+        file.write(index.to_bytes())
+    return filename, sha1.hexdigest()
+
+
+# Adds to the mapping of compacted files. Files that were compacted into a file that has now been compacted again are
+# mapped to the new file.
+def _update_compaction_map(compaction_map_filepath, compaction_map):
+    existing_map = {}
+    if os.path.exists(compaction_map_filepath):
+        with open(compaction_map_filepath) as file:
+            existing_map = json.load(file)
+    for old_filename, filename in existing_map.items():
+        existing_map[old_filename] = compaction_map.get(filename, filename)
+    existing_map.update(compaction_map)
+    with open(compaction_map_filepath, 'w') as file:
+        json.dump(existing_map, file, indent=2, sort_keys=True)
+
+
+def _download(bucket, harvest_path, local_path, filenames):
+    for filename in filenames:
+        for sidecar_filename in (filename, os.path.basename(get_index_filepath(filename))):
+            try:
+                aws_client('s3').download_file(bucket, '{}/{}'.format(harvest_path, sidecar_filename),
+                                               os.path.join(local_path, sidecar_filename))
+            except botocore.exceptions.ClientError as error:
+                # Not all files have an index.
+                if error.response['Error']['Code'] not in ('404', 'NoSuchKey') or sidecar_filename == filename:
+                    raise
+    for filename in (MANIFEST_FILENAME, COMPACTION_MAP_FILENAME):
+        try:
+            aws_client('s3').download_file(bucket, '{}/{}'.format(harvest_path, filename),
+                                           os.path.join(local_path, filename))
+        except botocore.exceptions.ClientError as error:
+            if error.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+                raise
+
+
+def _upload(bucket, harvest_path, local_path, sha1s):
+    for filename, sha1 in sha1s.items():
+        filepath = os.path.join(local_path, filename)
+        aws_client('s3').upload_file(filepath, bucket, '{}/{}'.format(harvest_path, filename),
+                                     ExtraArgs={'Metadata': {'sha1': sha1}})
+        for sidecar_filepath in (get_stats_filepath(filepath), get_index_filepath(filepath)):
+            aws_client('s3').upload_file(sidecar_filepath, bucket,
+                                         '{}/{}'.format(harvest_path, os.path.basename(sidecar_filepath)))
+    for filename in (MANIFEST_FILENAME, COMPACTION_MAP_FILENAME):
+        filepath = os.path.join(local_path, filename)
+        # Only if the harvest has a manifest.
+        if os.path.exists(filepath):
+            aws_client('s3').upload_file(filepath, bucket, '{}/{}'.format(harvest_path, filename))
+
+
+# Deletes compacted files and their sidecars.
+def _delete(harvest_path, compaction_map, bucket):
+    for old_filename in compaction_map:
+        old_filepath = '{}/{}'.format(harvest_path, old_filename)
+        for filepath in (old_filepath, get_stats_filepath(old_filepath), get_index_filepath(old_filepath)):
+            if bucket:
+                aws_client('s3').delete_object(Bucket=bucket, Key=filepath)
+            elif os.path.exists(filepath):
+                os.remove(filepath)
+
+
+def _extension(filename):
+    return _TWEET_FILENAME_PATTERN.match(filename).group(2)
+
+
+# Returns the harvest path of the harvest in progress for a collection, i.e., the harvest that holds its lock, or None.
+def locked_harvest_path(collection_id, collections_path=DEFAULT_COLLECTIONS_PATH, bucket=None):
+    lock_filepath = get_lock_file(collection_id, collections_path=collections_path)
+    if bucket:
+        if not file_exists(bucket, lock_filepath):
+            return None
+        lock = download_json(bucket, lock_filepath)
+    elif os.path.exists(lock_filepath):
+        lock = read_lock(lock_filepath)
+    else:
+        return None
+    return get_harvest_path(collection_id, dateutil.parser.parse(lock['harvest_id']),
+                            collections_path=collections_path)
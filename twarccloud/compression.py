@@ -0,0 +1,264 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import io
+import os
+import struct
+from time import time
+import zlib
+import zstandard
+
+# Compression codecs for tweet files.
+# A codec is specified as <name>[:<level>], e.g., gzip:6 or zstd:3.
+# Codecs that can compress on multiple threads (pgzip, bgzf, zstd) use the provided number of threads, defaulting to
+# the number of CPUs.
+# A codec can end a block of a stream, i.e., a gzip member or zstd frame, so that a file is a series of blocks that can
+# each be decompressed on their own, without opening a new stream and its threads for each.
+
+DEFAULT_CODEC = 'gzip'
+
+
+class GzipCodec:
+    name = 'gzip'
+    extension = '.gz'
+    levels = range(1, 10)
+    default_level = 9
+
+    # pylint: disable=unused-argument
+    def __init__(self, level=None, threads=None):
+        self.level = _check_level(self, level)
+
+    # Returns a writable, compressing stream over a binary file object.
+    # Closing the stream does not close the file object.
+    def open(self, fileobj, filename=''):
+        return gzip.GzipFile(filename=filename, mode='wb', fileobj=fileobj, compresslevel=self.level)
+
+    # Ends the current gzip member of a stream returned by open(), so that what is written after can be decompressed on
+    # its own.
+    # A GzipFile cannot start a new member, so it is closed and the caller opens another.
+    @staticmethod
+    def end_block(stream):
+        stream.close()
+
+    # Returns a readable, decompressing stream over a binary file object.
+    @staticmethod
+    def open_reader(fileobj):
+        return gzip.GzipFile(fileobj=fileobj, mode='rb')
+
+    def __str__(self):
+        return '{}:{}'.format(self.name, self.level)
+
+
+# Gzip, compressed in parallel blocks. Any gunzip can read the resulting multi-member file.
+class ParallelGzipCodec:
+    name = 'pgzip'
+    extension = '.gz'
+    levels = range(1, 10)
+    default_level = 6
+    bgzf = False
+
+    def __init__(self, level=None, threads=None):
+        self.level = _check_level(self, level)
+        self.threads = threads or os.cpu_count() or 1
+
+    # pylint: disable=unused-argument
+    def open(self, fileobj, filename=''):
+        return ParallelGzipFile(fileobj, level=self.level, threads=self.threads, bgzf=self.bgzf)
+
+    # Every block is its own member, so flushing ends the member and keeps the pool of threads.
+    @staticmethod
+    def end_block(stream):
+        stream.flush()
+
+    open_reader = staticmethod(GzipCodec.open_reader)
+
+    def __str__(self):
+        return '{}:{}'.format(self.name, self.level)
+
+
+# Gzip, compressed in parallel BGZF blocks. BGZF files are also readable by any gunzip and, since every block
+# records its size, can be split without decompressing.
+class BgzfCodec(ParallelGzipCodec):
+    name = 'bgzf'
+    bgzf = True
+
+
+class ZstdCodec:
+    name = 'zstd'
+    extension = '.zst'
+    levels = range(1, 23)
+    default_level = 3
+
+    def __init__(self, level=None, threads=None):
+        self.level = _check_level(self, level)
+        self.threads = threads or os.cpu_count() or 1
+
+    # pylint: disable=unused-argument
+    def open(self, fileobj, filename=''):
+        # Zstandard does its own multi-threading.
+        return zstandard.ZstdCompressor(level=self.level, threads=self.threads if self.threads > 1 else 0) \
+            .stream_writer(fileobj, closefd=False)
+
+    # Ends the current frame, keeping the compressor and its threads.
+    @staticmethod
+    def end_block(stream):
+        stream.flush(zstandard.FLUSH_FRAME)
+
+    # Buffered, so that lines can be iterated.
+    @staticmethod
+    def open_reader(fileobj):
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(fileobj, read_across_frames=True))
+
+    def __str__(self):
+        return '{}:{}'.format(self.name, self.level)
+
+
+# The first codec for an extension is used for reading.
+CODECS = {codec.name: codec for codec in (GzipCodec, ParallelGzipCodec, BgzfCodec, ZstdCodec)}
+
+
+# Returns a codec for a codec specification, e.g., gzip:6.
+# If no specification, returns the default codec.
+def get_codec(codec_spec=None, threads=None):
+    name, _, level = (codec_spec or DEFAULT_CODEC).partition(':')
+    if name not in CODECS:
+        raise ValueError('Unknown codec: {}'.format(name))
+    if level and not level.isdigit():
+        raise ValueError('Codec level must be a number: {}'.format(level))
+    return CODECS[name](int(level) if level else None, threads=threads)
+
+
+# Returns the codec for a tweet file based on its extension.
+def get_codec_for_filepath(filepath):
+    for codec_class in CODECS.values():
+        if filepath.endswith(codec_class.extension):
+            return codec_class()
+    raise ValueError('Unknown compression for {}'.format(filepath))
+
+
+# Opens a compressed tweet file for reading.
+def open_tweet_file(filepath):
+    return get_codec_for_filepath(filepath).open_reader(open(filepath, 'rb'))
+
+
+# Compresses a sample of tweets with each codec.
+# Returns a list of (codec, MB per second, compression ratio).
+def benchmark(sample, codec_specs, threads=None):
+    results = []
+    for codec_spec in codec_specs:
+        codec = get_codec(codec_spec, threads=threads)
+        compressed = io.BytesIO()
+        start = time()
+        with codec.open(compressed) as file:
+            file.write(sample)
+        secs = max(time() - start, 1e-6)
+        results.append((str(codec), len(sample) / secs / 1024 / 1024, len(sample) / len(compressed.getvalue())))
+    return results
+
+
+# A writable file object that compresses blocks of data as independent gzip members on a pool of threads, in the
+# manner of pigz. zlib releases the GIL while compressing, so blocks are compressed concurrently.
+# Members are written to the underlying file object in order. To bound memory, no more than twice the number of threads
+# blocks are in flight at once.
+# In BGZF mode, each block is further split into BGZF blocks and an empty BGZF block marks the end of the file.
+# Closing does not close the underlying file object.
+# pylint: disable=too-many-instance-attributes
+class ParallelGzipFile(io.RawIOBase):
+    # pylint: disable=too-many-arguments
+    def __init__(self, fileobj, level=6, threads=None, block_size=1024 * 1024, bgzf=False):
+        io.RawIOBase.__init__(self)
+        self.fileobj = fileobj
+        self.level = level
+        self.threads = threads or os.cpu_count() or 1
+        self.block_size = block_size
+        self.bgzf = bgzf
+        self.buffer = bytearray()
+        self.in_flight = deque()
+        self.executor = ThreadPoolExecutor(max_workers=self.threads)
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+        self.buffer.extend(data)
+        while len(self.buffer) >= self.block_size:
+            self._submit(bytes(self.buffer[:self.block_size]))
+            del self.buffer[:self.block_size]
+        return len(data)
+
+    # Writes everything that has been compressed so far.
+    # Since members are independent, the file is readable up to this point.
+    def flush(self):
+        if self.closed:
+            return
+        if self.buffer:
+            self._submit(bytes(self.buffer))
+            self.buffer = bytearray()
+        self._drain(0)
+        self.fileobj.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.flush()
+            if self.bgzf:
+                self.fileobj.write(BGZF_EOF)
+        finally:
+            self.executor.shutdown()
+            io.RawIOBase.close(self)
+
+    def _submit(self, block):
+        self.in_flight.append(self.executor.submit(compress_bgzf_block if self.bgzf else compress_gzip_member,
+                                                   block, self.level))
+        self._drain(self.threads * 2)
+
+    # Writes completed members, in order, until no more than max_in_flight remain.
+    def _drain(self, max_in_flight):
+        while len(self.in_flight) > max_in_flight:
+            self.fileobj.write(self.in_flight.popleft().result())
+
+
+# Compresses data as a single gzip member.
+def compress_gzip_member(data, level, extra=b'', mtime=None):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    deflated = compressor.compress(data) + compressor.flush()
+    # FEXTRA flag if there is an extra field. Operating system unknown.
+    if mtime is None:
+        mtime = int(time())
+    header = b'\x1f\x8b\x08' + (b'\x04' if extra else b'\x00') + struct.pack('<I', mtime) + b'\x00\xff'
+    if extra:
+        header += struct.pack('<H', len(extra)) + extra
+    return header + deflated + struct.pack('<II', zlib.crc32(data) & 0xffffffff, len(data) & 0xffffffff)
+
+
+# BGZF limits blocks to 64KB, compressed or not. This much input always fits.
+BGZF_BLOCK_SIZE = 65280
+
+
+# Compresses data as a series of BGZF blocks.
+def compress_bgzf_block(data, level):
+    members = []
+    for start in range(0, len(data), BGZF_BLOCK_SIZE):
+        members.append(_compress_bgzf_member(data[start:start + BGZF_BLOCK_SIZE], level))
+    return b''.join(members)
+
+
+def _compress_bgzf_member(data, level):
+    # The BC subfield records the size of the member minus 1, so compress with a placeholder, then fill it in.
+    member = compress_gzip_member(data, level, extra=b'BC\x02\x00\x00\x00', mtime=0)
+    return member[:16] + struct.pack('<H', len(member) - 1) + member[18:]
+
+
+# Empty BGZF block that marks the end of a BGZF file.
+BGZF_EOF = _compress_bgzf_member(b'', 6)
+
+
+def _check_level(codec, level):
+    if level is None:
+        return codec.default_level
+    if level not in codec.levels:
+        raise ValueError('{} level must be between {} and {}'.format(codec.name, codec.levels[0], codec.levels[-1]))
+    return level
@@ -1,5 +1,6 @@
 import logging
 import os
+import re
 import configparser
 from collections import namedtuple
 from honeybadger import honeybadger
@@ -8,6 +9,9 @@ from twarccloud.exceptions import TwarcCloudException
 from twarccloud import log
 
 
+_SIZE_PATTERN = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)I?B?\s*$', re.IGNORECASE)
+_SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
 AwsConfiguration = namedtuple('AwsConfiguration',
                               ['cluster', 'task_role_arn', 'task_execution_role_arn', 'event_role_arn',
                                'security_group', 'subnet', 'log_group', 'honeybadger_key', 'image_tag'])
@@ -84,6 +88,15 @@ def _config_value(key, args, ini_config):
     return value
 
 
+# Parses a size such as 256MB, 1.5G or 1024 into a number of bytes.
+# Units are powers of 1024.
+def parse_size(size):
+    match = _SIZE_PATTERN.match(str(size))
+    if not match:
+        raise ValueError('Invalid size: {}'.format(size))
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).upper()])
+
+
 def aws_configuration(ini_config):
     section = ini_config['DEFAULT']
     return AwsConfiguration(section['cluster'], section['task_role_arn'], section['task_execution_role_arn'],
@@ -0,0 +1,289 @@
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import json
+import multiprocessing
+import os
+import re
+import shutil
+from tempfile import mkdtemp
+from time import time
+from twarccloud.aws import aws_client
+from twarccloud.aws.s3 import download_json, file_exists
+from twarccloud.collection_reader import CollectionReader
+from twarccloud.compression import open_tweet_file
+from twarccloud.exceptions import TwarcCloudException
+from twarccloud.filepaths_helper import DEFAULT_COLLECTIONS_PATH, COMPACTION_MAP_FILENAME
+from twarccloud.raw_tweet_helper import tweet_timestamp
+from twarccloud import log
+# pyarrow is only needed for exporting, so it is not required.
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Exports of collections to Parquet for analysis.
+
+PARTITION_HARVEST_DATE = 'harvest_date'
+PARTITION_CREATED_HOUR = 'created_hour'
+PARTITIONS = (PARTITION_HARVEST_DATE, PARTITION_CREATED_HOUR)
+
+# Field specifications: [<column name>=]<dotted path>[|<dotted path>...][:<type>]. The first path with a value is used.
+# Paths through lists, e.g., entities.hashtags.text, collect a value from each element.
+DEFAULT_FIELDS = (
+    'id=id_str',
+    'created_at:timestamp',
+    'user_id=user.id_str',
+    'screen_name=user.screen_name',
+    'text=extended_tweet.full_text|full_text|text',
+    'lang',
+    'source',
+    'retweet_count:int64',
+    'favorite_count:int64',
+    'quote_count:int64',
+    'reply_count:int64',
+    'in_reply_to_status_id=in_reply_to_status_id_str',
+    'in_reply_to_user_id=in_reply_to_user_id_str',
+    'quoted_status_id=quoted_status_id_str',
+    'retweeted_status_id=retweeted_status.id_str',
+    'hashtags=entities.hashtags.text:list',
+    'mentions=entities.user_mentions.screen_name:list',
+    'urls=entities.urls.expanded_url:list',
+    'user_followers_count=user.followers_count:int64',
+    'user_verified=user.verified:bool'
+)
+
+FIELD_TYPES = ('string', 'int64', 'float64', 'bool', 'timestamp', 'list')
+
+_FIELD_PATTERN = re.compile(r'^(?:(\w+)=)?([\w.|]+)(?::(\w+))?$')
+_HARVEST_PATH_PATTERN = re.compile(r'/harvests/(\d{4})/(\d{2})/(\d{2})/')
+_CREATED_AT_FORMAT = '%a %b %d %H:%M:%S +0000 %Y'
+_INT64_MIN = -2 ** 63
+_INT64_MAX = 2 ** 63 - 1
+
+ExportStats = namedtuple('ExportStats', ['files', 'tweets', 'secs'])
+
+
+# A column of the export, projected from tweets by a field specification.
+class Field:
+    def __init__(self, spec):
+        match = _FIELD_PATTERN.match(spec)
+        if not match:
+            raise ValueError('Invalid field: {}'.format(spec))
+        self.paths = [path.split('.') for path in match.group(2).split('|')]
+        self.name = match.group(1) or match.group(2).split('|')[0].replace('.', '_')
+        self.type = match.group(3) or 'string'
+        if self.type not in FIELD_TYPES:
+            raise ValueError('Field type must be one of {}: {}'.format(', '.join(FIELD_TYPES), spec))
+
+    def value(self, tweet):
+        for path in self.paths:
+            value = get_path(tweet, path)
+            if value is not None and value != []:
+                return self._convert(value)
+        return None
+
+    # Values that don't convert to the field type are None, so that a bad value doesn't fail the file.
+    def _convert(self, value):
+        if self.type == 'list':
+            return [_to_string(item) for item in (value if isinstance(value, list) else [value])]
+        if self.type == 'timestamp':
+            return _to_timestamp(value)
+        if self.type == 'string':
+            return _to_string(value)
+        if self.type == 'int64':
+            return _to_int64(value)
+        if self.type == 'float64':
+            return _to_float(value)
+        return _to_bool(value)
+
+    def arrow_type(self):
+        if self.type == 'list':
+            return pyarrow.list_(pyarrow.string())
+        if self.type == 'timestamp':
+            return pyarrow.timestamp('s')
+        if self.type == 'bool':
+            return pyarrow.bool_()
+        return getattr(pyarrow, self.type)()
+
+
+# Exports the tweets of a collection, in a local collections path or an S3 bucket, to Parquet files in output path.
+# Files are partitioned by harvest date or tweet creation hour into Hive-style directories, e.g.,
+# created_hour=2019-03-10T14. Each tweet file is exported by a worker process to its own Parquet file in each
+# partition, named for the tweet file, so exporting again replaces rather than duplicates. Since compaction replaces
+# tweet files with a file of a new name, the exports of files that have been compacted are removed.
+# A worker holds no more than batch size tweets per partition in memory before writing them as a row group.
+# Messages that are not tweets, e.g., filter stream limit notices, are skipped.
+# Returns ExportStats.
+# pylint: disable=too-many-arguments
+def export_collection(collection_id, output_path, collections_path=DEFAULT_COLLECTIONS_PATH, bucket=None,
+                      fields=None, partition=PARTITION_HARVEST_DATE, workers=None, batch_size=10000):
+    if pyarrow is None:
+        raise TwarcCloudException('Exporting requires pyarrow. To install: pip install pyarrow')
+    if partition not in PARTITIONS:
+        raise ValueError('Partition must be one of {}: {}'.format(', '.join(PARTITIONS), partition))
+    field_specs = list(fields or DEFAULT_FIELDS)
+    # Fail before starting workers.
+    for field_spec in field_specs:
+        Field(field_spec)
+    start = time()
+    tweet_filepaths = CollectionReader(collection_id, collections_path=collections_path,
+                                       bucket=bucket).tweet_files()
+    _remove_compacted_exports(tweet_filepaths, output_path, bucket)
+    tasks = [(tweet_filepath, output_path, bucket, field_specs, partition, batch_size)
+             for tweet_filepath in tweet_filepaths]
+    workers = workers or os.cpu_count() or 1
+    # A single worker exports in this process.
+    if workers == 1:
+        counts = [_export_file(*task) for task in tasks]
+    else:
+        # Spawned rather than forked, so that workers don't inherit this process's threads or S3 connections.
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            counts = list(executor.map(_export_file, *zip(*tasks))) if tasks else []
+    return ExportStats(len(tasks), sum(counts), time() - start)
+
+
+# Exports a tweet file. Returns the number of tweets exported.
+# pylint: disable=too-many-arguments, too-many-locals
+def _export_file(tweet_filepath, output_path, bucket, field_specs, partition, batch_size):
+    fields = [Field(field_spec) for field_spec in field_specs]
+    schema = pyarrow.schema([(field.name, field.arrow_type()) for field in fields])
+    basename = _export_basename(tweet_filepath)
+    temp_path = None
+    local_filepath = tweet_filepath
+    if bucket:
+        temp_path = mkdtemp()
+        local_filepath = os.path.join(temp_path, os.path.basename(tweet_filepath))
+        aws_client('s3').download_file(bucket, tweet_filepath, local_filepath)
+    log.debug('Exporting %s', tweet_filepath)
+    harvest_date = _harvest_date(tweet_filepath)
+    # Rows for each partition, as lists of column values.
+    batches = {}
+    writers = {}
+    count = 0
+    try:
+        with open_tweet_file(local_filepath) as file:
+            for line in file:
+                tweet = json.loads(line.decode('utf-8'))
+                if 'id' not in tweet:
+                    continue
+                partition_value = harvest_date if partition == PARTITION_HARVEST_DATE else \
+                    datetime.utcfromtimestamp(tweet_timestamp(tweet['id'])).strftime('%Y-%m-%dT%H')
+                columns = batches.setdefault(partition_value, [[] for _ in fields])
+                for field, column in zip(fields, columns):
+                    column.append(field.value(tweet))
+                count += 1
+                if len(columns[0]) == batch_size:
+                    _write_batch(writers, batches.pop(partition_value), partition_value, schema, output_path,
+                                 partition, basename)
+        for partition_value, columns in batches.items():
+            _write_batch(writers, columns, partition_value, schema, output_path, partition, basename)
+    finally:
+        for writer in writers.values():
+            writer.close()
+        if temp_path:
+            shutil.rmtree(temp_path, ignore_errors=True)
+    return count
+
+
+# Removes the exports of tweet files that were compacted, as recorded by the compacted_files.json of their harvests.
+def _remove_compacted_exports(tweet_filepaths, output_path, bucket):
+    if not os.path.exists(output_path):
+        return
+    basenames = set()
+    for harvest_path in {os.path.dirname(tweet_filepath) for tweet_filepath in tweet_filepaths}:
+        compaction_map_filepath = '{}/{}'.format(harvest_path, COMPACTION_MAP_FILENAME)
+        if bucket:
+            compaction_map = download_json(bucket, compaction_map_filepath) \
+                if file_exists(bucket, compaction_map_filepath) else {}
+        elif os.path.exists(compaction_map_filepath):
+            with open(compaction_map_filepath) as file:
+                compaction_map = json.load(file)
+        else:
+            compaction_map = {}
+        basenames.update(_export_basename(filename) for filename in compaction_map)
+    for partition_dirname in os.listdir(output_path):
+        for basename in basenames:
+            filepath = os.path.join(output_path, partition_dirname, '{}.parquet'.format(basename))
+            if os.path.exists(filepath):
+                log.debug('Removing %s, which was compacted', filepath)
+                os.remove(filepath)
+
+
+# The name of the Parquet files a tweet file is exported to, e.g., tweets-20190310150000 for
+# tweets-20190310150000.jsonl.gz.
+def _export_basename(tweet_filepath):
+    return os.path.basename(tweet_filepath).split('.')[0]
+
+
+# pylint: disable=too-many-arguments
+def _write_batch(writers, columns, partition_value, schema, output_path, partition, basename):
+    if partition_value not in writers:
+        partition_path = os.path.join(output_path, '{}={}'.format(partition, partition_value))
+        os.makedirs(partition_path, exist_ok=True)
+        writers[partition_value] = pyarrow.parquet.ParquetWriter(
+            os.path.join(partition_path, '{}.parquet'.format(basename)), schema)
+    arrays = [pyarrow.array(column, type=schema_field.type) for column, schema_field in zip(columns, schema)]
+    writers[partition_value].write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+
+
+def _harvest_date(tweet_filepath):
+    match = _HARVEST_PATH_PATTERN.search(tweet_filepath)
+    return '{}-{}-{}'.format(*match.groups()) if match else 'unknown'
+
+
+# Returns the value at a path (a list of keys) of a tweet, or None. Paths through lists return a list of the values for
+# each element.
+def get_path(value, path):
+    for index, key in enumerate(path):
+        if isinstance(value, list):
+            return [item for item in (get_path(element, path[index:]) for element in value) if item is not None]
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def _to_string(value):
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+def _to_timestamp(value):
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.strptime(value, _CREATED_AT_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_int64(value):
+    if isinstance(value, (dict, list)):
+        return None
+    try:
+        value = int(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return value if _INT64_MIN <= value <= _INT64_MAX else None
+
+
+def _to_float(value):
+    if isinstance(value, (dict, list)):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_bool(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        return {'true': True, 'false': False}.get(value.lower())
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    return None
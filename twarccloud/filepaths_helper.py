@@ -1,6 +1,11 @@
+from datetime import datetime, timedelta
+
 # Methods that produce paths and filepaths.
 
 DEFAULT_COLLECTIONS_PATH = 'collections'
+MANIFEST_FILENAME = 'manifest-sha1.txt'
+COMPACTION_MAP_FILENAME = 'compacted_files.json'
+TWEET_INDEX_DIRNAME = 'tweet_index'
 
 
 # Returns path for collection.
@@ -41,7 +46,25 @@ def get_user_changes_filepath(collection_id, harvest_timestamp, collections_path
 
 # Returns filepath for a harvester manifest.
 def get_harvest_manifest_filepath(collection_id, harvest_timestamp, collections_path=DEFAULT_COLLECTIONS_PATH):
-    return get_harvest_file(collection_id, harvest_timestamp, 'manifest-sha1.txt', collections_path=collections_path)
+    return get_harvest_file(collection_id, harvest_timestamp, MANIFEST_FILENAME, collections_path=collections_path)
+
+
+# Returns filepath for the mapping of tweet files that were compacted to the files they were compacted into.
+def get_harvest_compaction_map_filepath(collection_id, harvest_timestamp, collections_path=DEFAULT_COLLECTIONS_PATH):
+    return get_harvest_file(collection_id, harvest_timestamp, COMPACTION_MAP_FILENAME,
+                            collections_path=collections_path)
+
+
+# Returns filepath for a segment of a harvester manifest.
+def get_harvest_manifest_segment_filepath(collection_id, harvest_timestamp, segment,
+                                          collections_path=DEFAULT_COLLECTIONS_PATH):
+    return get_harvest_file(collection_id, harvest_timestamp, 'manifest-sha1-{:05d}.txt'.format(segment),
+                            collections_path=collections_path)
+
+# Returns filepath for a harvest's checkpoint file.
+def get_harvest_checkpoint_filepath(collection_id, harvest_timestamp, collections_path=DEFAULT_COLLECTIONS_PATH):
+    return get_harvest_file(collection_id, harvest_timestamp, 'checkpoint.json', collections_path=collections_path)
+
 
 # Returns filepath for a lock file.
 def get_lock_file(collection_id, collections_path=DEFAULT_COLLECTIONS_PATH):
@@ -58,6 +81,22 @@ def get_collection_config_filepath(collection_id, collections_path=DEFAULT_COLLE
     return get_collection_file(collection_id, 'collection.json', collections_path=collections_path)
 
 
+# Returns filepath for the user activity file.
+def get_user_activity_filepath(collection_id, collections_path=DEFAULT_COLLECTIONS_PATH):
+    return get_collection_file(collection_id, 'user_activity.json', collections_path=collections_path)
+
+
+# Returns path for the segments of the index of the ids of the tweets collected for a collection.
+def get_tweet_index_path(collection_id, collections_path=DEFAULT_COLLECTIONS_PATH):
+    return get_collection_file(collection_id, TWEET_INDEX_DIRNAME, collections_path=collections_path)
+
+
+# Returns filepath for a harvest's list of the ids of tweets that had already been collected.
+def get_harvest_duplicates_filepath(collection_id, harvest_timestamp, collections_path=DEFAULT_COLLECTIONS_PATH):
+    return get_harvest_file(collection_id, harvest_timestamp, 'duplicate_tweet_ids.txt',
+                            collections_path=collections_path)
+
+
 # Returns path for changesets.
 def get_changesets_path(collection_id, collections_path=DEFAULT_COLLECTIONS_PATH):
     return get_collection_file(collection_id, 'changesets', collections_path=collections_path)
@@ -67,3 +106,47 @@ def get_changesets_path(collection_id, collections_path=DEFAULT_COLLECTIONS_PATH
 def get_changeset_file(collection_id, change_timestamp, collections_path=DEFAULT_COLLECTIONS_PATH):
     return '{}/change-{}.json'.format(get_changesets_path(collection_id, collections_path=collections_path),
                                       change_timestamp.strftime('%Y%m%d%H%M%S'))
+
+
+# Path components of a harvest path, from year to second.
+_HARVEST_PATH_FORMATS = ('%Y', '%m', '%d', '%H', '%M', '%S')
+
+
+# Returns the minimal list of harvest path prefixes that covers harvests with timestamps from since (inclusive) to until
+# (exclusive), e.g., collections/<id>/harvests/2019/03/ for all of March 2019.
+# Whole years, months, days, hours and minutes in the range are each a single prefix; partially covered ones are
+# broken into their parts.
+def get_harvest_prefixes(collection_id, since, until, collections_path=DEFAULT_COLLECTIONS_PATH):
+    since = since.replace(microsecond=0)
+    # Harvest timestamps are to the second, so a partial second includes that second.
+    if until.microsecond:
+        until = until.replace(microsecond=0) + timedelta(seconds=1)
+    harvests_path = get_collection_file(collection_id, 'harvests', collections_path=collections_path)
+    prefixes = []
+    if since < until:
+        for year in range(since.year, (until - timedelta(seconds=1)).year + 1):
+            prefixes.extend(_harvest_prefixes(datetime(year, 1, 1), 0, since, until, harvests_path))
+    return prefixes
+
+
+def _harvest_prefixes(unit_start, level, since, until, harvests_path):
+    unit_end = _next_unit(unit_start, level)
+    if unit_end <= since or unit_start >= until:
+        return
+    if since <= unit_start and unit_end <= until:
+        yield '{}/{}/'.format(harvests_path, unit_start.strftime('/'.join(_HARVEST_PATH_FORMATS[:level + 1])))
+        return
+    child_start = unit_start
+    while child_start < unit_end:
+        yield from _harvest_prefixes(child_start, level + 1, since, until, harvests_path)
+        child_start = _next_unit(child_start, level + 1)
+
+
+# Returns the start of the next year, month, day, hour, minute or second.
+def _next_unit(unit_start, level):
+    if level == 0:
+        return unit_start.replace(year=unit_start.year + 1)
+    if level == 1:
+        return unit_start.replace(year=unit_start.year + 1, month=1) if unit_start.month == 12 \
+            else unit_start.replace(month=unit_start.month + 1)
+    return unit_start + (timedelta(days=1), timedelta(hours=1), timedelta(minutes=1), timedelta(seconds=1))[level - 2]
@@ -0,0 +1,37 @@
+from math import ceil
+
+# Limits of a single filter stream connection.
+TRACK_LIMIT = 400
+FOLLOW_LIMIT = 5000
+# Bounding boxes, each of 4 coordinates.
+LOCATIONS_LIMIT = 25
+
+
+# Splits a filter into shards, each within the limits of a single filter stream connection.
+# Terms, user ids and bounding boxes are dealt out to the shards in turn. A filter within the limits is returned as the
+# only shard, unchanged.
+def split_filter(filter_config):
+    track = _split_list(filter_config.get('track'))
+    follow = _split_list(filter_config.get('follow'))
+    coordinates = _split_list(filter_config.get('locations'))
+    boxes = [coordinates[start:start + 4] for start in range(0, len(coordinates), 4)]
+    count = max(ceil(len(track) / TRACK_LIMIT), ceil(len(follow) / FOLLOW_LIMIT), ceil(len(boxes) / LOCATIONS_LIMIT),
+                1)
+    if count == 1:
+        return [{key: filter_config.get(key) for key in ('track', 'follow', 'locations')}]
+    shards = []
+    for shard in range(count):
+        shards.append({
+            'track': ','.join(track[shard::count]) or None,
+            'follow': ','.join(follow[shard::count]) or None,
+            'locations': ','.join(coordinate for box in boxes[shard::count] for coordinate in box) or None
+        })
+    return shards
+
+
+def _split_list(value):
+    if not value:
+        return []
+    if not isinstance(value, list):
+        value = value.split(',')
+    return [item.strip() for item in value if item.strip()]
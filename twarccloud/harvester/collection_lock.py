@@ -1,6 +1,10 @@
 import os
 import shutil
+import json
+from datetime import datetime, timedelta
+from threading import Thread, Event
 from queue import Queue
+import dateutil.parser
 from twarccloud.harvester.file_mover_thread import S3FileMoverThread, DeleteFile, AddFile
 from twarccloud.aws.aws_helper import sync_collection_config
 from twarccloud.harvester.file_queueing_writer import FileQueueingWriter
@@ -9,25 +13,48 @@ from twarccloud import log
 
 
 # Provides locking for a collection by placing and removing lock.json in the root of the collection.
+# If heartbeat secs, the lock is rewritten with the current time every heartbeat secs while locked, so that a lock left
+# behind by a harvester that died can be recognized as stale. Without heartbeat secs, the lock has no heartbeat, so it
+# is never stale.
 class CollectionLock:
-    def __init__(self, collections_path, collection_id, file_queue, harvest_timestamp=None):
+    # pylint: disable=too-many-arguments
+    def __init__(self, collections_path, collection_id, file_queue, harvest_timestamp=None, heartbeat_secs=None):
         self.lock_filepath = get_lock_file(collection_id, collections_path=collections_path)
         self.last_harvest_filepath = get_last_harvest_file(collection_id, collections_path=collections_path)
         self.harvest_timestamp = harvest_timestamp
         self.file_queue = file_queue
+        self.heartbeat_secs = heartbeat_secs
+        self.heartbeat_thread = None
+        self.stop_heartbeat_event = Event()
 
     # Lock the collection.
     def lock(self):
         log.debug('Locking')
+        self._write_lock()
+        if self.heartbeat_secs:
+            self.heartbeat_thread = Thread(target=self._heartbeat, daemon=True)
+            self.heartbeat_thread.start()
+
+    def _write_lock(self):
         lock = {
             'harvest_id': self.harvest_timestamp.isoformat()
         }
+        if self.heartbeat_secs:
+            lock['heartbeat'] = datetime.utcnow().isoformat()
         with FileQueueingWriter(self.lock_filepath, self.file_queue) as lock_writer:
             lock_writer.write_json(lock, indent=2)
 
+    def _heartbeat(self):
+        while not self.stop_heartbeat_event.wait(self.heartbeat_secs):
+            log.debug('Heartbeat')
+            self._write_lock()
+
     # Unlock the collection.
     # Unless forced, moves lock.json to last_harvest.json.
     def unlock(self, force=False):
+        if self.heartbeat_thread:
+            self.stop_heartbeat_event.set()
+            self.heartbeat_thread.join()
         if not os.path.exists(self.lock_filepath):
             log.warning('Not locked')
             return
@@ -65,6 +92,21 @@ def assert_locked(lock_filepath):
         raise LockedException
 
 
+# Returns the lock at the provided filepath.
+def read_lock(lock_filepath):
+    with open(lock_filepath) as file:
+        return json.load(file)
+
+
+# Returns True if the lock at the provided filepath has not had a heartbeat for stale secs.
+# Locks without a heartbeat are never stale.
+def is_stale(lock_filepath, stale_secs):
+    heartbeat = read_lock(lock_filepath).get('heartbeat')
+    if not heartbeat:
+        return False
+    return datetime.utcnow() - dateutil.parser.parse(heartbeat) > timedelta(seconds=stale_secs)
+
+
 # Forces the unlocking of a collection.
 # pylint: disable=too-many-function-args
 def force_unlock(local_collections_path, collection_id, bucket=None):
@@ -0,0 +1,87 @@
+import json
+import requests
+from twarccloud.harvester.twarc_client import TwarcClient
+from twarccloud.harvester.rate_limiter import RateLimiter
+from twarccloud import log
+
+# Twitter error codes for credentials that can no longer be used.
+# 32: Could not authenticate you. 64: Your account is suspended. 89: Invalid or expired token.
+# 326: This account is temporarily locked.
+REVOKED_ERROR_CODES = (32, 64, 89, 326)
+
+
+# A set of keys, with the rate limits for those keys.
+# Shared by all clients that use the keys, so that together they stay within the rate limits.
+class Credential:
+    def __init__(self, keys):
+        self.keys = keys
+        self.rate_limiter = RateLimiter()
+        self.revoked = False
+
+    # Returns a Twarc client that uses these keys.
+    def create_client(self, stop_event=None, **kwargs):
+        return TwarcClient(*_key_args(self.keys), rate_limiter=self.rate_limiter, stop_event=stop_event, **kwargs)
+
+    def __str__(self):
+        return self.keys['access_token'].split('-')[0]
+
+
+# Returns credentials for a list of sets of keys.
+def create_credentials(key_sets):
+    return [Credential(keys) for keys in key_sets]
+
+
+# Twarc client that spreads GETs across a pool of credentials.
+# Each GET is made with the credential that has the most requests remaining for the endpoint, so when one credential's
+# rate limit is used up, requests move to the next. Only when all are used up does a request wait, for the credential
+# that resets first.
+# A credential that is revoked is dropped from the pool and the request is retried with another.
+# POSTs, i.e., the filter stream, use the first credential.
+# Clients are not thread-safe, so each thread should have its own pool client. The credentials may be shared.
+class CredentialPoolClient(TwarcClient):
+    def __init__(self, credentials, stop_event=None, **kwargs):
+        self.credentials = credentials
+        self.client_kwargs = kwargs
+        # Map of credential to client.
+        self.clients = {}
+        TwarcClient.__init__(self, *_key_args(credentials[0].keys), rate_limiter=credentials[0].rate_limiter,
+                             stop_event=stop_event, **kwargs)
+
+    def get(self, *args, **kwargs):
+        url = args[0] if args else kwargs['url']
+        while True:
+            credential = self._choose(url)
+            try:
+                return self._client(credential).get(*args, **kwargs)
+            except requests.exceptions.HTTPError as exception:
+                if not _is_revoked(exception):
+                    raise exception
+                credential.revoked = True
+                log.error('Credential %s has been revoked: %s', credential, exception)
+                if not self._active_credentials():
+                    raise exception
+
+    def _choose(self, url):
+        return max(self._active_credentials(), key=lambda credential: credential.rate_limiter.allowance(url))
+
+    def _active_credentials(self):
+        return [credential for credential in self.credentials if not credential.revoked]
+
+    def _client(self, credential):
+        if credential not in self.clients:
+            self.clients[credential] = credential.create_client(stop_event=self.stop_event, **self.client_kwargs)
+        return self.clients[credential]
+
+
+def _key_args(keys):
+    return keys['consumer_key'], keys['consumer_secret'], keys['access_token'], keys['access_token_secret']
+
+
+def _is_revoked(exception):
+    if exception.response is None or exception.response.status_code not in (401, 403):
+        return False
+    try:
+        errors = exception.response.json().get('errors', [])
+    except (json.decoder.JSONDecodeError, AttributeError):
+        return False
+    return any(error.get('code') in REVOKED_ERROR_CODES for error in errors)
@@ -1,58 +1,239 @@
 import threading
-from queue import Empty
-from time import sleep
+from queue import PriorityQueue
+from itertools import count
 import os
 from collections import namedtuple
-from twarccloud.filepaths_helper import DEFAULT_COLLECTIONS_PATH
+from twarccloud.filepaths_helper import DEFAULT_COLLECTIONS_PATH, TWEET_INDEX_DIRNAME
 from twarccloud.aws import aws_client
 from twarccloud import log
 
 
-AddFile = namedtuple('AddFile', ['filepath', 'delete'])
+# sha1 is the hex digest of the file, if already known. It is stored with the uploaded file.
+AddFile = namedtuple('AddFile', ['filepath', 'delete', 'sha1'])
+AddFile.__new__.__defaults__ = (None,)
 DeleteFile = namedtuple('DeleteFile', ['filepath'])
 
+# Priorities for uploading. Lower goes first.
+PRIORITY_DATA = 0
+PRIORITY_METADATA = 1
+
+# Files that mark the state of a collection or the progress of a harvest. These are barriers: everything queued before
+# them must land in S3 first.
+BARRIER_FILENAMES = ('lock.json', 'last_harvest.json', 'checkpoint.json')
+
+# Placed on the queue to tell the thread to finish.
+_STOP = object()
+# Placed on the queue to wait for the files queued before it. The event is set once they are moved.
+_Flush = namedtuple('_Flush', ['event'])
+
 
 # Thread that moves files to S3 that are placed on a provided queue.
+# Files are uploaded by a pool of workers. Tweet files are uploaded before metadata files. If a metadata file is queued
+# again before it has been uploaded, it is only uploaded once. If a file is queued again while it is being uploaded, it
+# is held until that upload is done, so that uploads of the same file never overlap and the latest lands last.
+# Metadata files are held for debounce seconds before uploading, so that a file that is rewritten repeatedly, e.g.,
+# the manifest, is uploaded once for a burst of changes rather than once per change.
+# Deletes, the collection's lock, last harvest and checkpoint files and the segments of its tweet index are barriers:
+# they wait for all files queued before them to be uploaded, so that the lock is not released or progress recorded
+# before the data is in S3.
+# A deleted file is also removed locally, if it is still there.
+# pylint: disable=too-many-instance-attributes
 class S3FileMoverThread(threading.Thread):
-    def __init__(self, queue, collections_path, bucket):
+    # pylint: disable=too-many-arguments
+    def __init__(self, queue, collections_path, bucket, workers=4, debounce_secs=10):
         self.queue = queue
         self.collections_path = collections_path
         self.bucket = bucket
-        self.stop_event = threading.Event()
+        self.workers = workers
+        self.debounce_secs = debounce_secs
+        # Files waiting for a worker, as (priority, sequence, filepath).
+        self.pending = PriorityQueue()
+        # Latest file placed on the queue for each pending filepath.
+        self.pending_files = {}
+        # Files being uploaded, by filepath.
+        self.in_flight = {}
+        # Latest file placed on the queue for each filepath that is being uploaded.
+        self.held = {}
+        # Timers for metadata files that are being debounced.
+        self.debouncing = {}
+        self.pending_lock = threading.Lock()
+        self.sequence = count()
         self.exception = None
         threading.Thread.__init__(self)
 
     def run(self):
+        worker_threads = [threading.Thread(target=self._work) for _ in range(self.workers)]
+        for worker_thread in worker_threads:
+            worker_thread.start()
         try:
             log.debug('Starting file processor thread')
-            while not self.stop_event.is_set() or not self.queue.empty():
-                try:
-                    src_file = self.queue.get_nowait()
-                    if self.bucket:
-                        self._move(src_file)
-                    else:
-                        log.debug('Skipping moving %s since local', src_file.filepath)
+            while True:
+                src_file = self.queue.get()
+                if src_file is _STOP:
                     self.queue.task_done()
-                except Empty:
-                    sleep(.5)
+                    break
+                if isinstance(src_file, _Flush):
+                    self._wait_for_pending()
+                    src_file.event.set()
+                    self.queue.task_done()
+                    continue
+                self._dispatch(src_file)
+                self._raise_worker_exception()
+            # Wait for uploads to finish.
+            self._release_all()
+            self.pending.join()
+            self._raise_worker_exception()
             log.debug('Ending file processor thread')
         # pylint: disable=broad-except
         except Exception as exception:
             self.exception = exception
+        finally:
+            self._release_all()
+            for _ in worker_threads:
+                self.pending.put((PRIORITY_METADATA + 1, next(self.sequence), None))
+            for worker_thread in worker_threads:
+                worker_thread.join()
+
+    def _dispatch(self, src_file):
+        if self._is_barrier(src_file):
+            self._wait_for_pending()
+            self._process(src_file)
+            return
+        with self.pending_lock:
+            if src_file.filepath in self.pending_files:
+                # Already waiting to be uploaded, so just upload the latest.
+                log.debug('Coalescing %s', src_file.filepath)
+                self._merge_pending(src_file)
+                self.queue.task_done()
+                return
+            if src_file.filepath in self.in_flight:
+                log.debug('Holding %s until its upload is done', src_file.filepath)
+                self._hold(src_file)
+                return
+            self.pending_files[src_file.filepath] = src_file
+            priority = self._priority(src_file)
+            if priority == PRIORITY_METADATA and self.debounce_secs:
+                timer = threading.Timer(self.debounce_secs, self._release, [src_file.filepath])
+                self.debouncing[src_file.filepath] = timer
+                timer.start()
+                return
+        self.pending.put((priority, next(self.sequence), src_file.filepath))
+
+    # Waits for everything queued before, including files being debounced.
+    def _wait_for_pending(self):
+        self._release_all()
+        self.pending.join()
+        self._raise_worker_exception()
+
+    # Makes a debounced file available to the workers.
+    def _release(self, filepath):
+        with self.pending_lock:
+            if not self.debouncing.pop(filepath, None):
+                return
+        self.pending.put((PRIORITY_METADATA, next(self.sequence), filepath))
+
+    def _release_all(self):
+        with self.pending_lock:
+            timers = list(self.debouncing.items())
+        for filepath, timer in timers:
+            timer.cancel()
+            self._release(filepath)
+
+    # Keeps the delete flag of a file already waiting, so that a file isn't deleted by one and needed by another.
+    def _merge_pending(self, src_file):
+        pending_file = self.pending_files[src_file.filepath]
+        self.pending_files[src_file.filepath] = src_file._replace(delete=pending_file.delete and src_file.delete)
+
+    # Holds a file that is being uploaded until the upload is done. A file already held is replaced by the latest, as
+    # for pending files. Delete flags are merged as for pending files.
+    def _hold(self, src_file):
+        previous_file = self.held.get(src_file.filepath)
+        if previous_file:
+            self.queue.task_done()
+        else:
+            previous_file = self.in_flight[src_file.filepath]
+        self.held[src_file.filepath] = src_file._replace(delete=previous_file.delete and src_file.delete)
+
+    def _work(self):
+        while True:
+            _, _, filepath = self.pending.get()
+            if filepath is None:
+                self.pending.task_done()
+                return
+            with self.pending_lock:
+                src_file = self.pending_files.pop(filepath)
+                self.in_flight[filepath] = src_file
+            try:
+                if not self.exception:
+                    self._process(src_file)
+            # pylint: disable=broad-except
+            except Exception as exception:
+                self.exception = exception
+            finally:
+                # A file held while uploading goes next. It is queued before this is done, so that waiting for pending
+                # files waits for it too.
+                with self.pending_lock:
+                    del self.in_flight[filepath]
+                    held_file = self.held.pop(filepath, None)
+                    if held_file:
+                        self.pending_files[filepath] = held_file
+                if held_file:
+                    self.pending.put((self._priority(held_file), next(self.sequence), filepath))
+                self.pending.task_done()
+
+    def _process(self, src_file):
+        if self.bucket:
+            self._move(src_file)
+        else:
+            log.debug('Skipping moving %s since local', src_file.filepath)
+        if isinstance(src_file, DeleteFile) and os.path.exists(src_file.filepath):
+            os.remove(src_file.filepath)
+        self.queue.task_done()
 
     def _move(self, src_file):
         dest_filepath = src_file.filepath.replace(self.collections_path, DEFAULT_COLLECTIONS_PATH)
         if isinstance(src_file, AddFile):
             log.debug('Copying %s to s3://%s/%s', src_file.filepath, self.bucket, dest_filepath)
-            aws_client('s3').upload_file(src_file.filepath, self.bucket, dest_filepath)
-            if src_file.delete:
+            if src_file.sha1:
+                aws_client('s3').upload_file(src_file.filepath, self.bucket, dest_filepath,
+                                             ExtraArgs={'Metadata': {'sha1': src_file.sha1}})
+            else:
+                aws_client('s3').upload_file(src_file.filepath, self.bucket, dest_filepath)
+            if self._can_delete(src_file):
                 os.remove(src_file.filepath)
         else:
             log.debug('Deleting s3://%s/%s', self.bucket, dest_filepath)
             aws_client('s3').delete_object(Bucket=self.bucket, Key=dest_filepath)
 
+    # A file that was queued again while uploading is still needed.
+    def _can_delete(self, src_file):
+        with self.pending_lock:
+            return src_file.delete and src_file.filepath not in self.held
+
+    def _raise_worker_exception(self):
+        if self.exception:
+            raise self.exception
+
+    @staticmethod
+    def _is_barrier(src_file):
+        return isinstance(src_file, DeleteFile) or os.path.basename(src_file.filepath) in BARRIER_FILENAMES \
+            or os.path.basename(os.path.dirname(src_file.filepath)) == TWEET_INDEX_DIRNAME
+
+    @staticmethod
+    def _priority(src_file):
+        return PRIORITY_DATA if os.path.basename(src_file.filepath).startswith('tweets-') else PRIORITY_METADATA
+
     def stop(self):
-        self.stop_event.set()
+        self.queue.put(_STOP)
+
+    # Waits for the files placed on the queue so far to be moved. Raises if moving failed.
+    def flush(self):
+        flushed = threading.Event()
+        self.queue.put(_Flush(flushed))
+        while not flushed.wait(1):
+            if not self.is_alive():
+                break
+        self._raise_worker_exception()
 
     def __enter__(self):
         self.start()
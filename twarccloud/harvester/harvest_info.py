@@ -3,32 +3,80 @@ from datetime import datetime
 
 
 # Summary information about a harvester.
+# pylint: disable=too-many-instance-attributes
 class HarvestInfo:
     def __init__(self, collection_id, harvest_timestamp):
         self.collection_id = collection_id
         self.tweets = AtomicInteger()
         self.files = AtomicInteger()
         self.file_bytes = AtomicInteger()
+        # Tweets waiting to be written.
+        self.queue_depth = AtomicInteger()
+        self.tweets_dropped = AtomicInteger()
+        self.tweets_spilled = AtomicInteger()
+        # Tweets that had already been collected, according to the collection's tweet index.
+        self.tweets_duplicate = AtomicInteger()
+        # Batches written and total time spent writing them.
+        self.batches = AtomicInteger()
+        self.batch_millis = AtomicInteger()
         self.harvest_timestamp = harvest_timestamp
         self.harvest_end_timestamp = None
+        # Filter stream shards.
+        self.shards = []
 
     def end(self):
         self.harvest_end_timestamp = datetime.utcnow()
 
+    # Adds and returns information about a filter stream shard.
+    def add_shard(self):
+        shard_info = ShardInfo(len(self.shards) + 1)
+        self.shards.append(shard_info)
+        return shard_info
+
     def to_dict(self):
+        batches = self.batches.value
         harvest_info = {
             'collection_id': self.collection_id,
             'harvest_timestamp': self.harvest_timestamp.isoformat(),
             'tweets': self.tweets.value,
             'files': self.files.value,
-            'file_bytes': self.file_bytes.value
+            'file_bytes': self.file_bytes.value,
+            'queue_depth': self.queue_depth.value,
+            'tweets_dropped': self.tweets_dropped.value,
+            'tweets_spilled': self.tweets_spilled.value,
+            'tweets_duplicate': self.tweets_duplicate.value,
+            'batches': batches,
+            'avg_batch_millis': self.batch_millis.value / batches if batches else 0
         }
         if self.harvest_end_timestamp:
             harvest_info['harvest_end_timestamp'] = self.harvest_end_timestamp.isoformat()
+        if self.shards:
+            harvest_info['shards'] = [shard_info.to_dict(self.harvest_end_timestamp) for shard_info in self.shards]
 
         return harvest_info
 
 
+# Summary information about a filter stream shard.
+class ShardInfo:
+    def __init__(self, shard):
+        self.shard = shard
+        self.tweets = AtomicInteger()
+        # Tweets already received by another shard.
+        self.duplicates = AtomicInteger()
+        self.disconnects = AtomicInteger()
+        self.start_timestamp = datetime.utcnow()
+
+    def to_dict(self, end_timestamp=None):
+        secs = ((end_timestamp or datetime.utcnow()) - self.start_timestamp).total_seconds()
+        return {
+            'shard': self.shard,
+            'tweets': self.tweets.value,
+            'duplicates': self.duplicates.value,
+            'disconnects': self.disconnects.value,
+            'tweets_per_sec': self.tweets.value / secs if secs > 0 else 0
+        }
+
+
 # Thread-safe incrementer.
 # From https://stackoverflow.com/questions/23547604/python-counter-atomic-increment
 class AtomicInteger:
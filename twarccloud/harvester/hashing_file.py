@@ -0,0 +1,24 @@
+import hashlib
+
+
+# A write-only file wrapper that computes the SHA-1 and size of what is written as it is written.
+# Placed under a compressor, this accounts for the compressed bytes without re-reading the file.
+class HashingFile:
+    def __init__(self, file):
+        self.file = file
+        self.sha1 = hashlib.sha1()
+        self.bytes_written = 0
+
+    def write(self, data):
+        self.sha1.update(data)
+        self.bytes_written += len(data)
+        return self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def hexdigest(self):
+        return self.sha1.hexdigest()
@@ -0,0 +1,77 @@
+import threading
+from time import time
+from urllib.parse import urlparse
+from twarccloud import log
+
+
+# Raised when waiting for a rate limit is interrupted.
+class RateLimitInterrupted(Exception):
+    pass
+
+
+# Shares Twitter's rate limits across threads that make requests with the same credentials.
+# The limit for each endpoint is learned from the x-rate-limit-remaining and x-rate-limit-reset headers of responses.
+# Requests are let through while the limit has requests remaining. Once it is used up, requests wait until it resets,
+# rather than each thread running into a 429.
+class RateLimiter:
+    def __init__(self):
+        # Map of endpoint to [remaining, reset epoch seconds]
+        self.limits = {}
+        self.condition = threading.Condition()
+
+    # Blocks until a request can be made to the endpoint of a url.
+    # Raises RateLimitInterrupted if the event is set while waiting.
+    def acquire(self, url, event=None):
+        endpoint = self.endpoint(url)
+        logged = False
+        with self.condition:
+            while True:
+                limit = self.limits.get(endpoint)
+                if limit is None or limit[0] > 0:
+                    break
+                wait_secs = limit[1] - time()
+                if wait_secs <= 0:
+                    # Reset, but don't know the new limit until the next response.
+                    del self.limits[endpoint]
+                    break
+                if not logged:
+                    log.info('Rate limit for %s used up. Waiting %.0f secs.', endpoint, wait_secs)
+                    logged = True
+                self.condition.wait(min(wait_secs, 1))
+                if event and event.is_set():
+                    raise RateLimitInterrupted()
+            if limit is not None:
+                # Reserve a request.
+                limit[0] -= 1
+
+    # Records the rate limit from the headers of a response.
+    def update(self, url, headers):
+        if 'x-rate-limit-remaining' not in headers or 'x-rate-limit-reset' not in headers:
+            return
+        endpoint = self.endpoint(url)
+        remaining = int(headers['x-rate-limit-remaining'])
+        reset = int(headers['x-rate-limit-reset'])
+        with self.condition:
+            limit = self.limits.get(endpoint)
+            # Responses may arrive out of order, so within a window keep the lowest remaining.
+            if limit is None or reset > limit[1] or remaining < limit[0]:
+                self.limits[endpoint] = [remaining, reset]
+            self.condition.notify_all()
+
+    def remaining(self, url):
+        with self.condition:
+            limit = self.limits.get(self.endpoint(url))
+            return limit[0] if limit else None
+
+    # Returns how readily a request can be made to the endpoint of a url, for comparing rate limiters.
+    # Higher is better: an unknown or reset limit, then more requests remaining, then an earlier reset.
+    def allowance(self, url):
+        with self.condition:
+            limit = self.limits.get(self.endpoint(url))
+            if limit is None or limit[1] <= time():
+                return float('inf'), 0
+            return limit[0], -limit[1]
+
+    @staticmethod
+    def endpoint(url):
+        return urlparse(url).path
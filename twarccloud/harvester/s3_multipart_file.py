@@ -0,0 +1,73 @@
+from twarccloud.aws import aws_client
+from twarccloud import log
+
+# S3 requires parts other than the last to be at least 5MB.
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+# A write-only file that streams to an S3 object with a multipart upload.
+# Parts are uploaded as they fill. The object only becomes visible when the file is closed and the upload is completed.
+# If a part fails to upload, the upload is aborted so that no parts are left behind.
+class S3MultipartFile:
+    def __init__(self, bucket, key, part_size=16 * 1024 * 1024):
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.buffer = bytearray()
+        self.parts = []
+        self.closed = False
+        log.debug('Starting multipart upload to s3://%s/%s', bucket, key)
+        self.upload_id = aws_client('s3').create_multipart_upload(Bucket=bucket, Key=key)['UploadId']
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+        self.buffer.extend(data)
+        while len(self.buffer) >= self.part_size:
+            self._upload_part(bytes(self.buffer[:self.part_size]))
+            del self.buffer[:self.part_size]
+        return len(data)
+
+    # Parts are only uploaded once full.
+    def flush(self):
+        pass
+
+    # Uploads the last part and completes the upload.
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        # An upload must have at least one part, even if empty.
+        if self.buffer or not self.parts:
+            self._upload_part(bytes(self.buffer))
+        self.buffer = None
+        try:
+            aws_client('s3').complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                                       MultipartUpload={'Parts': self.parts})
+        except Exception:
+            self._abort()
+            raise
+        log.debug('Completed multipart upload to s3://%s/%s', self.bucket, self.key)
+
+    # Abandons the upload.
+    def abort(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.buffer = None
+        self._abort()
+
+    def _upload_part(self, data):
+        part_number = len(self.parts) + 1
+        try:
+            response = aws_client('s3').upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                                    PartNumber=part_number, Body=data)
+        except Exception:
+            self.closed = True
+            self._abort()
+            raise
+        self.parts.append({'PartNumber': part_number, 'ETag': response['ETag']})
+
+    def _abort(self):
+        log.warning('Aborting multipart upload to s3://%s/%s', self.bucket, self.key)
+        aws_client('s3').abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
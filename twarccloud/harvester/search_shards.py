@@ -0,0 +1,64 @@
+from time import time
+from twarccloud.raw_tweet_helper import timestamp_tweet_id
+
+# Standard search only returns tweets from the last 7 days.
+SEARCH_WINDOW_SECS = 7 * 24 * 60 * 60
+
+
+# A range of tweet ids to search, from since id (exclusive) to max id (inclusive).
+# Since search results are newest first, progress is tracked by the id below which the search continues.
+class SearchShard:
+    # pylint: disable=too-many-arguments
+    def __init__(self, since_id, max_id, next_max_id=None, newest_id=None, done=False):
+        self.since_id = since_id
+        self.max_id = max_id
+        self.next_max_id = next_max_id
+        self.newest_id = newest_id
+        self.done = done
+
+    # Records a tweet found by the search.
+    def found(self, tweet_id):
+        self.newest_id = max(self.newest_id or 0, tweet_id)
+        self.next_max_id = tweet_id - 1
+
+    # Returns True if a tweet belongs to a neighboring shard.
+    def is_outside(self, tweet_id):
+        return tweet_id <= self.since_id or tweet_id > self.max_id
+
+    def to_dict(self):
+        return {
+            'since_id': self.since_id,
+            'max_id': self.max_id,
+            'next_max_id': self.next_max_id,
+            'newest_id': self.newest_id,
+            'done': self.done
+        }
+
+    @staticmethod
+    def from_dict(shard_dict):
+        return SearchShard(shard_dict['since_id'], shard_dict['max_id'], next_max_id=shard_dict['next_max_id'],
+                           newest_id=shard_dict['newest_id'], done=shard_dict['done'])
+
+
+# Splits the ids of tweets since since id, or for the last 7 days, into shards of equal time windows.
+def create_shards(since_id, count, now=None):
+    now = now or time()
+    max_id = timestamp_tweet_id(now)
+    since_id = int(since_id) if since_id else timestamp_tweet_id(now - SEARCH_WINDOW_SECS)
+    width = (max_id - since_id) // count
+    if width <= 0:
+        return [SearchShard(since_id, max(since_id, max_id))]
+    bounds = [since_id + width * shard for shard in range(count)] + [max_id]
+    return [SearchShard(bounds[shard], bounds[shard + 1]) for shard in range(count)]
+
+
+# Returns the since id for the next search, or None if no progress was made.
+# If every shard is done, that is the top of the shards. Otherwise, it is the top of the shards that are done, counting
+# up from the oldest, so that a shard that did not finish is searched again.
+def shards_since_id(shards):
+    since_id = None
+    for shard in shards:
+        if not shard.done:
+            break
+        since_id = shard.max_id
+    return since_id
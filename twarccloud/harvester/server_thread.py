@@ -10,8 +10,12 @@ app = Flask(__name__)
 
 @app.route('/')
 # Returns harvester information.
+# If harvesting several collections, returns a list with the information for each.
 def info():
-    return jsonify(app.config['harvest_info'].to_dict())
+    harvest_infos = app.config['harvest_infos']
+    if len(harvest_infos) == 1:
+        return jsonify(harvest_infos[0].to_dict())
+    return jsonify([harvest_info.to_dict() for harvest_info in harvest_infos])
 
 @app.route('/stop')
 # Stops the harvester, but doesn't cause the process to exit.
@@ -45,14 +49,14 @@ def shutdown():
 # Thread that runs this Flask application.
 # pylint: disable=too-many-arguments
 class ServerThread(threading.Thread):
-    def __init__(self, stop_event, stopped_event, shutdown_event, harvest_info, port):
+    def __init__(self, stop_event, stopped_event, shutdown_event, harvest_infos, port):
         threading.Thread.__init__(self)
         self.daemon = True
         self.port = port
         app.config['stop_event'] = stop_event
         app.config['stopped_event'] = stopped_event
         app.config['shutdown_event'] = shutdown_event
-        app.config['harvest_info'] = harvest_info
+        app.config['harvest_infos'] = harvest_infos
 
     def run(self):
         app.run(host='0.0.0.0', port=self.port, debug=False)
@@ -0,0 +1,159 @@
+import re
+from time import sleep
+import requests
+from twarc import Twarc
+from twarccloud.raw_tweet_helper import split_json_array, extract_id, extract_user_id
+from twarccloud.harvester.rate_limiter import RateLimiter
+from twarccloud import log
+
+_STATUSES_PATTERN = re.compile(rb'"statuses"\s*:\s*')
+
+
+# Twarc, extended to return tweets as the raw JSON bytes received from Twitter's API.
+# Raw tweets can be written without the cost of decoding and re-encoding them. Responses are split into raw tweets and
+# their ids read without decoding them.
+# The paging logic follows Twarc's.
+# GETs go through a rate limiter, which may be shared by clients with the same credentials. If a stop event is set,
+# waiting for the rate limit is interrupted.
+class TwarcClient(Twarc):
+    def __init__(self, *args, rate_limiter=None, stop_event=None, **kwargs):
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.stop_event = stop_event
+        Twarc.__init__(self, *args, **kwargs)
+
+    def get(self, *args, **kwargs):
+        url = args[0] if args else kwargs['url']
+        self.rate_limiter.acquire(url, event=self.stop_event)
+        try:
+            resp = Twarc.get(self, *args, **kwargs)
+        except requests.exceptions.HTTPError as exception:
+            if exception.response is not None:
+                self.rate_limiter.update(url, exception.response.headers)
+            raise exception
+        self.rate_limiter.update(url, resp.headers)
+        return resp
+
+    # Yields raw tweets from the filter stream. The stream is newline-delimited, so tweets are never decoded.
+    # If provided, disconnects is an AtomicInteger that counts the times the stream is reconnected.
+    # pylint: disable=too-many-arguments
+    def filter_raw(self, track=None, follow=None, locations=None, event=None, disconnects=None):
+        url = 'https://stream.twitter.com/1.1/statuses/filter.json'
+        params = _filter_params(track, follow, locations)
+        headers = {'accept-encoding': 'deflate, gzip'}
+        errors = 0
+        connects = 0
+        while True:
+            if connects and disconnects:
+                disconnects.incr()
+            connects += 1
+            try:
+                log.debug('Connecting to filter stream for %s', params)
+                resp = self.post(url, params, headers=headers, stream=True)
+                errors = 0
+                for line in resp.iter_lines(chunk_size=1024):
+                    if event and event.is_set():
+                        resp.close()
+                        return
+                    # Keep-alive
+                    if not line:
+                        continue
+                    yield line
+            except requests.exceptions.HTTPError as exception:
+                errors += 1
+                log.error('Caught http error %s on filter stream on %s try', exception, errors)
+                if self.http_errors and errors == self.http_errors:
+                    raise exception
+                if _interruptible_sleep(errors * (60 if exception.response.status_code == 420 else 5), event):
+                    return
+            # pylint: disable=broad-except
+            except Exception as exception:
+                errors += 1
+                log.error('Caught %s on filter stream on %s try', exception, errors)
+                if self.http_errors and errors == self.http_errors:
+                    raise exception
+                if _interruptible_sleep(errors, event):
+                    return
+
+    # Yields raw tweets from a search.
+    def search_raw(self, q, since_id=None, max_id=None):
+        url = 'https://api.twitter.com/1.1/search/tweets.json'
+        params = {
+            'count': 100,
+            'q': q,
+            'include_ext_alt_text': 'true',
+            'result_type': 'recent'
+        }
+        if since_id:
+            # Make the since_id inclusive, so that an empty page of results can be avoided.
+            params['since_id'] = str(int(since_id) - 1)
+        while True:
+            if max_id:
+                params['max_id'] = max_id
+            content = self.get(url, params=params).content
+            statuses = split_json_array(content, _STATUSES_PATTERN.search(content).end())
+            last_id = None
+            for raw_tweet in statuses:
+                tweet_id = extract_id(raw_tweet)
+                if since_id is not None and tweet_id == int(since_id):
+                    return
+                last_id = tweet_id
+                yield raw_tweet
+            if last_id is None:
+                return
+            max_id = str(last_id - 1)
+
+    # Yields raw tweets from a user timeline.
+    def timeline_raw(self, user_id, since_id=None):
+        url = 'https://api.twitter.com/1.1/statuses/user_timeline.json'
+        params = {
+            'count': 200,
+            'user_id': str(user_id),
+            'include_ext_alt_text': 'true'
+        }
+        if since_id:
+            params['since_id'] = str(int(since_id) - 1)
+        while True:
+            try:
+                content = self.get(url, params=params, allow_404=True).content
+            except requests.exceptions.HTTPError as exception:
+                # Not found or protected
+                if exception.response.status_code in (401, 404):
+                    log.warning('No timeline available for %s', user_id)
+                    return
+                raise exception
+            last_id = None
+            for raw_tweet in split_json_array(content):
+                tweet_id = extract_id(raw_tweet)
+                if since_id is not None and tweet_id == int(since_id):
+                    return
+                last_id = tweet_id
+                # An invalid user_id may still return results.
+                if extract_user_id(raw_tweet) == int(user_id):
+                    yield raw_tweet
+            if last_id is None:
+                return
+            params['max_id'] = str(last_id - 1)
+
+
+def _filter_params(track, follow, locations):
+    params = {
+        'stall_warning': True,
+        'include_ext_alt_text': True
+    }
+    if track:
+        params['track'] = track
+    if follow:
+        params['follow'] = follow
+    if locations:
+        if isinstance(locations, list):
+            locations = ','.join(locations)
+        params['locations'] = locations.replace('\\', '')
+    return params
+
+
+# Sleeps, returning True early if the event is set.
+def _interruptible_sleep(secs, event):
+    if event:
+        return event.wait(secs)
+    sleep(secs)
+    return False
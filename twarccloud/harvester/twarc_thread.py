@@ -1,19 +1,54 @@
 import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed
+from datetime import datetime
+from functools import partial
+from time import time
+import copy
 import json
 import requests
-from twarc import Twarc
 from twarccloud.harvester.tweet_writer_thread import TweetWriterThread
-from twarccloud.filepaths_helper import get_users_filepath, get_user_changes_filepath
+from twarccloud.tweet_file_index import DEFAULT_TWEETS_PER_BLOCK
+from twarccloud.harvester.credential_pool import CredentialPoolClient, create_credentials
+from twarccloud.harvester.rate_limiter import RateLimitInterrupted
+from twarccloud.harvester.search_shards import SearchShard, create_shards, shards_since_id
+from twarccloud.harvester.tweet_dedup import RecentTweetIds
+from twarccloud.raw_tweet_helper import extract_id
+from twarccloud.filepaths_helper import get_users_filepath, get_user_changes_filepath, get_user_activity_filepath, \
+    get_harvest_checkpoint_filepath, get_tweet_index_path, get_harvest_duplicates_filepath
+from twarccloud.filter_shards import split_filter
+from twarccloud.user_activity import UserActivity, EMPTY_STREAK, SKIPPED
 from twarccloud.harvester.file_queueing_writer import FileQueueingWriter
+from twarccloud.harvester.file_mover_thread import AddFile, DeleteFile
+from twarccloud.tweet_index import TweetIndex, DEDUP_SKIP, FLUSH_IDS
 from twarccloud import log
 
 
 # Thread that performs harvesting.
+# User timelines are harvested by a pool of timeline workers, each with its own Twarc client.
+# Timeline, search and lookup requests are spread across the collection's sets of keys. The clients share the rate
+# limits of each set of keys, so that together they stay within the rate limits.
+# If checkpoint secs, progress is written to the harvest's checkpoint file every checkpoint secs: the changeset, the
+# ids of the users whose timelines are done with the user changes and activity recorded for them and, for searches, the
+# newest and oldest tweets found. A harvest can be resumed from a checkpoint.
+# If search shards, a search is split into shards of tweet ids that are searched at once.
+# A filter that is larger than a single filter stream connection allows is split into shards, each streamed with its
+# own set of keys. Tweets matched by more than one shard are only written once.
+# If the collection config sets dedup, tweets already collected by earlier harvests are looked up in the collection's
+# tweet index and either skipped or written and flagged in the harvest's list of duplicates. The ids added to the index
+# are flushed at each checkpoint and every FLUSH_IDS ids, by the writer once their tweets are in a closed file, so that
+# the index does not get ahead of the tweets.
+# Harvester stop event stops the harvester, i.e., all of its collections. The collection's own stop event is set when
+# the harvester stop event is set, or by the collection itself, e.g., when a filter reaches max records, so that the
+# collection stops without stopping the other collections harvested by the process.
 # pylint: disable=too-many-instance-attributes
 class TwarcThread(threading.Thread):
-    # pylint: disable=too-many-arguments
+    # pylint: disable=too-many-arguments, too-many-locals
     def __init__(self, config, collections_path, harvest_timestamp, file_queue, changeset, stop_event, harvest_info,
-                 connection_errors=5, http_errors=5, tweets_per_file=None):
+                 connection_errors=5, http_errors=5, tweets_per_file=None, queue_size=None, backpressure=None,
+                 passthrough=False, codec=None, compress_threads=None, bytes_per_file=None,
+                 s3_bucket=None, part_size=None, manifest_segments=False, timeline_workers=1, checkpoint_secs=None,
+                 resume=None, search_shards=1, tweets_per_block=DEFAULT_TWEETS_PER_BLOCK):
         self.config = config
         self.file_queue = file_queue
         self.collections_path = collections_path
@@ -21,21 +56,62 @@ class TwarcThread(threading.Thread):
         self.connection_errors = connection_errors
         self.http_errors = http_errors
         self.tweets_per_file = tweets_per_file
+        self.tweets_per_block = tweets_per_block
+        self.bytes_per_file = bytes_per_file
+        # If an S3 bucket, tweet files are streamed to S3.
+        self.s3_bucket = s3_bucket
+        self.part_size = part_size
+        self.manifest_segments = manifest_segments
+        self.queue_size = queue_size
+        self.backpressure = backpressure
+        # If passthrough, tweets are harvested and written as raw bytes.
+        self.passthrough = passthrough
+        # Codec provided to the harvester takes precedence over codec in collection config.
+        self.codec = codec or config.get('codec')
+        self.compress_threads = compress_threads
+        self.timeline_workers = timeline_workers
+        self.search_shards = search_shards
+        # Guards the progress of search and filter shards.
+        self.shard_lock = threading.Lock()
+        # Tweets found by all shards.
+        self.shard_count = 0
+        self.checkpoint_secs = checkpoint_secs
+        self.last_checkpoint = time()
+        # Checkpoint to resume from.
+        self.resume = resume or {}
+        self.harvester_stop_event = stop_event
+        self.stop_event = threading.Event()
+        self.credentials = create_credentials(config.key_sets())
         self.twarc = self._create_twarc()
-        self.stop_event = stop_event
+        # Twarc clients for timeline workers.
+        self.local = threading.local()
         self.harvest_info = harvest_info
         self.changeset = changeset
         self.writer = None
+        self.tweet_index = None
+        # Guards adding to the tweet index and writing together.
+        self.tweet_index_lock = threading.RLock()
+        # Ids of duplicate tweets that were written.
+        self.duplicate_ids = []
         self.exception = None
         threading.Thread.__init__(self)
 
     def run(self):
+        threading.Thread(target=self._stop_with_harvester, daemon=True).start()
         try:
             log.debug('Starting twarc thread')
             api_method_type = self.config.get('type')
             log.debug("API method type is %s", api_method_type)
+            if self.config.get('dedup'):
+                self.tweet_index = TweetIndex(get_tweet_index_path(self.config['id'],
+                                                                   collections_path=self.collections_path))
             with TweetWriterThread(self.collections_path, self.config['id'], self.harvest_timestamp, self.file_queue,
-                                   self.harvest_info, self.tweets_per_file) as self.writer:
+                                   self.harvest_info, tweets_per_file=self.tweets_per_file,
+                                   bytes_per_file=self.bytes_per_file, s3_bucket=self.s3_bucket,
+                                   part_size=self.part_size, manifest_segments=self.manifest_segments,
+                                   queue_size=self.queue_size, backpressure=self.backpressure,
+                                   codec=self.codec, compress_threads=self.compress_threads,
+                                   tweets_per_block=self.tweets_per_block) as self.writer:
                 if api_method_type == 'user_timeline':
                     self.user_timelines()
                 elif api_method_type == 'filter':
@@ -44,11 +120,24 @@ class TwarcThread(threading.Thread):
                     self.search()
                 else:
                     raise KeyError('Unknown API method type: {}'.format(api_method_type))
+            # The tweets are written, so the rest of their ids can be written to the index.
+            if self.tweet_index is not None:
+                self._close_tweet_index()
             self.harvest_info.end()
             log.debug('Ending twarc thread')
         # pylint: disable=broad-except
         except Exception as exception:
             self.exception = exception
+        finally:
+            # Done, which also ends _stop_with_harvester().
+            self.stop_event.set()
+
+    # Sets the collection's stop event when the harvester stop event is set.
+    def _stop_with_harvester(self):
+        while not self.stop_event.is_set():
+            if self.harvester_stop_event.wait(timeout=1):
+                log.debug('Stopping %s', self.config['id'])
+                self.stop_event.set()
 
     def filter(self):
         filter_config = self.config.get('filter')
@@ -59,26 +148,127 @@ class TwarcThread(threading.Thread):
         assert track or follow or locations
 
         max_records = int(self.config['filter'].get('max_records', 0))
+        shards = split_filter(filter_config)
+        if len(shards) > 1:
+            self._sharded_filter(shards, max_records)
+            return
+        tweet_filter = self.twarc.filter_raw if self.passthrough else self.twarc.filter
         for count, tweet in enumerate(
-                self.twarc.filter(track=track, follow=follow, locations=locations, event=self.stop_event)):
+                tweet_filter(track=track, follow=follow, locations=locations, event=self.stop_event)):
             if not count % 1000:
                 log.debug("Collected %s tweets", count)
-            self.writer.write(tweet)
+            self._write(tweet)
             if max_records and max_records-1 == count:
                 log.debug("Reached max records of %s", max_records)
                 self.stop_event.set()
 
+    def _sharded_filter(self, shards, max_records):
+        if len(shards) > len(self.credentials):
+            raise ValueError('Filter needs {} connections, but only {} sets of keys.'.format(len(shards),
+                                                                                            len(self.credentials)))
+        log.info('Splitting filter across %s connections', len(shards))
+        recent_tweet_ids = RecentTweetIds()
+        with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+            futures = [executor.submit(self._filter_shard, shard, credential, self.harvest_info.add_shard(),
+                                       recent_tweet_ids, max_records)
+                       for shard, credential in zip(shards, self.credentials)]
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as exception:
+                    # Stop the other shards.
+                    self.stop_event.set()
+                    raise exception
+
+    # Called by filter workers.
+    # pylint: disable=too-many-arguments
+    def _filter_shard(self, shard, credential, shard_info, recent_tweet_ids, max_records):
+        twarc = credential.create_client(http_errors=self.http_errors, connection_errors=self.connection_errors,
+                                         tweet_mode="extended", stop_event=self.stop_event)
+        for raw_tweet in twarc.filter_raw(track=shard['track'], follow=shard['follow'], locations=shard['locations'],
+                                          event=self.stop_event, disconnects=shard_info.disconnects):
+            tweet_id = self._message_id(raw_tweet)
+            if tweet_id is not None and not recent_tweet_ids.add(tweet_id):
+                shard_info.duplicates.incr()
+                continue
+            with self.shard_lock:
+                if max_records and self.shard_count == max_records:
+                    return
+                self.shard_count += 1
+                if max_records and self.shard_count == max_records:
+                    log.debug("Reached max records of %s", max_records)
+                    self.stop_event.set()
+            shard_info.tweets.incr()
+            self._write(raw_tweet if self.passthrough else json.loads(raw_tweet.decode('utf-8')))
+
+    # Writes a tweet, unless the tweet index shows that it was already collected and duplicates are skipped.
+    def _write(self, tweet):
+        if self.tweet_index is None:
+            self.writer.write(tweet)
+            return
+        tweet_id = self._message_id(tweet)
+        # Added and written together, so that a flush does not take the id of a tweet that is written after it.
+        with self.tweet_index_lock:
+            if tweet_id is not None and not self.tweet_index.add(tweet_id):
+                self.harvest_info.tweets_duplicate.incr()
+                if self.config['dedup'] == DEDUP_SKIP:
+                    return
+                self.duplicate_ids.append(tweet_id)
+            self.writer.write(tweet)
+            if len(self.tweet_index.new_ids) >= FLUSH_IDS:
+                self._flush_tweet_index()
+
+    # Takes the ids added to the tweet index, to be written by the writer once their tweets are in a closed file.
+    def _flush_tweet_index(self):
+        with self.tweet_index_lock:
+            tweet_ids = self.tweet_index.take_new_ids()
+            if tweet_ids:
+                self.writer.checkpoint(partial(self._write_tweet_index_segment, tweet_ids))
+
+    # Called by the writer.
+    def _write_tweet_index_segment(self, tweet_ids):
+        log.debug('Writing %s tweet ids to tweet index', len(tweet_ids))
+        filepath, merged_filepaths = self.tweet_index.write_segment(tweet_ids)
+        # Segments are barriers, so this lands after the tweets and before the merged segments are deleted.
+        self.file_queue.put(AddFile(filepath, False))
+        for merged_filepath in merged_filepaths:
+            self.file_queue.put(DeleteFile(merged_filepath))
+
+    def _close_tweet_index(self):
+        tweet_ids = self.tweet_index.take_new_ids()
+        if tweet_ids:
+            self._write_tweet_index_segment(tweet_ids)
+        self.tweet_index.close()
+        if self.duplicate_ids:
+            with FileQueueingWriter(get_harvest_duplicates_filepath(self.config['id'], self.harvest_timestamp,
+                                                                    collections_path=self.collections_path),
+                                    self.file_queue, delete=True) as duplicates_writer:
+                for tweet_id in self.duplicate_ids:
+                    duplicates_writer.write('{}\n'.format(tweet_id))
+
     def search(self):
         assert 'query' in self.config.get('search', {})
         query = self.config['search']['query']
         since_id = self.config['search'].get('since_id')
         max_records = int(self.config['search'].get('max_records', 0))
+        if self.search_shards > 1 or 'search_shards' in self.resume:
+            self._sharded_search(query, since_id, max_records)
+            return
         max_id = int(since_id) if since_id else 0
-        for count, tweet in enumerate(self.twarc.search(q=query, since_id=since_id)):
+        # Results are newest first, so a resumed search continues below the oldest tweet found.
+        next_max_id = None
+        if 'search' in self.resume:
+            log.info('Resuming search below %s', self.resume['search']['next_max_id'])
+            max_id = max(max_id, self.resume['search']['max_id'])
+            next_max_id = self.resume['search']['next_max_id']
+        tweet_search = self.twarc.search_raw if self.passthrough else self.twarc.search
+        for count, tweet in enumerate(tweet_search(q=query, since_id=since_id, max_id=next_max_id)):
             if not count % 1000:
                 log.debug("Collected %s tweets", count)
-            self.writer.write(tweet)
-            max_id = max(max_id, tweet['id'])
+            self._write(tweet)
+            tweet_id = self._tweet_id(tweet)
+            max_id = max(max_id, tweet_id)
+            self._checkpoint_if_due(search={'max_id': max_id, 'next_max_id': str(tweet_id - 1)})
             if self.stop_event.is_set():
                 break
             if max_records and max_records-1 == count:
@@ -87,17 +277,76 @@ class TwarcThread(threading.Thread):
         # Set since_id on changeset
         self.changeset.update_search(max_id)
 
+    def _sharded_search(self, query, since_id, max_records):
+        if 'search_shards' in self.resume:
+            shards = [SearchShard.from_dict(shard_dict) for shard_dict in self.resume['search_shards']]
+            log.info('Resuming %s search shards', len([shard for shard in shards if not shard.done]))
+        else:
+            shards = create_shards(since_id, self.search_shards)
+        with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+            futures = [executor.submit(self._search_shard, shard, query, max_records) for shard in shards
+                       if not shard.done]
+            while wait(futures, timeout=1).not_done:
+                with self.shard_lock:
+                    progress = [shard.to_dict() for shard in shards]
+                self._checkpoint_if_due(search_shards=progress)
+            for future in futures:
+                future.result()
+        new_since_id = shards_since_id(shards)
+        if new_since_id:
+            self.changeset.update_search(new_since_id)
+
+    # Called by search workers.
+    def _search_shard(self, shard, query, max_records):
+        log.debug('Searching %s to %s', shard.since_id, shard.max_id)
+        twarc = self._worker_twarc()
+        tweet_search = twarc.search_raw if self.passthrough else twarc.search
+        try:
+            for tweet in tweet_search(q=query, since_id=str(shard.since_id),
+                                      max_id=str(shard.next_max_id or shard.max_id)):
+                tweet_id = self._tweet_id(tweet)
+                # The neighboring shard has the tweets at the boundary.
+                if shard.is_outside(tweet_id):
+                    continue
+                with self.shard_lock:
+                    if max_records and self.shard_count == max_records:
+                        log.debug("Reached max records of %s", max_records)
+                        return
+                    self.shard_count += 1
+                self._write(tweet)
+                with self.shard_lock:
+                    shard.found(tweet_id)
+                if self.stop_event.is_set():
+                    return
+            with self.shard_lock:
+                shard.done = True
+        except RateLimitInterrupted:
+            log.debug('Stopped waiting for rate limit for search shard %s to %s', shard.since_id, shard.max_id)
+
     def user_timelines(self):
         assert 'users' in self.config
-        user_ids = self.config['users'].keys()
-        user_changes = []
+        user_activity_filepath = get_user_activity_filepath(self.config['id'], collections_path=self.collections_path)
+        user_activity, user_changes, user_ids = self._start_user_timelines(user_activity_filepath)
+        # Timelines being harvested, in order.
+        timelines = deque()
         with FileQueueingWriter(
                 get_users_filepath(self.config['id'], self.harvest_timestamp, collections_path=self.collections_path),
-                self.file_queue, delete=True) as users_writer:
-            for count, user_id in enumerate(user_ids):
+                self.file_queue, delete=True) as users_writer, ThreadPoolExecutor(
+                    max_workers=self.timeline_workers) as executor:
+            # Users whose timelines are done, by id rather than position, since the checkpoint's changes may have
+            # deleted users.
+            done_user_ids = set(self.resume.get('done_user_ids', []))
+            remaining_user_ids = [user_id for user_id in user_ids if user_id not in done_user_ids]
+            if done_user_ids:
+                log.info('Resuming with %s of %s users done', len(user_ids) - len(remaining_user_ids), len(user_ids))
+            for count, (user_id, result, user) in enumerate(self._lookup_users(remaining_user_ids),
+                                                            len(user_ids) - len(remaining_user_ids)):
+                # Copied, since they change after the checkpoint is captured.
+                if self._is_checkpoint_due():
+                    self._checkpoint(done_user_ids=sorted(done_user_ids), user_changes=copy.deepcopy(user_changes),
+                                     user_activity=copy.deepcopy(user_activity))
                 user_details = self.config['users'][user_id]
                 screen_name = user_details.get('screen_name')
-                result, user = self._lookup_user(user_id)
                 if result != 'OK':
                     change_details = {
                         'user_id': user_id,
@@ -108,6 +357,7 @@ class TwarcThread(threading.Thread):
                     user_changes.append(change_details)
                     if result in self.config.get('delete_users_for', []):
                         self.changeset.delete_user(user_id)
+                    done_user_ids.add(user_id)
                     continue
                 users_writer.write_json(user)
                 if 'screen_name' not in user_details:
@@ -125,26 +375,154 @@ class TwarcThread(threading.Thread):
                     })
                     self.changeset.update_user('screen_name', user['screen_name'], user_id)
                 log.debug("Collecting timeline of %s (%s of %s)", screen_name or user_id, count + 1, len(user_ids))
-                new_max_id = self._user_timeline(user_id=user_id, since_id=user_details.get('since_id'))
-                if new_max_id and (new_max_id != user_details.get('since_id')):
-                    self.changeset.update_user('since_id', new_max_id, user_id)
+                timelines.append((user_id, executor.submit(self._user_timeline, user_id=user_id,
+                                                           since_id=user_details.get('since_id'))))
+                # Record finished timelines. Wait if too many are queued.
+                while timelines and (timelines[0][1].done() or len(timelines) > self.timeline_workers * 2):
+                    self._record_timeline(user_activity, done_user_ids, *timelines.popleft())
                 if self.stop_event.is_set():
                     break
+            while timelines:
+                self._record_timeline(user_activity, done_user_ids, *timelines.popleft())
         with FileQueueingWriter(get_user_changes_filepath(self.config['id'], self.harvest_timestamp,
                                                           collections_path=self.collections_path),
                                 self.file_queue, delete=True) as user_changes_writer:
             user_changes_writer.write_json(user_changes, indent=2)
+        user_activity.prune(self.config['users'].keys())
+        with FileQueueingWriter(user_activity_filepath, self.file_queue) as user_activity_writer:
+            user_activity_writer.write_json(user_activity, separators=(',', ':'))
+
+    # Sets since_id on changeset and records activity for a harvested timeline, which is then done.
+    # Only called from this thread, so changeset and user activity are not updated concurrently.
+    def _record_timeline(self, user_activity, done_user_ids, user_id, future):
+        new_max_id, tweet_count = future.result()
+        done_user_ids.add(user_id)
+        if new_max_id and (new_max_id != self.config['users'][user_id].get('since_id')):
+            self.changeset.update_user('since_id', new_max_id, user_id)
+        # A timeline that was interrupted says nothing about the user's activity.
+        if tweet_count is not None:
+            user_activity.record(user_id, tweet_count, max_id=new_max_id)
+
+    # Returns the user activity, the user changes and the user ids to harvest.
+    # A resumed harvest carries on with the activity and changes of the users done before the checkpoint, which include
+    # the users that were skipped.
+    def _start_user_timelines(self, user_activity_filepath):
+        if 'user_activity' not in self.resume:
+            user_activity = UserActivity.load(user_activity_filepath)
+            user_changes = []
+            return user_activity, user_changes, self._users_to_harvest(user_activity, user_changes)
+        user_activity = UserActivity(self.resume['user_activity'])
+        user_changes = list(self.resume['user_changes'])
+        skipped_user_ids = {change['user_id'] for change in user_changes if change['change'] == 'skipped'}
+        user_ids = [user_id for user_id in user_activity.priority_order(self.config['users'].keys())
+                    if user_id not in skipped_user_ids]
+        return user_activity, user_changes, user_ids
+
+    # Returns the user ids to harvest, most active users first. Dormant users may be skipped.
+    def _users_to_harvest(self, user_activity, user_changes):
+        user_ids = []
+        for user_id in user_activity.priority_order(self.config['users'].keys()):
+            if user_activity.should_skip(user_id, self.config.get('max_skip_harvests')):
+                user_activity.skip(user_id)
+                user_changes.append(self._skip_change(user_id, user_activity))
+            else:
+                user_ids.append(user_id)
+        return user_ids
 
+    # Returns True if checkpoint secs have passed since the last checkpoint.
+    def _is_checkpoint_due(self):
+        return bool(self.checkpoint_secs) and time() - self.last_checkpoint >= self.checkpoint_secs
+
+    def _checkpoint_if_due(self, **progress):
+        if self._is_checkpoint_due():
+            self._checkpoint(**progress)
+
+    # Progress is captured now, but written by the writer once the tweets written before are in a closed file, so that
+    # the checkpoint does not get ahead of the tweets.
+    def _checkpoint(self, **progress):
+        self.last_checkpoint = time()
+        checkpoint = {
+            'checkpoint_timestamp': datetime.utcnow().isoformat(),
+            'changeset': copy.deepcopy(self.changeset)
+        }
+        checkpoint.update(progress)
+        if self.tweet_index is not None:
+            self._flush_tweet_index()
+        self.writer.checkpoint(partial(self._write_checkpoint, checkpoint))
+
+    # Called by the writer.
+    def _write_checkpoint(self, checkpoint):
+        log.info('Checkpointing')
+        with FileQueueingWriter(get_harvest_checkpoint_filepath(self.config['id'], self.harvest_timestamp,
+                                                                collections_path=self.collections_path),
+                                self.file_queue) as checkpoint_writer:
+            checkpoint_writer.write_json(checkpoint, indent=2)
+
+    def _skip_change(self, user_id, user_activity):
+        change_details = {
+            'user_id': user_id,
+            'change': 'skipped',
+            'empty_harvests': user_activity[user_id][EMPTY_STREAK],
+            'skipped_harvests': user_activity[user_id][SKIPPED]
+        }
+        if 'screen_name' in self.config['users'][user_id]:
+            change_details['screen_name'] = self.config['users'][user_id]['screen_name']
+        return change_details
+
+    # Called by timeline workers.
+    # Returns the max id and the number of tweets collected, which is None if interrupted.
     def _user_timeline(self, user_id=None, since_id=None):
         max_id = int(since_id) if since_id else 0
-        for count, tweet in enumerate(self.twarc.timeline(user_id=user_id, since_id=since_id)):
-            if not count % 100:
-                log.debug("Collected %s tweets for %s", count, user_id)
-            self.writer.write(tweet)
-            max_id = max(max_id, tweet['id'])
-            if self.stop_event.is_set():
-                break
-        return str(max_id) if max_id else None
+        twarc = self._worker_twarc()
+        timeline = twarc.timeline_raw if self.passthrough else twarc.timeline
+        tweet_count = 0
+        try:
+            for tweet in timeline(user_id=user_id, since_id=since_id):
+                if not tweet_count % 100:
+                    log.debug("Collected %s tweets for %s", tweet_count, user_id)
+                self._write(tweet)
+                tweet_count += 1
+                max_id = max(max_id, self._tweet_id(tweet))
+                if self.stop_event.is_set():
+                    tweet_count = None
+                    break
+        except RateLimitInterrupted:
+            log.debug('Stopped waiting for rate limit for %s', user_id)
+            tweet_count = None
+        return str(max_id) if max_id else None, tweet_count
+
+    def _worker_twarc(self):
+        if not hasattr(self.local, 'twarc'):
+            self.local.twarc = self._create_twarc()
+        return self.local.twarc
+
+    # Yields (user_id, result, user) for each user id, in order, looking up users 100 at a time.
+    # Users that are protected are returned by users/lookup. Users that are not returned are looked up individually to
+    # find out whether they are not found or suspended.
+    def _lookup_users(self, user_ids):
+        user_ids = list(user_ids)
+        for start in range(0, len(user_ids), 100):
+            chunk = user_ids[start:start + 100]
+            users = {user['id_str']: user for user in self._lookup_user_chunk(chunk)}
+            for user_id in chunk:
+                user = users.get(str(user_id))
+                if user is None:
+                    result, user = self._lookup_user(user_id)
+                else:
+                    result = 'protected' if user['protected'] else 'OK'
+                yield user_id, result, user
+
+    def _lookup_user_chunk(self, user_ids):
+        url = "https://api.twitter.com/1.1/users/lookup.json"
+        params = {'user_id': ','.join(str(user_id) for user_id in user_ids)}
+        try:
+            return self.twarc.get(url, params=params, allow_404=True).json()
+        except requests.exceptions.HTTPError as exception:
+            # None of the users were found.
+            # {"errors": [{"code": 17, "message": "No user matches for specified terms."}]}
+            if exception.response.status_code == 404:
+                return []
+            raise exception
 
     # From https://github.com/gwu-libraries/sfm-twitter-harvester/blob/master/twitter_harvester.py#L145
     def _lookup_user(self, user_id):
@@ -174,6 +552,21 @@ class TwarcThread(threading.Thread):
                 raise exception
         return result, user
 
+    # Returns the id of a tweet, which may be raw.
+    @staticmethod
+    def _tweet_id(tweet):
+        return extract_id(tweet) if isinstance(tweet, bytes) else tweet['id']
+
+    # Returns the id of a message, which may be raw, or None if it is not a tweet, e.g., a filter stream limit notice.
+    @staticmethod
+    def _message_id(message):
+        if isinstance(message, dict):
+            return message.get('id')
+        try:
+            return extract_id(message)
+        except (KeyError, ValueError):
+            return None
+
     @staticmethod
     def _has_error_code(resp, code):
         if isinstance(code, int):
@@ -184,10 +577,8 @@ class TwarcThread(threading.Thread):
         return False
 
     def _create_twarc(self):
-        return Twarc(self.config["keys"]["consumer_key"],
-                     self.config["keys"]["consumer_secret"],
-                     self.config["keys"]["access_token"],
-                     self.config["keys"]["access_token_secret"],
-                     http_errors=self.http_errors,
-                     connection_errors=self.connection_errors,
-                     tweet_mode="extended")
+        return CredentialPoolClient(self.credentials,
+                                    http_errors=self.http_errors,
+                                    connection_errors=self.connection_errors,
+                                    tweet_mode="extended",
+                                    stop_event=self.stop_event)
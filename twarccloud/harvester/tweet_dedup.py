@@ -0,0 +1,23 @@
+from collections import OrderedDict
+import threading
+
+
+# Thread-safe set of the most recently seen tweet ids, up to capacity.
+# Used to drop tweets that are received more than once, e.g., by overlapping filter streams. Since duplicates arrive
+# close together, only recent tweet ids need to be kept.
+class RecentTweetIds:
+    def __init__(self, capacity=100000):
+        self.capacity = capacity
+        self.tweet_ids = OrderedDict()
+        self.lock = threading.Lock()
+
+    # Adds a tweet id. Returns False if it was already seen.
+    def add(self, tweet_id):
+        with self.lock:
+            if tweet_id in self.tweet_ids:
+                self.tweet_ids.move_to_end(tweet_id)
+                return False
+            self.tweet_ids[tweet_id] = None
+            if len(self.tweet_ids) > self.capacity:
+                self.tweet_ids.popitem(last=False)
+            return True
@@ -1,99 +1,417 @@
 import json
 from datetime import datetime
-import gzip
 import os
-from time import sleep
-from threading import Timer, Thread, Lock, Event
-import hashlib
-from twarccloud.filepaths_helper import get_harvest_path, get_harvest_manifest_filepath
-from twarccloud.harvester.file_queueing_writer import FileQueueingWriter, AddFile
+from time import time
+from threading import Timer, Thread, RLock
+from queue import Queue, Full, Empty
+from twarccloud.filepaths_helper import get_harvest_path, get_harvest_manifest_filepath, \
+    get_harvest_manifest_segment_filepath, DEFAULT_COLLECTIONS_PATH
+from twarccloud.harvester.file_queueing_writer import FileQueueingWriter
+from twarccloud.harvester.file_mover_thread import AddFile, DeleteFile
+from twarccloud.harvester.hashing_file import HashingFile
+from twarccloud.harvester.s3_multipart_file import S3MultipartFile
+from twarccloud.compression import get_codec
+from twarccloud.tweet_stats import TweetStats, get_stats_filepath
+from twarccloud.tweet_file_index import TweetFileIndex, get_index_filepath, DEFAULT_TWEETS_PER_BLOCK
 from twarccloud import log
 
+BACKPRESSURE_BLOCK = 'block'
+BACKPRESSURE_DROP_OLDEST = 'drop_oldest'
+BACKPRESSURE_SPILL = 'spill'
+BACKPRESSURES = (BACKPRESSURE_BLOCK, BACKPRESSURE_DROP_OLDEST, BACKPRESSURE_SPILL)
 
-# A thread for writing tweets to a gzip-compressed, newline-delimited JSON file.
-# Files will be added to a provided file queue and rolled over based on a provided number of tweets per file
-# or seconds per file.
+# Placed on the tweet queue to tell the thread to finish.
+_STOP = object()
+
+
+# Placed on the tweet queue to ask the thread to call a callback once the tweets queued before it are in a closed file.
+class _Checkpoint:
+    def __init__(self, callback):
+        self.callback = callback
+
+
+# A thread for writing tweets to a compressed, newline-delimited JSON file.
+# The compression codec is provided as a codec specification, e.g., gzip:6. The default is gzip. Codecs that compress on
+# multiple threads use compress_threads threads.
+# Tweets may be dicts or the raw JSON bytes received from Twitter's API.
+# Tweets are placed on a bounded queue by write(). This thread takes them off the queue in batches, serializes and
+# compresses them, so that the harvesting thread is not held up by compression.
+# When the queue is full, backpressure determines whether write() blocks, drops the oldest queued tweet, or spills the
+# tweet to disk until this thread catches up. Once a tweet is spilled, the tweets that follow are spilled too until the
+# spill is written, so that tweets are written in the order they were written to this thread.
+# Files will be added to a provided file queue and rolled over based on a provided number of tweets per file,
+# compressed bytes per file, or seconds per file, whichever comes first. Since compressed bytes are counted as the
+# compressor emits them, a file may exceed bytes per file by up to a batch plus what the compressor is holding.
+# If an S3 bucket is provided, files are streamed to S3 with a multipart upload in parts of part size instead of being
+# written to local disk, and are not added to the file queue. The manifest is still written locally.
+# If manifest segments, rather than queueing the whole manifest on every rollover, each rollover's manifest line is
+# queued as a numbered segment. When done, the whole manifest is queued and the segments are deleted.
+# A checkpoint rolls over the file after the tweets written so far, so that progress can be recorded that is safe to
+# resume from.
+# When a file is closed, a stats sidecar is written next to it (see TweetStats), so that readers can skip files that
+# cannot contain the tweets they want.
+# Each tweets per block tweets, the codec ends the block (a gzip member or zstd frame), so that the file is a series of
+# blocks that can each be decompressed on their own. An index of the blocks and the tweet ids in them is written next to
+# the file (see TweetFileIndex), so that a tweet can be read without decompressing the whole file. 0 writes a single
+# block.
 # pylint: disable=too-many-instance-attributes
 class TweetWriterThread(Thread):
-    # pylint: disable=too-many-arguments
+    # pylint: disable=too-many-arguments, too-many-locals
     def __init__(self, collections_path, collection_id, harvest_timestamp, file_queue, harvest_info,
-                 tweets_per_file=None, secs_per_file=30 * 60):
+                 tweets_per_file=None, secs_per_file=30 * 60, queue_size=None, batch_size=500, backpressure=None,
+                 codec=None, compress_threads=None, bytes_per_file=None, s3_bucket=None, part_size=None,
+                 manifest_segments=False, tweets_per_block=DEFAULT_TWEETS_PER_BLOCK):
         self.tweets_per_file = tweets_per_file or 250000
+        self.tweets_per_block = tweets_per_block
+        self.bytes_per_file = bytes_per_file
+        self.s3_bucket = s3_bucket
+        self.part_size = part_size or 16 * 1024 * 1024
+        self.manifest_segments = manifest_segments
+        self.manifest_segment_count = 0
         self.collections_path = collections_path
         self.collection_id = collection_id
         self.harvest_timestamp = harvest_timestamp
         self.file_queue = file_queue
         self.harvest_info = harvest_info
         self.secs_per_file = float(secs_per_file)
+        self.batch_size = batch_size
+        self.codec = get_codec(codec, threads=compress_threads)
+        self.backpressure = backpressure or BACKPRESSURE_BLOCK
+        if self.backpressure not in BACKPRESSURES:
+            raise ValueError('Unknown backpressure: {}'.format(self.backpressure))
+        self.tweet_queue = Queue(maxsize=queue_size or 10000)
+        self.spill = SpillFile(os.path.join(get_harvest_path(collection_id, harvest_timestamp,
+                                                             collections_path=collections_path), 'spill'))
         self.file = None
+        # The file under the compressor, which hashes and counts the compressed bytes.
+        self.hashing_file = None
         self.filepath = None
+        # Number of files started in the same second.
+        self.file_sequence = 1
         self.timer = None
-        self.stop_event = None
         self.tweet_count = 0
-        self.file_lock = Lock()
+        self.stats = None
+        self.index = None
+        # Tweets in the current block.
+        self.block_count = 0
+        self.exception = None
+        # Guards the file against rollover by the timer.
+        self.file_lock = RLock()
         Thread.__init__(self)
 
     def run(self):
-        while not self.stop_event.is_set():
-            sleep(.5)
+        try:
+            while True:
+                batch = self._next_batch()
+                marker = batch.pop() if _is_marker(batch[-1]) else None
+                self._write_batch(batch)
+                # Spilled tweets are newer than the tweets queued, so they are written once no tweets are queued.
+                # Queued markers are newer than the spilled tweets, or were queued when nothing was spilled.
+                if not self._has_queued_tweets():
+                    for spilled in self.spill.drain(self.batch_size):
+                        self._write_batch(spilled, encoded=True)
+                # The stop marker is always the last thing placed on the queue.
+                if marker is _STOP:
+                    break
+                if marker:
+                    self._checkpoint(marker.callback)
+        # pylint: disable=broad-except
+        except Exception as exception:
+            self.exception = exception
 
     def __enter__(self):
         self._new_file()
-        self.stop_event = Event()
         self.start()
         return self
 
     def __exit__(self, *args):
-        self._close_file()
-        self.stop_event.set()
+        # Don't wait forever to stop a thread that has died with a full queue.
+        while self.is_alive():
+            try:
+                self.tweet_queue.put(_STOP, timeout=1)
+                break
+            except Full:
+                pass
         self.join()
+        with self.file_lock:
+            self._close_file()
+        self._consolidate_manifest()
+        if self.exception:
+            raise self.exception
 
     def write(self, tweet):
-        if self.tweet_count == self.tweets_per_file:
-            log.debug('Rolling over because tweet count is %s', self.tweet_count)
-            self._new_file()
+        if self.exception:
+            raise self.exception
+        if self.backpressure == BACKPRESSURE_BLOCK:
+            self._put_blocking(tweet)
+        elif self.backpressure == BACKPRESSURE_DROP_OLDEST:
+            self._put_dropping_oldest(tweet)
+        elif not self._put_spilling(tweet):
+            self.harvest_info.tweets_spilled.incr()
+            return
+        self.harvest_info.queue_depth.incr()
+
+    # Calls the callback from this thread once the tweets written before have been closed in a file.
+    def checkpoint(self, callback):
+        if self.exception:
+            raise self.exception
+        self._put_blocking(_Checkpoint(callback))
+
+    def _checkpoint(self, callback):
         with self.file_lock:
-            self.file.write('{}\n'.format(json.dumps(tweet)).encode('utf-8'))
-        self.tweet_count += 1
-        self.harvest_info.tweets.incr()
+            if self.tweet_count:
+                self._new_file()
+            callback()
+
+    def _put_blocking(self, tweet):
+        while True:
+            try:
+                self.tweet_queue.put(tweet, timeout=1)
+                return
+            except Full:
+                # Don't wait forever on a thread that has died.
+                if self.exception:
+                    raise self.exception from None
+
+    def _put_dropping_oldest(self, tweet):
+        while True:
+            try:
+                self.tweet_queue.put_nowait(tweet)
+                return
+            except Full:
+                if not self._drop_oldest_tweet():
+                    # Nothing but checkpoints queued.
+                    self._put_blocking(tweet)
+                    return
+                self.harvest_info.queue_depth.incr(-1)
+                self.harvest_info.tweets_dropped.incr()
+
+    # Queues the tweet, unless the queue is full or tweets spilled before are waiting. Returns False if spilled.
+    def _put_spilling(self, tweet):
+        with self.spill.lock:
+            if not self.spill.is_pending():
+                try:
+                    self.tweet_queue.put_nowait(tweet)
+                    return True
+                except Full:
+                    pass
+            self.spill.write(self._encode(tweet))
+            return False
+
+    def _has_queued_tweets(self):
+        with self.tweet_queue.mutex:
+            return any(not _is_marker(item) for item in self.tweet_queue.queue)
+
+    # Removes the oldest queued tweet, skipping checkpoints, which are never dropped. Returns False if there is none.
+    def _drop_oldest_tweet(self):
+        with self.tweet_queue.mutex:
+            for index, item in enumerate(self.tweet_queue.queue):
+                if not _is_marker(item):
+                    del self.tweet_queue.queue[index]
+                    self.tweet_queue.not_full.notify()
+                    return True
+        return False
+
+    # Blocks for the next tweet, then takes whatever else is waiting up to the batch size.
+    def _next_batch(self):
+        batch = [self.tweet_queue.get()]
+        while len(batch) < self.batch_size and not _is_marker(batch[-1]):
+            try:
+                batch.append(self.tweet_queue.get_nowait())
+            except Empty:
+                break
+        self.harvest_info.queue_depth.incr(-len([tweet for tweet in batch if not _is_marker(tweet)]))
+        return batch
+
+    def _write_batch(self, tweets, encoded=False):
+        if not tweets:
+            return
+        start = time()
+        written = 0
+        while written < len(tweets):
+            with self.file_lock:
+                if self.tweet_count == self.tweets_per_file:
+                    log.debug('Rolling over because tweet count is %s', self.tweet_count)
+                    self._new_file()
+                elif self._bytes_per_file_reached():
+                    log.debug('Rolling over because file size is %s', self.hashing_file.bytes_written)
+                    self._new_file()
+                elif self.tweets_per_block and self.block_count == self.tweets_per_block:
+                    self._new_block()
+                count = min(len(tweets) - written, self.tweets_per_file - self.tweet_count)
+                if self.tweets_per_block:
+                    count = min(count, self.tweets_per_block - self.block_count)
+                lines = tweets[written:written + count]
+                for tweet in lines:
+                    self.stats.add(tweet)
+                    self.index.add(tweet)
+                self.file.write(b''.join(lines if encoded else (self._encode(tweet) for tweet in lines)))
+                self.tweet_count += count
+                self.block_count += count
+            written += count
+        self.harvest_info.tweets.incr(written)
+        self.harvest_info.batches.incr()
+        self.harvest_info.batch_millis.incr(int((time() - start) * 1000))
+
+    def _bytes_per_file_reached(self):
+        return self.bytes_per_file and self.tweet_count and self.hashing_file.bytes_written >= self.bytes_per_file
+
+    @staticmethod
+    def _encode(tweet):
+        # Raw tweets are written as received.
+        if isinstance(tweet, bytes):
+            return tweet + b'\n'
+        return '{}\n'.format(json.dumps(tweet)).encode('utf-8')
 
     def _new_file(self):
         with self.file_lock:
             self._close_file()
             self.filepath = self._generate_filepath()
-            os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
             log.debug('Starting to write to %s', self.filepath)
-            self.file = gzip.open(self.filepath, 'wb')
+            if self.s3_bucket:
+                file = S3MultipartFile(self.s3_bucket, self._s3_key(), part_size=self.part_size)
+            else:
+                os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
+                file = open(self.filepath, 'wb')
+            self.hashing_file = HashingFile(file)
+            self.file = self.codec.open(self.hashing_file, filename=self.filepath)
             self.tweet_count = 0
+            self.block_count = 0
+            self.stats = TweetStats()
+            self.index = TweetFileIndex()
             # Start a timer
             self.timer = Timer(self.secs_per_file, self._new_file)
             self.timer.start()
 
+    # Restarts the compressor, so that the tweets that follow can be decompressed without those before.
+    def _new_block(self):
+        self.codec.end_block(self.file)
+        self.index.end_block(self.hashing_file.bytes_written)
+        # A stream that cannot start a new block is closed by ending the block.
+        if self.file.closed:
+            self.file = self.codec.open(self.hashing_file, filename=self.filepath)
+        self.block_count = 0
+
     def _close_file(self):
         # Stop the timer
         if self.timer:
             self.timer.cancel()
         if self.file:
             log.debug('Closing %s', self.filepath)
-            self.file.close()
+            try:
+                self.file.close()
+                self.hashing_file.close()
+            except Exception:
+                # Don't leave a partial upload behind.
+                if self.s3_bucket:
+                    self.hashing_file.file.abort()
+                raise
+            finally:
+                self.file = None
+            sha1 = self.hashing_file.hexdigest()
+            self.index.end_block(self.hashing_file.bytes_written)
             self.harvest_info.files.incr()
-            self.harvest_info.file_bytes.incr(os.path.getsize(self.filepath))
-            self._add_to_manifest()
-            log.debug('Adding %s to file queue', self.filepath)
-            self.file_queue.put(AddFile(self.filepath, True))
+            self.harvest_info.file_bytes.incr(self.hashing_file.bytes_written)
+            self._add_to_manifest(sha1)
+            if not self.s3_bucket:
+                log.debug('Adding %s to file queue', self.filepath)
+                self.file_queue.put(AddFile(self.filepath, True, sha1=sha1))
+            with FileQueueingWriter(get_stats_filepath(self.filepath), self.file_queue, delete=True) as stats_writer:
+                stats_writer.write_json(self.stats.to_dict())
+            with FileQueueingWriter(get_index_filepath(self.filepath), self.file_queue, delete=True,
+                                    mode='wb') as index_writer:
+                index_writer.write(self.index.to_bytes())
 
     def _generate_filepath(self):
-        return "{}/tweets-{}.jsonl.gz".format(
+        timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
+        # Files may roll over more than once a second, e.g., for a checkpoint. The suffix sorts after the first file.
+        if self.filepath and os.path.basename(self.filepath).startswith('tweets-{}'.format(timestamp)):
+            self.file_sequence += 1
+            timestamp = '{}_{}'.format(timestamp, self.file_sequence)
+        else:
+            self.file_sequence = 1
+        return "{}/tweets-{}.jsonl{}".format(
             get_harvest_path(self.collection_id, self.harvest_timestamp, collections_path=self.collections_path),
-            datetime.utcnow().strftime('%Y%m%d%H%M%S'))
+            timestamp, self.codec.extension)
+
+    def _s3_key(self):
+        return self.filepath.replace(self.collections_path, DEFAULT_COLLECTIONS_PATH, 1)
 
-    def _add_to_manifest(self):
+    def _add_to_manifest(self, sha1):
         log.debug('Adding %s to manifest', self.filepath)
-        with FileQueueingWriter(get_harvest_manifest_filepath(self.collection_id, self.harvest_timestamp,
-                                                              collections_path=self.collections_path),
-                                self.file_queue, mode='a') as writer:
-            writer.write('{}  {}\n'.format(self._sha1(), os.path.basename(self.filepath)))
-
-    def _sha1(self):
-        with open(self.filepath, 'rb') as file:
-            return hashlib.sha1(file.read()).hexdigest()
+        line = '{}  {}\n'.format(sha1, os.path.basename(self.filepath))
+        if not self.manifest_segments:
+            with FileQueueingWriter(self._manifest_filepath(), self.file_queue, mode='a') as writer:
+                writer.write(line)
+            return
+        os.makedirs(os.path.dirname(self._manifest_filepath()), exist_ok=True)
+        with open(self._manifest_filepath(), 'a') as file:
+            file.write(line)
+        self.manifest_segment_count += 1
+        with FileQueueingWriter(self._manifest_segment_filepath(self.manifest_segment_count), self.file_queue,
+                                delete=True) as writer:
+            writer.write(line)
+
+    # Replaces the manifest segments with the whole manifest.
+    def _consolidate_manifest(self):
+        if not self.manifest_segment_count:
+            return
+        log.debug('Consolidating %s manifest segments', self.manifest_segment_count)
+        self.file_queue.put(AddFile(self._manifest_filepath(), False))
+        for segment in range(1, self.manifest_segment_count + 1):
+            self.file_queue.put(DeleteFile(self._manifest_segment_filepath(segment)))
+        self.manifest_segment_count = 0
+
+    def _manifest_filepath(self):
+        return get_harvest_manifest_filepath(self.collection_id, self.harvest_timestamp,
+                                             collections_path=self.collections_path)
+
+    def _manifest_segment_filepath(self, segment):
+        return get_harvest_manifest_segment_filepath(self.collection_id, self.harvest_timestamp, segment,
+                                                     collections_path=self.collections_path)
+
+
+def _is_marker(item):
+    return item is _STOP or isinstance(item, _Checkpoint)
+
+
+# Disk-backed overflow for encoded tweets that do not fit on the tweet queue.
+# Spilled tweets are read back in the order they were spilled.
+class SpillFile:
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.count = 0
+        # Held by the caller to check whether tweets are waiting and spill atomically.
+        self.lock = RLock()
+
+    def write(self, line):
+        with self.lock:
+            if not self.file:
+                os.makedirs(self.path, exist_ok=True)
+                self.count += 1
+                self.file = open(os.path.join(self.path, 'spill-{}.jsonl'.format(self.count)), 'wb')
+            self.file.write(line)
+
+    # Returns True if there are spilled tweets that have not been drained.
+    def is_pending(self):
+        with self.lock:
+            return self.file is not None
+
+    # Yields lists of spilled tweets, switching new spills to a fresh file.
+    def drain(self, batch_size):
+        with self.lock:
+            file, self.file = self.file, None
+        if not file:
+            return
+        file.close()
+        with open(file.name, 'rb') as spilled_file:
+            lines = []
+            for line in spilled_file:
+                lines.append(line)
+                if len(lines) == batch_size:
+                    yield lines
+                    lines = []
+            if lines:
+                yield lines
+        os.remove(file.name)
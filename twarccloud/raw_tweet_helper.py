@@ -0,0 +1,92 @@
+import json
+import re
+
+# Methods for working with tweets as the raw JSON bytes received from Twitter's API, without fully decoding them.
+
+# Twitter's epoch for tweet ids, in milliseconds.
+_TWEPOCH_MILLIS = 1288834974657
+
+_ID_KEY = b'"id"'
+# Follows the id key.
+_ID_VALUE_PATTERN = re.compile(rb'\s*:\s*(\d+)')
+# A string, which may contain escaped quotes, or a bracket.
+_TOKEN_PATTERN = re.compile(rb'"(?:[^"\\]|\\.)*"|[{}\[\]]', re.DOTALL)
+_OPENING_BRACKETS = b'{['
+_CLOSING_BRACKETS = b'}]'
+_USER_KEY = b'"user"'
+# Follows the user key.
+_USER_ID_VALUE_PATTERN = re.compile(rb'\s*:\s*\{\s*"id"\s*:\s*(\d+)')
+_WHITESPACE_PATTERN = re.compile(rb'\s*')
+
+
+# Returns the id of a raw tweet.
+# The id at depth 1 is found by scanning rather than decoding the whole tweet. Since the top-level id comes first in
+# Twitter's JSON, the scan is short. Falls back to decoding if not found.
+def extract_id(raw_tweet):
+    match = _match_top_level_value(raw_tweet, _ID_KEY, _ID_VALUE_PATTERN)
+    if match:
+        return int(match.group(1))
+    return json.loads(raw_tweet.decode('utf-8'))['id']
+
+
+# Returns the id of the user of a raw tweet.
+# The user at depth 1 is found by scanning, since the user's id comes first in the user object. Falls back to decoding
+# if not found.
+def extract_user_id(raw_tweet):
+    match = _match_top_level_value(raw_tweet, _USER_KEY, _USER_ID_VALUE_PATTERN)
+    if match:
+        return int(match.group(1))
+    return json.loads(raw_tweet.decode('utf-8'))['user']['id']
+
+
+# Yields (depth, first byte, match) for each string and bracket of raw JSON, in order. Depth is the depth of the string
+# or, for a bracket, of what follows it, so the keys of the top-level object are at depth 1.
+# Strings are matched whole, so brackets in strings, e.g., in the text of a tweet, are not counted.
+def _scan_json(raw, start=0):
+    depth = 0
+    for match in _TOKEN_PATTERN.finditer(raw, start):
+        char = raw[match.start():match.start() + 1]
+        if char in _OPENING_BRACKETS:
+            depth += 1
+        elif char != b'"':
+            depth -= 1
+        yield depth, char, match
+
+
+# Returns the match of value pattern after the first key of the top-level object of raw JSON, or None.
+def _match_top_level_value(raw, key, value_pattern):
+    for depth, char, match in _scan_json(raw):
+        if depth == 1 and char == b'"' and match.group() == key:
+            value_match = value_pattern.match(raw, match.end())
+            # A string value that happens to be the same as the key isn't followed by a colon.
+            if value_match:
+                return value_match
+    return None
+
+
+# Yields the raw bytes of each object or array in the JSON array starting at position start of raw JSON.
+# Elements are sliced from the raw JSON by scanning for their brackets, without decoding them.
+def split_json_array(raw, start=0):
+    index = _WHITESPACE_PATTERN.match(raw, start).end()
+    if raw[index:index + 1] != b'[':
+        raise ValueError('Expected a JSON array at position {}'.format(index))
+    element_start = None
+    for depth, char, match in _scan_json(raw, index):
+        if depth == 0:
+            return
+        if depth == 2 and char in _OPENING_BRACKETS:
+            element_start = match.start()
+        elif depth == 1 and char in _CLOSING_BRACKETS:
+            yield raw[element_start:match.end()]
+    raise ValueError('Unterminated JSON array at position {}'.format(index))
+
+
+# Tweet ids are snowflakes, which start with the time the tweet was created.
+# Returns the epoch seconds at which a tweet was created, based on its id.
+def tweet_timestamp(tweet_id):
+    return ((int(tweet_id) >> 22) + _TWEPOCH_MILLIS) // 1000
+
+
+# Returns the lowest tweet id for tweets created at epoch seconds.
+def timestamp_tweet_id(timestamp):
+    return (int(timestamp * 1000) - _TWEPOCH_MILLIS) << 22
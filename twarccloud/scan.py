@@ -0,0 +1,205 @@
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import json
+import multiprocessing
+import os
+import re
+import shutil
+from tempfile import mkdtemp
+from time import time
+from twarccloud.aws import aws_client
+from twarccloud.collection_reader import CollectionReader
+from twarccloud.compression import open_tweet_file
+from twarccloud.export import get_path
+from twarccloud.filepaths_helper import DEFAULT_COLLECTIONS_PATH
+from twarccloud.raw_tweet_helper import extract_id, tweet_timestamp
+from twarccloud.tweet_stats import get_stats_filepath, may_match, to_epoch
+from twarccloud import log
+
+# Searches of collections for the tweets that match a predicate.
+
+ScanStats = namedtuple('ScanStats', ['files', 'skipped', 'matches', 'secs'])
+
+_EXPRESSION_PATTERN = re.compile(r'^([\w.]+)\s*(!=|>=|<=|=|>|<|~)\s*(.*)$')
+_TEXT_PATHS = (['extended_tweet', 'full_text'], ['full_text'], ['text'])
+# Keywords that appear in raw JSON as they are, i.e., without escaping.
+_PLAIN_KEYWORD_PATTERN = re.compile(r'^[A-Za-z0-9 _#@-]+$')
+
+
+# A condition on a value of a tweet: <dotted path><operator><value>, e.g., lang=en, user.followers_count>1000, or
+# entities.hashtags.text~twarc. Operators are =, !=, >, >=, <, <= and ~ (contains, ignoring case). Values are compared
+# as numbers if both are numbers, otherwise as strings. For paths through lists, e.g., entities.hashtags.text, any
+# element may match.
+class Expression:
+    def __init__(self, spec):
+        match = _EXPRESSION_PATTERN.match(spec)
+        if not match:
+            raise ValueError('Invalid expression: {}'.format(spec))
+        self.path = match.group(1).split('.')
+        self.operator = match.group(2)
+        self.value = match.group(3)
+
+    def matches(self, tweet):
+        value = get_path(tweet, self.path)
+        values = value if isinstance(value, list) else [value]
+        return any(self._compare(value) for value in values)
+
+    # pylint: disable=too-many-return-statements
+    def _compare(self, value):
+        if value is None:
+            return self.operator == '!='
+        if self.operator == '~':
+            return self.value.lower() in str(value).lower()
+        left, right = _comparable(value, self.value)
+        if self.operator == '=':
+            return left == right
+        if self.operator == '!=':
+            return left != right
+        if self.operator == '>':
+            return left > right
+        if self.operator == '>=':
+            return left >= right
+        if self.operator == '<':
+            return left < right
+        return left <= right
+
+
+# What a scan matches. Tweets must match all of the conditions provided: any of the keywords (in the text, ignoring
+# case), any of the hashtags (ignoring case and #), any of the user ids, created in [since, until) (naive UTC
+# datetimes), and all of the expressions.
+# Raw lines that cannot match are ruled out before being decoded, where possible.
+# pylint: disable=too-many-instance-attributes
+class ScanPredicate:
+    # pylint: disable=too-many-arguments
+    def __init__(self, keywords=None, hashtags=None, user_ids=None, since=None, until=None, expressions=None):
+        self.keywords = [keyword.lower() for keyword in keywords or []]
+        self.hashtags = {hashtag.lower().lstrip('#') for hashtag in hashtags or []}
+        self.user_ids = {str(user_id) for user_id in user_ids or []}
+        self.since = since
+        self.until = until
+        self.expressions = [Expression(expression) for expression in expressions or []]
+        # Keywords that can be checked against raw lines.
+        self.raw_keywords = [keyword.encode('utf-8') for keyword in self.keywords] \
+            if all(_PLAIN_KEYWORD_PATTERN.match(keyword) for keyword in self.keywords) else []
+        self.raw_user_ids = [user_id.encode('utf-8') for user_id in self.user_ids]
+
+    # Returns False if a raw line cannot match.
+    def may_match_raw(self, line):
+        if self.raw_keywords and not any(keyword in line.lower() for keyword in self.raw_keywords):
+            return False
+        if self.raw_user_ids and not any(user_id in line for user_id in self.raw_user_ids):
+            return False
+        if self.since or self.until:
+            try:
+                timestamp = tweet_timestamp(extract_id(line))
+            except KeyError:
+                return False
+            if self.since and timestamp < to_epoch(self.since):
+                return False
+            if self.until and timestamp >= to_epoch(self.until):
+                return False
+        return True
+
+    # pylint: disable=too-many-return-statements
+    def matches(self, tweet):
+        if 'id' not in tweet:
+            return False
+        if self.keywords:
+            text = next((value for value in (get_path(tweet, path) for path in _TEXT_PATHS) if value), '').lower()
+            if not any(keyword in text for keyword in self.keywords):
+                return False
+        if self.hashtags:
+            hashtags = get_path(tweet, ['entities', 'hashtags', 'text']) or []
+            if not self.hashtags.intersection(hashtag.lower() for hashtag in hashtags):
+                return False
+        if self.user_ids and get_path(tweet, ['user', 'id_str']) not in self.user_ids:
+            return False
+        if self.since and tweet_timestamp(tweet['id']) < to_epoch(self.since):
+            return False
+        if self.until and tweet_timestamp(tweet['id']) >= to_epoch(self.until):
+            return False
+        return all(expression.matches(tweet) for expression in self.expressions)
+
+
+# Scans the tweets of a collection, in a local collections path or an S3 bucket, writing those that match a predicate to
+# a binary file as JSONL. Tweets are written as they are in the tweet files.
+# Tweet files are scanned by a pool of worker processes, each of which decompresses and matches a file as a stream,
+# writing matches to a temporary file. If ordered, matches are written in the order of the tweet files; otherwise, in
+# the order that files finish. Tweet files whose stats sidecars show that they cannot match are skipped.
+# Returns ScanStats.
+# pylint: disable=too-many-arguments, too-many-locals
+def scan_collection(collection_id, output_file, predicate, collections_path=DEFAULT_COLLECTIONS_PATH, bucket=None,
+                    workers=None, ordered=True):
+    start = time()
+    tweet_filepaths = CollectionReader(collection_id, collections_path=collections_path,
+                                       bucket=bucket).tweet_files()
+    temp_path = mkdtemp()
+    tasks = [(tweet_filepath, os.path.join(temp_path, 'matches-{}.jsonl'.format(count)), collection_id,
+              collections_path, bucket, predicate) for count, tweet_filepath in enumerate(tweet_filepaths)]
+    workers = workers or os.cpu_count() or 1
+    results = []
+    try:
+        # A single worker scans in this process.
+        if workers == 1:
+            for task in tasks:
+                results.append(_scan_file(*task))
+                _append_matches(output_file, results[-1])
+        else:
+            # Spawned rather than forked, so that workers don't inherit this process's threads or S3 connections.
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+                futures = [executor.submit(_scan_file, *task) for task in tasks]
+                for future in futures if ordered else as_completed(futures):
+                    results.append(future.result())
+                    _append_matches(output_file, results[-1])
+    finally:
+        shutil.rmtree(temp_path, ignore_errors=True)
+    return ScanStats(len(tasks), len([result for result in results if result[1] is None]),
+                     sum(result[1] or 0 for result in results), time() - start)
+
+
+# Scans a tweet file, writing matches to a matches filepath.
+# Returns (matches filepath, number of matches), with None matches if skipped.
+# pylint: disable=too-many-arguments
+def _scan_file(tweet_filepath, matches_filepath, collection_id, collections_path, bucket, predicate):
+    reader = CollectionReader(collection_id, collections_path=collections_path, bucket=bucket)
+    stats = reader.load_stats(get_stats_filepath(tweet_filepath))
+    if stats is not None and not may_match(stats, since=predicate.since, until=predicate.until,
+                                           user_ids=predicate.user_ids):
+        log.debug('Skipping %s', tweet_filepath)
+        return matches_filepath, None
+    local_filepath = tweet_filepath
+    if bucket:
+        local_filepath = '{}-{}'.format(matches_filepath, os.path.basename(tweet_filepath))
+        aws_client('s3').download_file(bucket, tweet_filepath, local_filepath)
+    log.debug('Scanning %s', tweet_filepath)
+    matches = 0
+    try:
+        with open_tweet_file(local_filepath) as file, open(matches_filepath, 'wb') as matches_file:
+            for line in file:
+                if predicate.may_match_raw(line) and predicate.matches(json.loads(line.decode('utf-8'))):
+                    matches_file.write(line)
+                    matches += 1
+    finally:
+        if bucket:
+            os.remove(local_filepath)
+    return matches_filepath, matches
+
+
+def _append_matches(output_file, result):
+    matches_filepath, matches = result
+    if not matches:
+        return
+    with open(matches_filepath, 'rb') as matches_file:
+        shutil.copyfileobj(matches_file, output_file)
+    output_file.flush()
+    os.remove(matches_filepath)
+
+
+# Returns values as numbers, if both are numbers.
+def _comparable(value, other):
+    if isinstance(value, bool):
+        return str(value).lower(), other.lower()
+    try:
+        return float(value), float(other)
+    except (TypeError, ValueError):
+        return str(value), other
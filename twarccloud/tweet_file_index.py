@@ -0,0 +1,203 @@
+from array import array
+from bisect import bisect_left
+from itertools import groupby
+import os
+import re
+import shutil
+import struct
+from tempfile import mkdtemp
+from twarccloud.aws import aws_client
+from twarccloud.aws.s3 import file_exists
+from twarccloud.compression import get_codec_for_filepath, open_tweet_file
+from twarccloud.filepaths_helper import MANIFEST_FILENAME
+from twarccloud.harvester.hashing_file import HashingFile
+from twarccloud.raw_tweet_helper import extract_id
+from twarccloud import log
+
+DEFAULT_TWEETS_PER_BLOCK = 1000
+
+_MAGIC = b'TWIDX001'
+_HEADER = struct.Struct('<QQ')
+_TWEET_FILE_PATTERN = re.compile(r'\.jsonl(\.[a-z]+)?$')
+
+
+# Returns the filepath of the index for a tweet file, e.g., tweets-20190309153508.idx for
+# tweets-20190309153508.jsonl.gz.
+def get_index_filepath(tweet_filepath):
+    return _TWEET_FILE_PATTERN.sub('.idx', tweet_filepath)
+
+
+# Index of a tweet file that is compressed as a series of blocks, each of which can be decompressed on its own (gzip
+# members or zstd frames), so that a tweet can be read by decompressing only its block.
+# The index records the compressed offset of each block and, sorted, the ids of the tweets in each block.
+# The file is: a magic number; the number of offsets and of tweet ids; the offsets (the start of each block, followed
+# by the end of the last block); the sorted tweet ids; and the block of each tweet id. Arrays are of native
+# unsigned integers, as for TweetIndex.
+# Tweets may be dicts or raw bytes. Messages without a tweet id, e.g., filter stream limit notices, are not indexed.
+class TweetFileIndex:
+    def __init__(self, offsets=None, tweet_ids=None, blocks=None):
+        self.offsets = offsets if offsets is not None else array('Q', [0])
+        self.tweet_ids = tweet_ids if tweet_ids is not None else array('Q')
+        self.blocks = blocks if blocks is not None else array('I')
+
+    # Records a tweet in the current block.
+    def add(self, tweet):
+        try:
+            tweet_id = tweet['id'] if isinstance(tweet, dict) else extract_id(tweet)
+        except (KeyError, TypeError, ValueError):
+            return
+        self.tweet_ids.append(tweet_id)
+        self.blocks.append(len(self.offsets) - 1)
+
+    # Appends the blocks of the index of a file that was concatenated to this file, i.e., that starts at the end of
+    # the last block.
+    def append(self, other):
+        offset = self.offsets[-1]
+        first_block = len(self.offsets) - 1
+        self.offsets.extend(other_offset + offset for other_offset in other.offsets[1:])
+        self.tweet_ids.extend(other.tweet_ids)
+        self.blocks.extend(block + first_block for block in other.blocks)
+
+    # Ends the current block at a compressed offset, which is where the next block, if any, starts.
+    def end_block(self, offset):
+        self.offsets.append(offset)
+
+    # Returns a list of (start offset, end offset) of the blocks that contain any of the tweet ids, in file order.
+    def find(self, tweet_ids):
+        blocks = set()
+        for tweet_id in tweet_ids:
+            index = bisect_left(self.tweet_ids, tweet_id)
+            while index < len(self.tweet_ids) and self.tweet_ids[index] == tweet_id:
+                blocks.add(self.blocks[index])
+                index += 1
+        return [(self.offsets[block], self.offsets[block + 1]) for block in sorted(blocks)]
+
+    def to_bytes(self):
+        order = sorted(range(len(self.tweet_ids)), key=self.tweet_ids.__getitem__)
+        tweet_ids = array('Q', (self.tweet_ids[index] for index in order))
+        blocks = array('I', (self.blocks[index] for index in order))
+        return _MAGIC + _HEADER.pack(len(self.offsets), len(tweet_ids)) + self.offsets.tobytes() + \
+            tweet_ids.tobytes() + blocks.tobytes()
+
+    @staticmethod
+    def from_bytes(data):
+        if not data.startswith(_MAGIC):
+            raise ValueError('Not a tweet file index')
+        offset_count, tweet_id_count = _HEADER.unpack_from(data, len(_MAGIC))
+        position = len(_MAGIC) + _HEADER.size
+        arrays = []
+        for typecode, count in (('Q', offset_count), ('Q', tweet_id_count), ('I', tweet_id_count)):
+            values = array(typecode)
+            values.frombytes(data[position:position + count * values.itemsize])
+            position += count * values.itemsize
+            arrays.append(values)
+        return TweetFileIndex(*arrays)
+
+    @staticmethod
+    def load(filepath):
+        with open(filepath, 'rb') as file:
+            return TweetFileIndex.from_bytes(file.read())
+
+
+# Recompresses a local tweet file as blocks of tweets per block tweets, with the same codec, and writes its index.
+# The tweets are unchanged, but the compressed file is not, so returns its new sha1.
+# Python's zlib cannot resume decompressing from the middle of a deflate stream, so a file written as a single block
+# has to be rewritten to be indexed.
+def index_tweet_file(filepath, tweets_per_block=DEFAULT_TWEETS_PER_BLOCK):
+    codec = get_codec_for_filepath(filepath)
+    index = TweetFileIndex()
+    temp_filepath = '{}.tmp'.format(filepath)
+    with open_tweet_file(filepath) as src_file, open(temp_filepath, 'wb') as dest_file:
+        hashing_file = HashingFile(dest_file)
+        block_file = codec.open(hashing_file, filename=filepath)
+        count = 0
+        for line in src_file:
+            if count == tweets_per_block:
+                block_file.close()
+                index.end_block(hashing_file.bytes_written)
+                block_file = codec.open(hashing_file, filename=filepath)
+                count = 0
+            block_file.write(line)
+            index.add(line)
+            count += 1
+        block_file.close()
+        index.end_block(hashing_file.bytes_written)
+    os.replace(temp_filepath, filepath)
+    with open(get_index_filepath(filepath), 'wb') as file:
+        file.write(index.to_bytes())
+    return hashing_file.hexdigest()
+
+
+# Updates a manifest with the sha1s of files, replacing those of files already in it, and removes files.
+# Files are listed in order of filename, which is the order they were written.
+def update_manifest(manifest_filepath, sha1s, removed_filenames=()):
+    manifest = {}
+    if os.path.exists(manifest_filepath):
+        with open(manifest_filepath) as file:
+            for line in file:
+                sha1, filename = line.rstrip('\n').split('  ', 1)
+                manifest[filename] = sha1
+    manifest.update(sha1s)
+    with open(manifest_filepath, 'w') as file:
+        for filename in sorted(manifest):
+            if filename not in removed_filenames:
+                file.write('{}  {}\n'.format(manifest[filename], filename))
+
+
+# Indexes tweet files written before tweet files were indexed, updating the sha1s in their harvests' manifests.
+# Tweet filepaths are local filepaths or, if a bucket, S3 keys. Files that already have an index are skipped. From S3,
+# each file is downloaded, indexed and uploaded again with its index and manifest.
+# Returns the number of files indexed.
+def backfill_indexes(tweet_filepaths, bucket=None, tweets_per_block=DEFAULT_TWEETS_PER_BLOCK):
+    indexed = 0
+    temp_path = mkdtemp() if bucket else None
+    try:
+        for harvest_path, harvest_filepaths in groupby(sorted(tweet_filepaths), os.path.dirname):
+            sha1s = {}
+            manifest_filepath = os.path.join(harvest_path, MANIFEST_FILENAME)
+            for tweet_filepath in harvest_filepaths:
+                if _has_index(tweet_filepath, bucket):
+                    continue
+                log.info('Indexing %s', tweet_filepath)
+                if bucket:
+                    sha1s[os.path.basename(tweet_filepath)] = _index_s3_tweet_file(bucket, tweet_filepath, temp_path,
+                                                                                   tweets_per_block)
+                else:
+                    sha1s[os.path.basename(tweet_filepath)] = index_tweet_file(tweet_filepath, tweets_per_block)
+                indexed += 1
+            if sha1s:
+                _update_harvest_manifest(manifest_filepath, sha1s, bucket, temp_path)
+    finally:
+        if temp_path:
+            shutil.rmtree(temp_path, ignore_errors=True)
+    return indexed
+
+
+def _has_index(tweet_filepath, bucket):
+    if bucket:
+        return file_exists(bucket, get_index_filepath(tweet_filepath))
+    return os.path.exists(get_index_filepath(tweet_filepath))
+
+
+def _index_s3_tweet_file(bucket, tweet_filepath, temp_path, tweets_per_block):
+    local_filepath = os.path.join(temp_path, os.path.basename(tweet_filepath))
+    aws_client('s3').download_file(bucket, tweet_filepath, local_filepath)
+    sha1 = index_tweet_file(local_filepath, tweets_per_block)
+    aws_client('s3').upload_file(local_filepath, bucket, tweet_filepath, ExtraArgs={'Metadata': {'sha1': sha1}})
+    aws_client('s3').upload_file(get_index_filepath(local_filepath), bucket, get_index_filepath(tweet_filepath))
+    os.remove(local_filepath)
+    os.remove(get_index_filepath(local_filepath))
+    return sha1
+
+
+def _update_harvest_manifest(manifest_filepath, sha1s, bucket, temp_path):
+    if not bucket:
+        if os.path.exists(manifest_filepath):
+            update_manifest(manifest_filepath, sha1s)
+        return
+    if not file_exists(bucket, manifest_filepath):
+        return
+    local_filepath = os.path.join(temp_path, MANIFEST_FILENAME)
+    aws_client('s3').download_file(bucket, manifest_filepath, local_filepath)
+    update_manifest(local_filepath, sha1s)
+    aws_client('s3').upload_file(local_filepath, bucket, manifest_filepath)
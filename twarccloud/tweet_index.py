@@ -0,0 +1,146 @@
+from array import array
+from bisect import bisect_left
+import heapq
+import mmap
+import os
+import re
+import threading
+
+# How duplicates found by the tweet index are handled.
+DEDUP_SKIP = 'skip'
+DEDUP_FLAG = 'flag'
+DEDUP_MODES = (DEDUP_SKIP, DEDUP_FLAG)
+
+# Number of ids added after which they should be flushed, so that memory is bounded.
+FLUSH_IDS = 250000
+
+_SEGMENT_FILENAME_PATTERN = re.compile(r'^(\d+)\.bin$')
+# Number of ids written at a time.
+_CHUNK_IDS = 64 * 1024
+
+
+# The ids of all the tweets collected for a collection, across harvests.
+# Ids are stored in a directory of segment files, each a sorted array of unsigned 64-bit integers (8 bytes per tweet).
+# Segments are memory-mapped rather than loaded, so memory is bounded by the OS page cache rather than the size of the
+# collection. A lookup is a binary search of each segment, the upper levels of which stay cached.
+# Ids added are kept in memory until flushed, which is in two steps, so that the ids can be written once their tweets
+# are: take_new_ids() takes the ids added so far (which are still looked up) and write_segment() writes them as a new
+# segment.
+# Segments are not rewritten. Instead, a new segment is merged with the segments before it that are no more than twice
+# its size into a single new segment. So a collection has a logarithmic number of segments and an id is rewritten a
+# logarithmic number of times. The caller deletes the segments that were merged once the new segment is stored.
+# pylint: disable=too-many-instance-attributes
+class TweetIndex:
+    def __init__(self, path):
+        self.path = path
+        self.new_ids = set()
+        # Sets of ids that were taken, but not written yet.
+        self.taken_ids = []
+        self.lock = threading.Lock()
+        self.segments = []
+        self.segment_number = 0
+        if os.path.exists(path):
+            for filename in sorted(os.listdir(path)):
+                match = _SEGMENT_FILENAME_PATTERN.match(filename)
+                if match:
+                    self.segments.append(_Segment(os.path.join(path, filename)))
+                    self.segment_number = max(self.segment_number, int(match.group(1)))
+
+    # Adds a tweet id. Returns False if it was already in the index.
+    def add(self, tweet_id):
+        tweet_id = int(tweet_id)
+        with self.lock:
+            if self._contains(tweet_id):
+                return False
+            self.new_ids.add(tweet_id)
+            return True
+
+    def __contains__(self, tweet_id):
+        tweet_id = int(tweet_id)
+        with self.lock:
+            return self._contains(tweet_id)
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(segment) for segment in self.segments) + len(self.new_ids) + \
+                   sum(len(tweet_ids) for tweet_ids in self.taken_ids)
+
+    def _contains(self, tweet_id):
+        return tweet_id in self.new_ids or any(tweet_id in tweet_ids for tweet_ids in self.taken_ids) or \
+            any(tweet_id in segment for segment in self.segments)
+
+    # Returns the ids added since last taken, to be written with write_segment().
+    def take_new_ids(self):
+        with self.lock:
+            tweet_ids = self.new_ids
+            self.new_ids = set()
+            if tweet_ids:
+                self.taken_ids.append(tweet_ids)
+            return tweet_ids
+
+    # Writes taken ids as a new segment, merging segments before it.
+    # Returns the filepath of the new segment, or None if there were no ids, and the filepaths of the segments that were
+    # merged into it.
+    # Only one thread writes segments at a time.
+    def write_segment(self, tweet_ids):
+        if not tweet_ids:
+            return None, []
+        merged_segments = []
+        merged_count = len(tweet_ids)
+        for segment in reversed(self.segments):
+            if len(segment) > 2 * merged_count:
+                break
+            merged_segments.insert(0, segment)
+            merged_count += len(segment)
+        os.makedirs(self.path, exist_ok=True)
+        self.segment_number += 1
+        filepath = os.path.join(self.path, '{:010d}.bin'.format(self.segment_number))
+        with open(filepath, 'wb') as file:
+            chunk = array('Q')
+            for tweet_id in heapq.merge(sorted(tweet_ids), *[segment.ids for segment in merged_segments]):
+                chunk.append(tweet_id)
+                if len(chunk) == _CHUNK_IDS:
+                    file.write(chunk)
+                    chunk = array('Q')
+            file.write(chunk)
+        with self.lock:
+            self.segments = self.segments[:len(self.segments) - len(merged_segments)] + [_Segment(filepath)]
+            self.taken_ids = [taken_ids for taken_ids in self.taken_ids if taken_ids is not tweet_ids]
+        for segment in merged_segments:
+            segment.close()
+        return filepath, [segment.filepath for segment in merged_segments]
+
+    def close(self):
+        with self.lock:
+            for segment in self.segments:
+                segment.close()
+            self.segments = []
+
+
+# A memory-mapped segment of a tweet index.
+class _Segment:
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.file = None
+        self.mmap = None
+        self.ids = array('Q')
+        if os.path.getsize(filepath):
+            self.file = open(filepath, 'rb')
+            self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.ids = memoryview(self.mmap).cast('Q')
+
+    def __contains__(self, tweet_id):
+        index = bisect_left(self.ids, tweet_id)
+        return index < len(self.ids) and self.ids[index] == tweet_id
+
+    def __len__(self):
+        return len(self.ids)
+
+    def close(self):
+        if self.file:
+            self.ids.release()
+            self.mmap.close()
+            self.file.close()
+        self.file = None
+        self.mmap = None
+        self.ids = array('Q')
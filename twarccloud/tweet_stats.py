@@ -0,0 +1,79 @@
+import calendar
+from datetime import datetime
+import re
+from twarccloud.bloom_filter import BloomFilter
+from twarccloud.raw_tweet_helper import extract_id, extract_user_id, tweet_timestamp
+
+_TWEET_FILE_PATTERN = re.compile(r'\.jsonl(\.[a-z]+)?$')
+
+
+# Returns the filepath of the stats sidecar for a tweet file, e.g., tweets-20190309153508.stats.json for
+# tweets-20190309153508.jsonl.gz.
+def get_stats_filepath(tweet_filepath):
+    return _TWEET_FILE_PATTERN.sub('.stats.json', tweet_filepath)
+
+
+# Statistics for the tweets in a tweet file, which allow a reader to skip files that cannot contain the tweets it wants:
+# the number of tweets, the lowest and highest tweet ids and created_at times, and a Bloom filter of the user ids.
+# Created_at times are derived from the tweet ids.
+# Tweets may be dicts or raw bytes. Messages without a tweet id, e.g., filter stream limit notices, are counted but
+# otherwise ignored.
+class TweetStats:
+    def __init__(self):
+        self.tweets = 0
+        self.min_tweet_id = None
+        self.max_tweet_id = None
+        self.user_ids = set()
+
+    def add(self, tweet):
+        self.tweets += 1
+        try:
+            if isinstance(tweet, dict):
+                tweet_id, user_id = tweet['id'], tweet['user']['id']
+            else:
+                tweet_id, user_id = extract_id(tweet), extract_user_id(tweet)
+        except (KeyError, TypeError, ValueError):
+            return
+        if self.min_tweet_id is None or tweet_id < self.min_tweet_id:
+            self.min_tweet_id = tweet_id
+        if self.max_tweet_id is None or tweet_id > self.max_tweet_id:
+            self.max_tweet_id = tweet_id
+        self.user_ids.add(user_id)
+
+    def to_dict(self):
+        user_ids = BloomFilter.create(len(self.user_ids))
+        for user_id in self.user_ids:
+            user_ids.add(user_id)
+        return {
+            'tweets': self.tweets,
+            'min_tweet_id': self.min_tweet_id,
+            'max_tweet_id': self.max_tweet_id,
+            'min_created_at': _created_at(self.min_tweet_id),
+            'max_created_at': _created_at(self.max_tweet_id),
+            'user_ids': user_ids.to_dict()
+        }
+
+
+# Returns True if a file with the stats may contain tweets created in [since, until) by one of the user ids.
+# Since and until are naive UTC datetimes.
+def may_match(stats_dict, since=None, until=None, user_ids=None):
+    if stats_dict['min_tweet_id'] is None:
+        # No tweets, or only messages that are not tweets.
+        return bool(stats_dict['tweets']) and not (since or until or user_ids)
+    if since and tweet_timestamp(stats_dict['max_tweet_id']) < to_epoch(since):
+        return False
+    if until and tweet_timestamp(stats_dict['min_tweet_id']) >= to_epoch(until):
+        return False
+    if user_ids:
+        bloom_filter = BloomFilter.from_dict(stats_dict['user_ids'])
+        return any(int(user_id) in bloom_filter for user_id in user_ids)
+    return True
+
+
+def _created_at(tweet_id):
+    return datetime.utcfromtimestamp(tweet_timestamp(tweet_id)).isoformat() if tweet_id is not None else None
+
+
+# Returns the epoch seconds of a naive UTC datetime.
+def to_epoch(timestamp):
+    return calendar.timegm(timestamp.utctimetuple())
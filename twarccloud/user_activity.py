@@ -0,0 +1,65 @@
+import json
+import os
+from .raw_tweet_helper import tweet_timestamp
+
+# Weight of the latest harvest in the moving average of tweets per harvest.
+_ALPHA = .5
+
+# Indexes of the statistics for a user.
+LAST_TWEET = 0
+TWEETS_PER_HARVEST = 1
+EMPTY_STREAK = 2
+SKIPPED = 3
+
+
+# Activity of the users of a user timeline collection across harvests.
+# For compactness, the statistics for each user are stored as a list:
+# [last tweet epoch seconds, moving average of tweets per harvest, empty harvest streak, harvests skipped since polled]
+class UserActivity(dict):
+    # Loads user activity from a file. If the file does not exist, starts with no activity.
+    @staticmethod
+    def load(filepath):
+        user_activity = UserActivity()
+        if os.path.exists(filepath):
+            with open(filepath) as file:
+                user_activity.update(json.load(file))
+        return user_activity
+
+    # Records that a user's timeline was harvested.
+    def record(self, user_id, tweet_count, max_id=None):
+        last_tweet, tweets_per_harvest, empty_streak, _ = self.get(user_id, [None, None, 0, 0])
+        if max_id:
+            last_tweet = max(last_tweet or 0, tweet_timestamp(max_id))
+        if tweets_per_harvest is None:
+            tweets_per_harvest = tweet_count
+        else:
+            tweets_per_harvest = round(_ALPHA * tweet_count + (1 - _ALPHA) * tweets_per_harvest, 1)
+        self[user_id] = [last_tweet, tweets_per_harvest, 0 if tweet_count else empty_streak + 1, 0]
+
+    # Records that a user's timeline was skipped.
+    def skip(self, user_id):
+        self[user_id][SKIPPED] += 1
+
+    # Returns user ids in the order that they should be harvested: users without activity, then by tweets per
+    # harvest, then by most recent tweet.
+    def priority_order(self, user_ids):
+        def priority(user_id):
+            if user_id not in self:
+                return 0, 0, 0
+            return 1, -(self[user_id][TWEETS_PER_HARVEST] or 0), -(self[user_id][LAST_TWEET] or 0)
+        return sorted(user_ids, key=priority)
+
+    # Returns True if a user should be skipped this harvest.
+    # After each harvest without tweets, a user is polled half as often, up to skipping max skip harvests in a row.
+    def should_skip(self, user_id, max_skip):
+        if not max_skip or user_id not in self:
+            return False
+        empty_streak = self[user_id][EMPTY_STREAK]
+        if not empty_streak:
+            return False
+        return self[user_id][SKIPPED] < min(2 ** (empty_streak - 1) - 1, max_skip)
+
+    # Removes users that are not in a list of user ids.
+    def prune(self, user_ids):
+        for user_id in set(self.keys()).difference(user_ids):
+            del self[user_id]
@@ -7,34 +7,89 @@ import os
 from time import sleep
 import signal
 import copy
+from contextlib import ExitStack
 import dateutil.parser
+from twarccloud.compression import benchmark, open_tweet_file
 from twarccloud.harvester.server_thread import ServerThread
 from twarccloud.harvester.twarc_thread import TwarcThread
 from twarccloud.filepaths_helper import get_lock_file, get_collection_config_filepath, \
-    get_harvest_info_file, get_changeset_file, get_harvest_file
+    get_harvest_info_file, get_changeset_file, get_harvest_file, get_collection_path, get_harvest_checkpoint_filepath, \
+    get_harvest_path, DEFAULT_COLLECTIONS_PATH
 from twarccloud.harvester.file_mover_thread import S3FileMoverThread
-from twarccloud.harvester.collection_lock import CollectionLock, assert_locked
-from twarccloud.aws.aws_helper import sync_collection_config, sync_collection_config_file
+from twarccloud.harvester.collection_lock import CollectionLock, LockedException, is_locked, is_stale, read_lock
+from twarccloud.aws.aws_helper import sync_collection_config, sync_collection_config_file, sync_checkpoint
+from twarccloud.aws.s3 import abort_multipart_uploads
 from twarccloud.harvester.collection_lock import force_unlock
 from twarccloud.harvester.monitoring_thread import MonitoringThread
 from twarccloud.harvester.harvest_info import HarvestInfo
+from twarccloud.harvester.tweet_writer_thread import BACKPRESSURES
+from twarccloud.tweet_file_index import DEFAULT_TWEETS_PER_BLOCK
+from twarccloud.compaction import compact_harvest
 from twarccloud.harvester.file_queueing_writer import FileQueueingWriter
 from twarccloud.collection_config import CollectionConfig
 from twarccloud.changeset import Changeset
 from twarccloud.config_helpers import setup_logging, setup_honeybadger, load_ini_config, setup_aws_keys
+from twarccloud.cli.arg_types import size, codec_spec
 from twarccloud import log, __version__
 
 
+# The state of harvesting a single collection.
+# pylint: disable=too-few-public-methods
+class CollectionHarvest:
+    def __init__(self, collection_id, harvest_timestamp):
+        self.collection_id = collection_id
+        self.harvest_info = HarvestInfo(collection_id, harvest_timestamp)
+        self.changeset = Changeset()
+        self.changeset['harvest_timestamp'] = harvest_timestamp.isoformat()
+        self.changeset['note'] = 'Changes based on harvester.'
+        # Checkpoint of the harvest that left a stale lock, if any.
+        self.checkpoint = None
+        self.collection_config = None
+        # Collection config to harvest with, which has the checkpoint's changes merged.
+        self.harvest_config = None
+
+
+# Harvests one or more collections in a single process.
+# Each collection has its own lock, writer and changeset. The file mover, server and monitoring are shared. When
+# harvesting several collections, a collection that is locked is skipped.
 # pylint: disable=too-many-instance-attributes, too-few-public-methods
 class TweetHarvester:
-    # pylint: disable=too-many-arguments
-    def __init__(self, collection_id, collections_path, bucket=None, tweets_per_file=None, monitor=False,
-                 shutdown=False, port=80):
+    # pylint: disable=too-many-arguments, too-many-locals
+    def __init__(self, collection_ids, collections_path, bucket=None, tweets_per_file=None, monitor=False,
+                 shutdown=False, port=80, queue_size=None, backpressure=None, passthrough=False, codec=None,
+                 compress_threads=None, bytes_per_file=None, stream_to_s3=False, part_size=None,
+                 upload_workers=4, metadata_debounce_secs=10, manifest_segments=False, timeline_workers=4,
+                 checkpoint_secs=5 * 60, stale_lock_secs=20 * 60, search_shards=1,
+                 tweets_per_block=DEFAULT_TWEETS_PER_BLOCK, compact_bytes=None):
         self.harvest_timestamp = datetime.utcnow()
-        self.collection_id = collection_id
+        if isinstance(collection_ids, str):
+            collection_ids = [collection_ids]
+        self.collection_harvests = [CollectionHarvest(collection_id, self.harvest_timestamp)
+                                    for collection_id in collection_ids]
         self.collections_path = collections_path
         self.bucket = bucket
         self.tweets_per_file = tweets_per_file
+        self.tweets_per_block = tweets_per_block
+        self.bytes_per_file = bytes_per_file
+        # If compact bytes, small tweet files are compacted into files of up to compact bytes when done.
+        self.compact_bytes = compact_bytes
+        self.stream_to_s3 = stream_to_s3 and bucket
+        self.part_size = part_size
+        self.upload_workers = upload_workers
+        self.timeline_workers = timeline_workers
+        self.search_shards = search_shards
+        # Progress is checkpointed and the lock's heartbeat updated every checkpoint secs.
+        self.checkpoint_secs = checkpoint_secs
+        # A lock without a heartbeat for stale lock secs was left by a harvester that died, so its harvest is resumed.
+        self.stale_lock_secs = stale_lock_secs
+        self.metadata_debounce_secs = metadata_debounce_secs
+        # Manifest segments only save uploading.
+        self.manifest_segments = manifest_segments and bucket
+        self.queue_size = queue_size
+        self.backpressure = backpressure
+        self.passthrough = passthrough
+        self.codec = codec
+        self.compress_threads = compress_threads
         self.monitor = monitor
         self.port = port
 
@@ -46,10 +101,6 @@ class TweetHarvester:
         # 4. SIGKILL triggers shutdown event which causes the app to exit.
 
         self.file_queue = Queue()
-        self.harvest_info = HarvestInfo(self.collection_id, self.harvest_timestamp)
-        self.changeset = Changeset()
-        self.changeset['harvest_timestamp'] = self.harvest_timestamp.isoformat()
-        self.changeset['note'] = 'Changes based on harvester.'
 
         # This stops harvesting and cleans up.
         self.stop_event = Event()
@@ -70,73 +121,72 @@ class TweetHarvester:
         signal.signal(signal.SIGTERM, signal_handler)
         signal.signal(signal.SIGINT, signal_handler)
 
-        self._config = None
-
     def harvest(self):
         log.info('Starting harvester')
         # Sync
         if self.bucket:
-            sync_collection_config(self.collections_path, self.collection_id, self.bucket)
+            for collection_harvest in self.collection_harvests:
+                sync_collection_config(self.collections_path, collection_harvest.collection_id, self.bucket)
 
-        # Check if collection is locked
-        assert_locked(get_lock_file(self.collection_id, collections_path=self.collections_path))
+        # Check if collections are locked
+        collection_harvests = self._check_locks()
 
         # Start the server
-        ServerThread(self.stop_event, self.stopped_event, self.shutdown_event, self.harvest_info, self.port).start()
+        ServerThread(self.stop_event, self.stopped_event, self.shutdown_event,
+                     [collection_harvest.harvest_info for collection_harvest in collection_harvests],
+                     self.port).start()
 
         # Start the monitor
         if self.monitor:
             MonitoringThread().start()
 
-        # Load the collection config
-        collection_config = self._load_collection_config()
-
-        with S3FileMoverThread(self.file_queue, self.collections_path, self.bucket), CollectionLock(
-                self.collections_path, self.collection_id, self.file_queue, harvest_timestamp=self.harvest_timestamp):
-            # Write the collection config file to harvester
-            self._write_harvest_collection_config(collection_config)
+        # Load the collection configs
+        for collection_harvest in collection_harvests:
+            collection_harvest.collection_config = self._load_collection_config(collection_harvest.collection_id)
+            collection_harvest.harvest_config = self._resume(collection_harvest) if collection_harvest.checkpoint \
+                else collection_harvest.collection_config
+
+        with S3FileMoverThread(self.file_queue, self.collections_path, self.bucket, workers=self.upload_workers,
+                               debounce_secs=self.metadata_debounce_secs) as file_mover, \
+                ExitStack() as collection_locks:
+            for collection_harvest in collection_harvests:
+                collection_locks.enter_context(CollectionLock(self.collections_path, collection_harvest.collection_id,
+                                                              self.file_queue,
+                                                              harvest_timestamp=self.harvest_timestamp,
+                                                              heartbeat_secs=self.checkpoint_secs))
+                # Write the collection config file to harvester
+                self._write_harvest_collection_config(collection_harvest)
+
+                # Clean up uploads abandoned by previous harvests. Since the collection is locked, no other harvester
+                # can be uploading.
+                if self.stream_to_s3:
+                    abort_multipart_uploads(self.bucket, get_collection_path(collection_harvest.collection_id),
+                                            initiated_before=self.harvest_timestamp)
 
             # Start collecting
-            twarc_thread = TwarcThread(collection_config, self.collections_path, self.harvest_timestamp,
-                                       self.file_queue, self.changeset, self.stop_event, self.harvest_info,
-                                       self.tweets_per_file)
-            twarc_thread.start()
+            twarc_threads = [self._start_twarc_thread(collection_harvest) for collection_harvest in collection_harvests]
 
             # Wait for collection to stop
-            twarc_thread.join()
-            if twarc_thread.exception:
-                raise twarc_thread.exception
-
-            # Save harvester info
-            with FileQueueingWriter(get_harvest_info_file(self.collection_id, self.harvest_timestamp,
-                                                          collections_path=self.collections_path),
-                                    self.file_queue) as harvest_info_writer:
-                harvest_info_writer.write_json(self.harvest_info.to_dict(), indent=2)
-            if self.changeset.has_changes():
-                # Sync again
-                if self.bucket:
-                    sync_collection_config_file(self.collections_path, self.collection_id,
-                                                self.bucket)
-                latest_collection_config = self._load_collection_config()
-                if latest_collection_config.get('timestamp', 1) != collection_config.get('timestamp', 2):
-                    # If it has changed, then delete any updates from changeset for users that no longer exist.
-                    log.debug('Cleaning changeset')
-                    self.changeset.clean_changeset(latest_collection_config)
-                # Merge changes into latest config
-                latest_collection_config.merge_changeset(self.changeset)
-                # Write config
-                with FileQueueingWriter(
-                        get_collection_config_filepath(self.collection_id, collections_path=self.collections_path),
-                        self.file_queue) as changeset_writer:
-                    changeset_writer.write_json(latest_collection_config, indent=2)
-
-                # Write changeset
-                change_timestamp = dateutil.parser.parse(self.changeset['change_timestamp'])
-                with FileQueueingWriter(
-                        get_changeset_file(self.collection_id, change_timestamp,
-                                           collections_path=self.collections_path),
-                        self.file_queue) as changeset_writer:
-                    changeset_writer.write_json(self.changeset, indent=2)
+            exception = None
+            finished_collection_harvests = []
+            for collection_harvest, twarc_thread in zip(collection_harvests, twarc_threads):
+                twarc_thread.join()
+                if twarc_thread.exception:
+                    # Let the other collections finish before raising.
+                    log.error('Harvesting %s failed: %s', collection_harvest.collection_id, twarc_thread.exception)
+                    exception = exception or twarc_thread.exception
+                    continue
+                self._finish(collection_harvest)
+                finished_collection_harvests.append(collection_harvest)
+            if exception:
+                raise exception
+
+            # Compact once all files have been moved, but while the collections are still locked, so that
+            # last_harvest.json isn't written until the harvest's files are final.
+            if self.compact_bytes:
+                file_mover.flush()
+                for collection_harvest in finished_collection_harvests:
+                    self._compact(collection_harvest)
 
         log.info('Harvesting stopped')
         # All done
@@ -147,24 +197,199 @@ class TweetHarvester:
             sleep(.5)
         log.info('Shut down')
 
-    def _load_collection_config(self):
-        with open(
-                get_collection_config_filepath(self.collection_id,
-                                               collections_path=self.collections_path)) as config_file:
+    def _start_twarc_thread(self, collection_harvest):
+        twarc_thread = TwarcThread(collection_harvest.harvest_config, self.collections_path, self.harvest_timestamp,
+                                   self.file_queue, collection_harvest.changeset, self.stop_event,
+                                   collection_harvest.harvest_info,
+                                   tweets_per_file=self.tweets_per_file, queue_size=self.queue_size,
+                                   backpressure=self.backpressure, passthrough=self.passthrough,
+                                   codec=self.codec, compress_threads=self.compress_threads,
+                                   bytes_per_file=self.bytes_per_file,
+                                   s3_bucket=self.bucket if self.stream_to_s3 else None,
+                                   part_size=self.part_size, manifest_segments=self.manifest_segments,
+                                   timeline_workers=self.timeline_workers,
+                                   checkpoint_secs=self.checkpoint_secs, resume=collection_harvest.checkpoint,
+                                   search_shards=self.search_shards, tweets_per_block=self.tweets_per_block)
+        twarc_thread.start()
+        return twarc_thread
+
+    # Saves the harvest info and merges the changeset into the collection config.
+    def _finish(self, collection_harvest):
+        collection_id = collection_harvest.collection_id
+        changeset = collection_harvest.changeset
+        # Save harvester info
+        with FileQueueingWriter(get_harvest_info_file(collection_id, self.harvest_timestamp,
+                                                      collections_path=self.collections_path),
+                                self.file_queue) as harvest_info_writer:
+            harvest_info_writer.write_json(collection_harvest.harvest_info.to_dict(), indent=2)
+        if changeset.has_changes():
+            # Sync again
+            if self.bucket:
+                sync_collection_config_file(self.collections_path, collection_id, self.bucket)
+            latest_collection_config = self._load_collection_config(collection_id)
+            if latest_collection_config.get('timestamp', 1) != collection_harvest.collection_config.get('timestamp',
+                                                                                                        2):
+                # If it has changed, then delete any updates from changeset for users that no longer exist.
+                log.debug('Cleaning changeset')
+                changeset.clean_changeset(latest_collection_config)
+            # Merge changes into latest config
+            latest_collection_config.merge_changeset(changeset)
+            # Write config
+            with FileQueueingWriter(
+                    get_collection_config_filepath(collection_id, collections_path=self.collections_path),
+                    self.file_queue) as changeset_writer:
+                changeset_writer.write_json(latest_collection_config, indent=2)
+
+            # Write changeset
+            change_timestamp = dateutil.parser.parse(changeset['change_timestamp'])
+            with FileQueueingWriter(
+                    get_changeset_file(collection_id, change_timestamp, collections_path=self.collections_path),
+                    self.file_queue) as changeset_writer:
+                changeset_writer.write_json(changeset, indent=2)
+
+    # Compacts the small tweet files of a collection's harvest.
+    def _compact(self, collection_harvest):
+        harvest_path = get_harvest_path(collection_harvest.collection_id, self.harvest_timestamp,
+                                        collections_path=DEFAULT_COLLECTIONS_PATH if self.bucket
+                                        else self.collections_path)
+        compacted = compact_harvest(harvest_path, target_bytes=self.compact_bytes, bucket=self.bucket)
+        if compacted:
+            log.info('Compacted %s tweet files for %s', compacted, collection_harvest.collection_id)
+
+    # Returns the collection harvests that are not locked.
+    # A locked collection raises a LockedException if it is the only one.
+    def _check_locks(self):
+        collection_harvests = []
+        for collection_harvest in self.collection_harvests:
+            try:
+                collection_harvest.checkpoint = self._check_lock(collection_harvest.collection_id)
+                collection_harvests.append(collection_harvest)
+            except LockedException as exception:
+                if len(self.collection_harvests) == 1:
+                    raise exception
+                log.warning('Skipping %s since locked', collection_harvest.collection_id)
+        if not collection_harvests:
+            raise LockedException()
+        return collection_harvests
+
+    # Raises a LockedException if the collection is locked, unless the lock is stale.
+    # Returns the checkpoint of the harvest that left a stale lock, if any.
+    def _check_lock(self, collection_id):
+        lock_filepath = get_lock_file(collection_id, collections_path=self.collections_path)
+        if not is_locked(lock_filepath):
+            return None
+        if not self.stale_lock_secs or not is_stale(lock_filepath, self.stale_lock_secs):
+            raise LockedException()
+        stale_harvest_timestamp = dateutil.parser.parse(read_lock(lock_filepath)['harvest_id'])
+        log.warning('Lock left by harvest %s is stale', stale_harvest_timestamp.isoformat())
+        if self.bucket:
+            sync_checkpoint(self.collections_path, collection_id, stale_harvest_timestamp, self.bucket)
+        checkpoint_filepath = get_harvest_checkpoint_filepath(collection_id, stale_harvest_timestamp,
+                                                              collections_path=self.collections_path)
+        if not os.path.exists(checkpoint_filepath):
+            log.warning('No checkpoint to resume from')
+            return None
+        with open(checkpoint_filepath) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        checkpoint['harvest_id'] = stale_harvest_timestamp.isoformat()
+        return checkpoint
+
+    # Carries the changes recorded by a checkpoint into this harvest.
+    # Returns the collection config to harvest with, which has the changes merged.
+    @staticmethod
+    def _resume(collection_harvest):
+        checkpoint = collection_harvest.checkpoint
+        log.info('Resuming %s from checkpoint of harvest %s at %s', collection_harvest.collection_id,
+                 checkpoint['harvest_id'], checkpoint['checkpoint_timestamp'])
+        collection_harvest.changeset['update'] = checkpoint['changeset']['update']
+        collection_harvest.changeset['delete'] = checkpoint['changeset']['delete']
+        collection_harvest.changeset['note'] = 'Changes based on harvester, resumed from harvest {}.'.format(
+            checkpoint['harvest_id'])
+        harvest_config = copy.deepcopy(collection_harvest.collection_config)
+        harvest_config.merge_changeset(checkpoint['changeset'])
+        return harvest_config
+
+    def _load_collection_config(self, collection_id):
+        with open(get_collection_config_filepath(collection_id, collections_path=self.collections_path)) as config_file:
             return CollectionConfig(json.load(config_file))
 
-    def _write_harvest_collection_config(self, collection_config):
-        harvest_collection_config_filepath = get_harvest_file(self.collection_id, self.harvest_timestamp,
+    def _write_harvest_collection_config(self, collection_harvest):
+        harvest_collection_config_filepath = get_harvest_file(collection_harvest.collection_id, self.harvest_timestamp,
                                                               'collection.json', collections_path=self.collections_path)
         os.makedirs(os.path.dirname(harvest_collection_config_filepath), exist_ok=True)
         # Remove secrets
-        clean_config = copy.deepcopy(collection_config)
-        del clean_config['keys']['consumer_secret']
-        del clean_config['keys']['access_token_secret']
+        clean_config = copy.deepcopy(collection_harvest.collection_config)
+        for keys in clean_config.key_sets():
+            del keys['consumer_secret']
+            del keys['access_token_secret']
         with FileQueueingWriter(harvest_collection_config_filepath, self.file_queue) as config_writer:
             config_writer.write_json(clean_config, indent=2)
 
 
+def add_writer_arguments(parser):
+    parser.add_argument('--tweets-per-file', default='250000', type=int, help='Tweets per file. Default is 250,000.')
+    parser.add_argument('--bytes-per-file', type=size,
+                        help='Compressed size at which to start a new file, e.g., 256MB. Whichever of tweets per '
+                             'file, bytes per file, or 30 minutes is reached first starts a new file.')
+    parser.add_argument('--tweets-per-block', default=str(DEFAULT_TWEETS_PER_BLOCK), type=int,
+                        help='Tweets per independently compressed block of a file, which is what is decompressed to '
+                             'read a single tweet. 0 for a single block. Default is {:,}.'.format(
+                                 DEFAULT_TWEETS_PER_BLOCK))
+    parser.add_argument('--compact-size', type=size,
+                        help='When done, compact adjacent small tweet files into files of up to this size, e.g., '
+                             '256MB. Default is to not compact.')
+    parser.add_argument('--queue-size', default='10000', type=int,
+                        help='Tweets that may be waiting to be written. Default is 10,000.')
+    parser.add_argument('--backpressure', default='block', choices=BACKPRESSURES,
+                        help='What to do when the queue of tweets waiting to be written is full. Default is block.')
+    parser.add_argument('--passthrough', action='store_true',
+                        help='Write tweets as received from the API instead of decoding and re-encoding them.')
+    parser.add_argument('--codec', type=codec_spec,
+                        help='Compression codec and level, e.g., gzip:6, pgzip:6, bgzf:6 or zstd:3. Overrides the '
+                             'collection configuration. Default is gzip:9.')
+    add_compress_threads_argument(parser)
+    parser.add_argument('--timeline-workers', default='4', type=int,
+                        help='Number of user timelines to harvest at once. Default is 4.')
+    parser.add_argument('--search-shards', default='1', type=int,
+                        help='Number of time windows to split a search into and search at once. Default is 1.')
+    parser.add_argument('--checkpoint-secs', default='300', type=int,
+                        help='Seconds between checkpoints of harvest progress and lock heartbeats. 0 to turn off. '
+                             'Default is 300.')
+    parser.add_argument('--stale-lock-secs', default='1200', type=int,
+                        help='Seconds without a heartbeat after which a lock is stale and its harvest is resumed. '
+                             '0 to never resume. Default is 1200.')
+
+
+def add_compress_threads_argument(parser):
+    parser.add_argument('--compress-threads', type=int,
+                        help='Threads for codecs that compress in parallel (pgzip, bgzf and zstd). Default is the '
+                             'number of CPUs.')
+
+
+def add_benchmark_subparser(subparsers):
+    benchmark_parser = subparsers.add_parser('benchmark', help='Benchmark compression codecs.')
+    benchmark_parser.add_argument('sample_filepath',
+                                  help='File of tweets to compress. May be newline-delimited JSON or a compressed '
+                                       'tweet file.')
+    benchmark_parser.add_argument('--codecs', nargs='+', type=codec_spec,
+                                  default=['gzip:1', 'gzip:6', 'gzip:9', 'pgzip:6', 'bgzf:6', 'zstd:1', 'zstd:3',
+                                           'zstd:9'],
+                                  help='Codecs to benchmark.')
+    add_compress_threads_argument(benchmark_parser)
+    benchmark_parser.add_argument('--sample-mb', default=50, type=int,
+                                  help='Maximum MB of tweets to read from the sample. Default is 50.')
+    return benchmark_parser
+
+
+def benchmark_command(sample_filepath, codec_specs, sample_mb, compress_threads=None):
+    with (open(sample_filepath, 'rb') if sample_filepath.endswith('.jsonl') else open_tweet_file(
+            sample_filepath)) as file:
+        sample = file.read(sample_mb * 1024 * 1024)
+    print('Sample of {:,} bytes'.format(len(sample)))
+    for codec, mb_per_sec, ratio in benchmark(sample, codec_specs, threads=compress_threads):
+        print('{:<10} {:>8.1f} MB/s {:>6.2f}x'.format(codec, mb_per_sec, ratio))
+
+
 def add_local_subparser(subparsers):
     local_parser = subparsers.add_parser('local', help='Collect in local mode.')
     local_subparser = local_parser.add_subparsers(help='sub-command help', dest='subcommand')
@@ -173,8 +398,7 @@ def add_local_subparser(subparsers):
     local_harvest_parser.add_argument('collection_id', help='Collection id')
     local_harvest_parser.add_argument('--collections-path', default='collections',
                                       help='Base path for collections. Default: collections.')
-    local_harvest_parser.add_argument('--tweets-per-file', default='250000', type=int,
-                                      help='Tweets per file. Default is 250,000.')
+    add_writer_arguments(local_harvest_parser)
     local_harvest_parser.add_argument('--monitor', action='store_true', help='Log monitoring information.')
 
     local_unlock_parser = local_subparser.add_parser('unlock', help='Unlock a collection')
@@ -189,12 +413,27 @@ def add_aws_subparser(subparsers):
 
     aws_harvest_parser = aws_subparser.add_parser('harvester', help='Harvest tweets')
     aws_harvest_parser.add_argument('bucket', help='S3 bucket')
-    aws_harvest_parser.add_argument('collection_id', help='Collection id')
+    aws_harvest_parser.add_argument('collection_ids', nargs='+', metavar='collection_id',
+                                    help='Collection id. May be repeated to harvest several collections at once.')
     aws_harvest_parser.add_argument('--temp', default='temp', help='Path for temporary files.')
-    aws_harvest_parser.add_argument('--tweets-per-file', default='250000', type=int,
-                                    help='Tweets per file. Default is 250,000.')
+    add_writer_arguments(aws_harvest_parser)
     aws_harvest_parser.add_argument('--monitor', action='store_true', help='Log monitoring information.')
     aws_harvest_parser.add_argument('--shutdown', action='store_true', help='Shutdown after completing harvester.')
+    aws_harvest_parser.add_argument('--stream-to-s3', action='store_true',
+                                    help='Upload tweet files to S3 as they are written instead of staging them in '
+                                         'temp.')
+    aws_harvest_parser.add_argument('--part-size', default='16MB', type=size,
+                                    help='Size of the parts uploaded when streaming to S3. Minimum is 5MB. Default '
+                                         'is 16MB.')
+    aws_harvest_parser.add_argument('--upload-workers', default='4', type=int,
+                                    help='Number of files to upload to S3 at once. Default is 4.')
+    aws_harvest_parser.add_argument('--metadata-debounce', default='10', type=float,
+                                    help='Seconds to wait for further changes to a metadata file before uploading it. '
+                                         'Default is 10.')
+    aws_harvest_parser.add_argument('--manifest-segments', action='store_true',
+                                    help='Upload each addition to the manifest as a segment instead of uploading the '
+                                         'whole manifest. The segments are replaced by the whole manifest when the '
+                                         'harvest is done.')
 
     aws_unlock_parser = aws_subparser.add_parser('unlock', help='Unlock a collection')
     aws_unlock_parser.add_argument('bucket', help='S3 bucket')
@@ -213,6 +452,7 @@ def main():
 
     local_parser = add_local_subparser(subparsers)
     aws_parser = add_aws_subparser(subparsers)
+    add_benchmark_subparser(subparsers)
 
     m_args = parser.parse_args()
     setup_logging(debug=m_args.debug)
@@ -223,9 +463,21 @@ def main():
         if os.path.exists('twarc_cloud.ini'):
             setup_aws_keys(load_ini_config('twarc_cloud.ini'))
         if m_args.subcommand == 'harvester':
-            harvester = TweetHarvester(m_args.collection_id, m_args.temp, bucket=m_args.bucket,
+            harvester = TweetHarvester(m_args.collection_ids, m_args.temp, bucket=m_args.bucket,
                                        tweets_per_file=m_args.tweets_per_file, monitor=m_args.monitor,
-                                       shutdown=m_args.shutdown)
+                                       shutdown=m_args.shutdown, queue_size=m_args.queue_size,
+                                       backpressure=m_args.backpressure, passthrough=m_args.passthrough,
+                                       codec=m_args.codec, compress_threads=m_args.compress_threads,
+                                       bytes_per_file=m_args.bytes_per_file, stream_to_s3=m_args.stream_to_s3,
+                                       part_size=m_args.part_size, upload_workers=m_args.upload_workers,
+                                       metadata_debounce_secs=m_args.metadata_debounce,
+                                       manifest_segments=m_args.manifest_segments,
+                                       timeline_workers=m_args.timeline_workers,
+                                       checkpoint_secs=m_args.checkpoint_secs,
+                                       stale_lock_secs=m_args.stale_lock_secs,
+                                       search_shards=m_args.search_shards,
+                                       tweets_per_block=m_args.tweets_per_block,
+                                       compact_bytes=m_args.compact_size)
             harvester.harvest()
         elif m_args.subcommand == 'unlock':
             force_unlock(m_args.temp, m_args.collection_id, bucket=m_args.bucket)
@@ -237,7 +489,17 @@ def main():
     elif m_args.command == 'local':
         if m_args.subcommand == 'harvester':
             harvester = TweetHarvester(m_args.collection_id, m_args.collections_path,
-                                       tweets_per_file=m_args.tweets_per_file, monitor=m_args.monitor, shutdown=True)
+                                       tweets_per_file=m_args.tweets_per_file, monitor=m_args.monitor, shutdown=True,
+                                       queue_size=m_args.queue_size, backpressure=m_args.backpressure,
+                                       passthrough=m_args.passthrough, codec=m_args.codec,
+                                       compress_threads=m_args.compress_threads,
+                                       bytes_per_file=m_args.bytes_per_file,
+                                       timeline_workers=m_args.timeline_workers,
+                                       checkpoint_secs=m_args.checkpoint_secs,
+                                       stale_lock_secs=m_args.stale_lock_secs,
+                                       search_shards=m_args.search_shards,
+                                       tweets_per_block=m_args.tweets_per_block,
+                                       compact_bytes=m_args.compact_size)
             harvester.harvest()
         elif m_args.subcommand == 'unlock':
             force_unlock(m_args.collections_path, m_args.collection_id)
@@ -245,6 +507,9 @@ def main():
         else:
             local_parser.print_help()
             exit(1)
+    elif m_args.command == 'benchmark':
+        benchmark_command(m_args.sample_filepath, m_args.codecs, m_args.sample_mb,
+                          compress_threads=m_args.compress_threads)
     else:
         parser.print_help()
         exit(1)